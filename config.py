@@ -12,6 +12,31 @@ TOKEN_FILE = 'token.json'
 DEFAULT_MAX_RESULTS = 100
 DEFAULT_QUERY = ''
 
+# Gmail batch request settings
+USE_BATCH_REQUESTS = True
+BATCH_SIZE = 50  # Gmail cho phép tối đa 100 request mỗi batch, khuyến nghị <= 50
+LIST_PAGE_SIZE = 500  # Số message ID tối đa mỗi trang messages().list
+METADATA_HEADERS = ['Subject', 'From', 'To', 'Date']  # Headers lấy khi fetch format=metadata
+FETCH_FORMAT = 'full'  # 'full' (Gmail tách sẵn các part) hoặc 'raw' (tải RFC 822, decode một lần)
+HTML_TEXT_MAX_CHARS = 50000  # Số ký tự text tối đa lấy từ email chỉ có HTML (None = không giới hạn)
+
+# Lấy email song song (0 = tắt, dùng batch request; > 0 = số worker thread)
+FETCH_CONCURRENCY = 0
+
+# Cache email đã parse (SQLite)
+CACHE_FILE = 'message_cache.db'
+CACHE_MAX_SIZE_MB = 200
+CACHE_STORE_RAW = False  # Lưu cả Gmail message object gốc (tốn thêm dung lượng)
+
+# Đồng bộ hộp thư tăng dần (history API)
+SYNC_QUERY = ''  # Query cho lần đồng bộ đầy đủ đầu tiên ('' = toàn bộ hộp thư)
+
+# Giới hạn tốc độ theo quota Gmail và retry khi bị rate limit (429/rateLimitExceeded)
+QUOTA_UNITS_PER_SECOND = 250  # Quota Gmail: 250 unit/user/giây
+MAX_RETRIES = 5
+RETRY_BASE_DELAY = 1.0  # Giây, tăng gấp đôi sau mỗi lần retry (có jitter)
+RETRY_MAX_DELAY = 64.0
+
 # Content analysis keywords
 COMPLETE_KEYWORDS = ['abc']
 ERROR_KEYWORDS = ['xyz']
@@ -20,6 +45,56 @@ ERROR_KEYWORDS = ['xyz']
 PACKAGE_SUCCESS_KEYWORDS = ['your package has arrived']
 PACKAGE_FAILED_KEYWORDS = ['your Bath &amp; Body Works could not be delivered']
 PACKAGE_SUCCESS_SENDER = 'bathandbodyworks@bathandbodyworks.narvar.com'
+# File quy tắc theo merchant (xem merchant_rules_template.json); nếu không có file, dùng 3 giá trị trên
+MERCHANT_RULES_FILE = 'merchant_rules.json'
+MERCHANT_RULES_RELOAD_INTERVAL = 2.0  # Số giây giữa hai lần kiểm tra file quy tắc thay đổi (tự nạp lại)
+KEYWORD_AUTOMATON_MIN_KEYWORDS = 50  # Từ số từ khóa này trở lên, dùng automaton Aho-Corasick (quét text một lần)
+
+# Pattern trích xuất order number / quantity, theo thứ tự ưu tiên (group 1 là giá trị cần lấy)
+ORDER_NUMBER_PATTERNS = [
+    r'order\s*number\s*([0-9]+)',
+    r'order\s*#?\s*:?\s*([0-9]+)',
+    r'order\s*number\s*:?\s*([0-9]+)',
+    r'order\s*id\s*:?\s*([0-9]+)',
+    r'#([0-9]+)',
+    r'order\s*([0-9]+)',
+    r'([0-9]{10,})',  # Tìm số có ít nhất 10 chữ số
+]
+QUANTITY_PATTERNS = {
+    'PACKAGE_SUCCESS': [  # Tìm kiếm "QTY" cho ORDER SUCCESS
+        r'qty\s*:?\s*([0-9]+)',
+        r'quantity\s*:?\s*([0-9]+)',
+        r'số\s*lượng\s*:?\s*([0-9]+)',
+    ],
+    'PACKAGE_FAILED': [  # Tìm kiếm "Quantity" cho ORDER FAILED
+        r'quantity\s*:?\s*([0-9]+)',
+        r'qty\s*:?\s*([0-9]+)',
+        r'số\s*lượng\s*:?\s*([0-9]+)',
+    ],
+}
+# Pattern riêng của từng merchant, được thử trước các pattern mặc định ở trên
+MERCHANT_ORDER_NUMBER_PATTERNS = []
+MERCHANT_QUANTITY_PATTERNS = []
+
+# Phân tích song song nhiều process (ContentAnalyzer.analyze_emails_parallel)
+ANALYZE_WORKERS = 0  # Số process, 0 = số CPU
+ANALYZE_CHUNK_SIZE = 250  # Số email gửi cho mỗi worker mỗi lần
+ANALYZE_PARALLEL_MIN_EMAILS = 2000  # Ít email hơn thì phân tích tuần tự (khởi động process tốn thời gian)
+ANALYSIS_CACHE_BATCH_SIZE = 100  # Số kết quả phân tích mới gom lại trước mỗi lần ghi vào cache
+
+# Tìm kiếm order number (order_numbers.txt)
+ORDER_SEARCH_MAX_EMAILS = 10  # Số email mới nhất xét cho mỗi order
+ORDER_SEARCH_BATCHED = True  # Gộp nhiều order vào một Gmail query {123 456 ...}
+ORDER_QUERY_MAX_LENGTH = 1500  # Độ dài tối đa (ký tự) của một query gộp
+ORDER_QUERY_PUSHDOWN = True  # Phân tích đơn hàng theo ngày: chỉ lấy email có tiêu đề khớp quy tắc merchant (lọc phía Gmail)
+ORDER_SEARCH_WORKERS = 4  # Số order tìm song song (mỗi worker một Gmail service riêng)
+ORDER_FETCH_CHUNK_SIZE = 1  # Số email tải mỗi lần khi tìm một order (1 = tải lần lượt, dừng ở email quyết định đầu tiên)
+ORDER_JOURNAL_FILE = 'order_search_journal.jsonl'  # Journal kết quả để chạy tiếp bằng --resume
+
+# Logging (xem log_config.py)
+LOG_LEVEL = 'WARNING'  # Mức log chung: chỉ hiện cảnh báo/lỗi, không tốn chi phí cho log debug
+LOG_JSON_FILE = ''  # Đường dẫn file log JSON (mỗi dòng một bản ghi), rỗng = tắt
+LOG_MODULE_LEVELS = {}  # Mức log riêng theo module, ví dụ {'content_analyzer': 'DEBUG'}
 
 # Output settings
 OUTPUT_FORMAT = 'table'  # 'table', 'json', 'csv'
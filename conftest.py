@@ -0,0 +1,133 @@
+"""
+Gmail service giả dùng chung cho các test (không gọi mạng)
+"""
+import base64
+import pytest
+
+SENDER = 'bathandbodyworks@bathandbodyworks.narvar.com'
+
+
+def make_message(message_id, subject='Hello', body='', timestamp=0, sender=SENDER):
+    """Tạo Gmail message object (format=full) với body text/plain"""
+    return {
+        'id': message_id,
+        'threadId': message_id,
+        'internalDate': str(timestamp),
+        'snippet': '',
+        'labelIds': ['INBOX'],
+        'payload': {
+            'mimeType': 'text/plain',
+            'headers': [
+                {'name': 'Subject', 'value': subject},
+                {'name': 'From', 'value': sender},
+                {'name': 'Date', 'value': 'Wed, 15 Jan 2025 12:00:00 +0000'},
+            ],
+            'body': {'data': base64.urlsafe_b64encode(body.encode('utf-8')).decode('ascii')},
+        },
+    }
+
+
+def make_email(message_id, subject='Hello', body='', timestamp=0, sender=SENDER):
+    """Tạo email đã parse (như kết quả của EmailFetcher)"""
+    return {
+        'id': message_id, 'subject': subject, 'from': sender, 'snippet': '',
+        'body': body, 'timestamp': str(timestamp),
+    }
+
+
+class FakeRequest:
+    def __init__(self, handler):
+        self.handler = handler
+    
+    def execute(self):
+        return self.handler()
+
+
+class FakeBatch:
+    """BatchHttpRequest giả: gọi callback cho từng request con theo thứ tự ngược (như Gmail không đảm bảo thứ tự)"""
+    
+    def __init__(self, service, callback):
+        self.service = service
+        self.callback = callback
+        self.requests = []
+    
+    def add(self, request, request_id):
+        self.requests.append((request_id, request))
+    
+    def execute(self):
+        self.service.batches.append([request_id for request_id, _ in self.requests])
+        if self.service.batch_error is not None:
+            raise self.service.batch_error
+        for request_id, request in reversed(self.requests):
+            try:
+                self.callback(request_id, request.execute(), None)
+            except Exception as e:
+                self.callback(request_id, None, e)
+
+
+class FakeGmailService:
+    """
+    Gmail service giả: messages().list phân trang theo maxResults, messages().get
+    trả về message đã tạo (format=metadata bỏ body), ghi lại mọi lần gọi
+    """
+    
+    def __init__(self, messages, queries=None):
+        self.messages_by_id = {message['id']: message for message in messages}
+        self.order = [message['id'] for message in messages]
+        self.queries = queries or {}
+        self.failing = {}          # message ID -> exception khi messages.get
+        self.batch_error = None    # exception khi thực thi cả batch
+        self.calls = []            # ('list', query, pageToken) / ('get', id, format)
+        self.batches = []
+    
+    def users(self):
+        return self
+    
+    def messages(self):
+        return self
+    
+    def list(self, userId, q='', maxResults=100, pageToken=None, includeSpamTrash=False):
+        self.calls.append(('list', q, pageToken))
+        ids = self.queries.get(q, self.order)
+        start = int(pageToken or 0)
+        response = {'messages': [{'id': message_id} for message_id in ids[start:start + maxResults]]}
+        if start + maxResults < len(ids):
+            response['nextPageToken'] = str(start + maxResults)
+        return FakeRequest(lambda: response)
+    
+    def get(self, userId, id, format='full', metadataHeaders=None):
+        def handler():
+            self.calls.append(('get', id, format))
+            if id in self.failing:
+                raise self.failing[id]
+            message = dict(self.messages_by_id[id])
+            if format == 'metadata':
+                message['payload'] = {'mimeType': 'text/plain', 'headers': message['payload']['headers']}
+            return message
+        return FakeRequest(handler)
+    
+    def new_batch_http_request(self, callback):
+        return FakeBatch(self, callback)
+    
+    def get_ids(self, message_format=None):
+        """Các message ID đã gọi messages.get (lọc theo format nếu có)"""
+        return [call[1] for call in self.calls
+                if call[0] == 'get' and (message_format is None or call[2] == message_format)]
+
+
+@pytest.fixture
+def gmail_service():
+    """Hàm tạo FakeGmailService từ danh sách message"""
+    return FakeGmailService
+
+
+@pytest.fixture
+def gmail_message():
+    """Hàm tạo Gmail message object (xem make_message)"""
+    return make_message
+
+
+@pytest.fixture
+def parsed_email():
+    """Hàm tạo email đã parse (xem make_email)"""
+    return make_email
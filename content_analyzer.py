@@ -1,48 +1,287 @@
 """
 Module phân tích nội dung email và đánh dấu trạng thái
 """
-import re
-from typing import List, Dict, Tuple
-from config import COMPLETE_KEYWORDS, ERROR_KEYWORDS, PACKAGE_SUCCESS_KEYWORDS, PACKAGE_FAILED_KEYWORDS, PACKAGE_SUCCESS_SENDER
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import List, Dict, Tuple, Iterable, Iterator, Callable, Optional
+from config import (
+    COMPLETE_KEYWORDS, ERROR_KEYWORDS, ANALYZE_WORKERS, ANALYZE_CHUNK_SIZE, ANALYZE_PARALLEL_MIN_EMAILS, ANALYSIS_CACHE_BATCH_SIZE
+)
+from email_record import EmailRecord
+from keyword_matcher import KeywordMatcher
+from message_cache import MessageCache
+from rule_engine import RuleEngine, MerchantRule, parse_sender_domains
+
+logger = logging.getLogger(__name__)
+
+# Các field text cần để phân tích (chỉ những field này được gửi sang worker process)
+TEXT_FIELDS = ('subject', 'from', 'snippet', 'body')
+
+# Các field kết quả phân tích được gán vào email
+ANALYSIS_FIELDS = ('status', 'confidence', 'matched_keywords', 'order_number', 'quantity')
+
+# Phiên bản logic phân tích, nằm trong ruleset_hash (tăng khi cách phân tích thay đổi để bỏ kết quả đã lưu)
+ANALYSIS_VERSION = 1
+
+
+class AnalysisContext:
+    """
+    Nội dung email đã chuẩn hóa, được tạo một lần cho mỗi email và dùng chung
+    cho mọi bước phân tích (trạng thái, từ khóa, order number, quantity)
+    """
+    
+    __slots__ = ('subject', 'sender', 'content', 'content_lower', 'keyword_hits', 'rule_match', 'sender_domains')
+    
+    def __init__(self, subject: str, sender: str, content: str):
+        self.subject = subject.lower()
+        self.sender = sender.lower()
+        self.content = content
+        self.content_lower = content.lower()
+        self.keyword_hits = None  # Kết quả quét từ khóa COMPLETE/ERROR, tính khi cần
+        self.rule_match = None    # (status, rule) theo quy tắc merchant, tính khi cần
+        self.sender_domains = None  # Domain người gửi (From và người gửi gốc của email forward), tính khi cần
 
 
 class ContentAnalyzer:
-    def __init__(self, complete_keywords: List[str] = None, error_keywords: List[str] = None):
+    def __init__(self, complete_keywords: List[str] = None, error_keywords: List[str] = None,
+                 result_cache: Optional[MessageCache] = None, rule_engine: Optional[RuleEngine] = None):
         """
         Khởi tạo analyzer với các từ khóa tùy chỉnh
         
         Args:
             complete_keywords: Danh sách từ khóa để đánh dấu COMPLETE
             error_keywords: Danh sách từ khóa để đánh dấu ERROR
+            result_cache: Nếu có, kết quả phân tích được lưu theo (message ID, ruleset_hash)
+                và email đã phân tích với cùng bộ quy tắc không bị phân tích lại
+            rule_engine: Quy tắc merchant (mặc định đọc MERCHANT_RULES_FILE, hoặc quy tắc từ config.py)
         """
         self.complete_keywords = complete_keywords or COMPLETE_KEYWORDS
         self.error_keywords = error_keywords or ERROR_KEYWORDS
+        self.result_cache = result_cache
+        self._ruleset_hash = None
+        self._ruleset_key = None
+        self._pruned_ruleset = None
+        
+        # Quy tắc merchant (từ khóa tiêu đề, sender, pattern order/quantity) được biên dịch một lần
+        self.rule_engine = rule_engine or RuleEngine()
+        self._content_matcher = None
+        self._content_matcher_key = None
     
-    def analyze_emails(self, emails: List[Dict]) -> List[Dict]:
+    def analyze_emails(self, emails: List[Dict], keep_body: bool = True) -> List[EmailRecord]:
         """
         Phân tích danh sách email và thêm trạng thái
         
         Args:
             emails: Danh sách email cần phân tích
+            keep_body: Giữ lại body sau khi phân tích (False để tiết kiệm bộ nhớ)
             
         Returns:
             Danh sách email đã được phân tích với trạng thái
         """
-        analyzed_emails = []
+        return list(self.iter_analyze_emails(emails, keep_body))
+    
+    def analyze_emails_parallel(self, emails: List[Dict], keep_body: bool = True,
+                                workers: int = ANALYZE_WORKERS,
+                                chunk_size: int = ANALYZE_CHUNK_SIZE) -> List[EmailRecord]:
+        """
+        Phân tích danh sách email lớn trên nhiều process (nhiều CPU core)
+        
+        Email được chia thành từng nhóm chunk_size; mỗi worker chỉ nhận các field
+        text cần thiết (subject, from, snippet, body) và trả về kết quả phân tích,
+        sau đó kết quả được gán lại theo đúng thứ tự ban đầu. Danh sách nhỏ hơn
+        ANALYZE_PARALLEL_MIN_EMAILS được phân tích tuần tự vì chi phí khởi động
+        process lớn hơn phần tiết kiệm được.
+        
+        Args:
+            emails: Danh sách email cần phân tích
+            keep_body: Giữ lại body sau khi phân tích
+            workers: Số process (0 = số CPU)
+            chunk_size: Số email gửi cho worker mỗi lần
+            
+        Returns:
+            Danh sách email đã phân tích, cùng thứ tự với emails
+        """
+        results = self._fields_with_cache(
+            emails, lambda pending: self._analyze_fields_parallel(pending, workers, chunk_size)
+        )
+        return [self._apply_fields(email, fields, keep_body) for email, fields in zip(emails, results)]
+    
+    def _analyze_fields_parallel(self, emails: List[Dict], workers: int, chunk_size: int) -> List[Tuple]:
+        """Tính kết quả phân tích (theo ANALYSIS_FIELDS) của emails trên nhiều process"""
+        workers = workers or os.cpu_count() or 1
+        if workers <= 1 or len(emails) < max(ANALYZE_PARALLEL_MIN_EMAILS, 2):
+            return [self._analyze_fields(email) for email in emails]
+        
+        chunk_size = max(1, chunk_size)
+        chunks = [
+            [tuple(email.get(field, '') for field in TEXT_FIELDS) for email in emails[start:start + chunk_size]]
+            for start in range(0, len(emails), chunk_size)
+        ]
+        
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), initializer=_init_worker,
+                                 initargs=(self.complete_keywords, self.error_keywords, self.rule_engine.rules)) as executor:
+            return [result for chunk_results in executor.map(_analyze_chunk, chunks) for result in chunk_results]
+    
+    def iter_analyze_emails(self, emails: Iterable[Dict], keep_body: bool = True,
+                            lookup_batch_size: int = ANALYSIS_CACHE_BATCH_SIZE) -> Iterator[EmailRecord]:
+        """
+        Phân tích lần lượt từng email (có thể nhận generator như EmailFetcher.iter_emails)
+        
+        Args:
+            emails: Iterable các email cần phân tích
+            keep_body: Giữ lại body sau khi phân tích
+            lookup_batch_size: Số email đọc trước để tra result_cache bằng một query;
+                dùng 1 khi người gọi có thể dừng sớm và không muốn tải thừa email
+            
+        Yields:
+            Từng email đã được phân tích với trạng thái
+        """
+        if self.result_cache is None:
+            for email in emails:
+                yield self.analyze_email(email, keep_body)
+            return
+        
+        # Có result_cache: tra kết quả theo nhóm lookup_batch_size email (một query IN (...)
+        # mỗi nhóm), kết quả mới được gom lại và ghi theo nhóm (một transaction mỗi nhóm)
+        ruleset = self._active_ruleset()
+        emails = iter(emails)
+        to_store = []
+        try:
+            while True:
+                batch = list(islice(emails, max(1, lookup_batch_size)))
+                if not batch:
+                    break
+                keys = [(email.get('id'), bool(email.get('body'))) for email in batch]
+                cached = self.result_cache.get_analyses(ruleset, [key for key in keys if key[0]])
+                
+                for email, key in zip(batch, keys):
+                    if key in cached:
+                        fields = tuple(cached[key])
+                    else:
+                        fields = self._analyze_fields(email)
+                        if key[0]:
+                            to_store.append(key + (fields,))
+                        if len(to_store) >= ANALYSIS_CACHE_BATCH_SIZE:
+                            self.result_cache.put_analyses(ruleset, to_store)
+                            to_store = []
+                    yield self._apply_fields(email, fields, keep_body)
+        finally:
+            self.result_cache.put_analyses(ruleset, to_store)
+    
+    def analyze_email(self, email: Dict, keep_body: bool = True) -> EmailRecord:
+        """
+        Phân tích một email và trả về bản sao có thêm trạng thái
         
-        for email in emails:
-            analyzed_email = email.copy()
-            status, confidence = self._analyze_single_email(email)
+        Args:
+            email: Email cần phân tích (dict hoặc EmailRecord)
+            keep_body: Giữ lại body sau khi phân tích; nếu False, body bị bỏ
+                sau khi đã trích xuất trạng thái, order number và quantity
             
-            analyzed_email['status'] = status
-            analyzed_email['confidence'] = confidence
-            analyzed_email['matched_keywords'] = self._get_matched_keywords(email)
-            analyzed_email['order_number'] = self.extract_order_number(email)
-            analyzed_email['quantity'] = self.extract_quantity(email, status)
+        Returns:
+            EmailRecord đã được phân tích với trạng thái
+        """
+        return self._apply_fields(email, self._analyze_fields(email), keep_body)
+    
+    def _apply_fields(self, email: Dict, fields: Tuple, keep_body: bool) -> EmailRecord:
+        """Tạo bản sao của email có gán kết quả phân tích (theo thứ tự ANALYSIS_FIELDS)"""
+        analyzed_email = self._copy_record(email)
+        analyzed_email.update(dict(zip(ANALYSIS_FIELDS, fields)))
+        
+        if not keep_body:
+            analyzed_email.drop_body()
+        
+        return analyzed_email
+    
+    def _fields_with_cache(self, emails: List[Dict], analyze: Callable[[List[Dict]], List[Tuple]]) -> List[Tuple]:
+        """
+        Lấy kết quả phân tích của một nhóm email, chỉ phân tích các email chưa có trong result_cache
+        
+        Kết quả được tra theo (message ID, có body hay không) vì email chỉ lấy
+        headers được phân tích trên ít nội dung hơn email đầy đủ.
+        
+        Args:
+            emails: Nhóm email
+            analyze: Hàm phân tích danh sách email chưa có kết quả (trả về cùng thứ tự)
             
-            analyzed_emails.append(analyzed_email)
+        Returns:
+            Danh sách tuple theo ANALYSIS_FIELDS, cùng thứ tự với emails
+        """
+        if self.result_cache is None:
+            return analyze(emails)
+        
+        ruleset = self._active_ruleset()
+        keys = [(email.get('id'), bool(email.get('body'))) for email in emails]
+        cached = self.result_cache.get_analyses(ruleset, [key for key in keys if key[0]])
+        pending = [index for index, key in enumerate(keys) if key not in cached]
+        logger.debug("Analysis cache: %d hit, %d miss", len(emails) - len(pending), len(pending))
+        
+        results = [tuple(cached[key]) if key in cached else None for key in keys]
+        if pending:
+            for index, fields in zip(pending, analyze([emails[index] for index in pending])):
+                results[index] = fields
+            self.result_cache.put_analyses(
+                ruleset, [keys[index] + (results[index],) for index in pending if keys[index][0]]
+            )
+        
+        return results
+    
+    def _active_ruleset(self) -> str:
+        """Hash bộ quy tắc hiện tại; xóa kết quả đã lưu của bộ quy tắc cũ khi hash đổi"""
+        ruleset = self.ruleset_hash()
+        if ruleset != self._pruned_ruleset:
+            self.result_cache.prune_analyses(ruleset)
+            self._pruned_ruleset = ruleset
+        return ruleset
+    
+    def ruleset_hash(self) -> str:
+        """
+        Hash của bộ quy tắc phân tích đang dùng (từ khóa, quy tắc merchant, pattern)
+        
+        Kết quả lưu trong result_cache gắn với hash này nên tự hết hiệu lực khi
+        quy tắc trong config.py, file quy tắc merchant hoặc từ khóa (update_keywords) thay đổi.
+        """
+        key = (tuple(self.complete_keywords), tuple(self.error_keywords), self.rule_engine.fingerprint)
+        if key != self._ruleset_key:
+            rules = {
+                'version': ANALYSIS_VERSION,
+                'complete': list(self.complete_keywords),
+                'error': list(self.error_keywords),
+                'merchant_rules': self.rule_engine.fingerprint,
+            }
+            encoded = json.dumps(rules, sort_keys=True, ensure_ascii=False).encode('utf-8')
+            self._ruleset_hash = hashlib.sha1(encoded).hexdigest()
+            self._ruleset_key = key
+        return self._ruleset_hash
+    
+    def _analyze_fields(self, email: Dict) -> Tuple:
+        """
+        Tính các field kết quả phân tích của một email
         
-        return analyzed_emails
+        Returns:
+            Tuple giá trị theo thứ tự ANALYSIS_FIELDS
+        """
+        # Nội dung chỉ được ghép và chuẩn hóa một lần cho mọi bước phân tích
+        context = self.build_context(email)
+        status, confidence = self._status_from_context(context)
+        
+        return (
+            status,
+            confidence,
+            self._matched_keywords_from_context(context),
+            self._order_number_from_context(context),
+            self._quantity_from_context(context, status),
+        )
+    
+    @staticmethod
+    def _copy_record(email: Dict) -> EmailRecord:
+        """Tạo bản sao EmailRecord của email để gán kết quả phân tích"""
+        if isinstance(email, EmailRecord):
+            return email.copy()
+        return EmailRecord.from_dict(email)
     
     def _analyze_single_email(self, email: Dict) -> Tuple[str, float]:
         """
@@ -54,42 +293,35 @@ class ContentAnalyzer:
         Returns:
             Tuple (status, confidence) - trạng thái và độ tin cậy
         """
-        # Lấy nội dung để phân tích
-        content = self._get_analyze_content(email)
-        content_lower = content.lower()
-        
-        # Kiểm tra tiêu đề thư và sender
-        subject = email.get('subject', '').lower()
-        sender = email.get('from', '').lower()
-        content = self._get_analyze_content(email).lower()
-        
-        # Debug: In ra tiêu đề và sender để kiểm tra
-        print(f"   Debug - Subject: {subject}")
-        print(f"   Debug - Sender: {sender}")
-        
-        # Kiểm tra PACKAGE_FAILED - chỉ cần subject chứa từ khóa
-        for keyword in PACKAGE_FAILED_KEYWORDS:
-            keyword_lower = keyword.lower()
-            if keyword_lower in subject:
-                print(f"   Debug - Matched FAILED keyword: '{keyword}' in '{subject}'")
-                return "PACKAGE_FAILED", 1.0
-        
-        # Kiểm tra PACKAGE_SUCCESS - cần subject chứa từ khóa VÀ sender đúng
-        for keyword in PACKAGE_SUCCESS_KEYWORDS:
-            keyword_lower = keyword.lower()
-            if keyword_lower in subject:
-                # Kiểm tra sender đúng
-                if PACKAGE_SUCCESS_SENDER.lower() in sender:
-                    print(f"   Debug - Matched SUCCESS keyword: '{keyword}' in '{subject}' from '{sender}'")
-                    return "PACKAGE_SUCCESS", 1.0
-                # Nếu không có sender nhưng có trong content (email forwarded)
-                elif PACKAGE_SUCCESS_SENDER.lower() in content:
-                    print(f"   Debug - Matched SUCCESS keyword: '{keyword}' in '{subject}' (forwarded from '{PACKAGE_SUCCESS_SENDER}')")
-                    return "PACKAGE_SUCCESS", 1.0
-        
-        # Đếm số từ khóa COMPLETE và ERROR
-        complete_count = self._count_keywords(content_lower, self.complete_keywords)
-        error_count = self._count_keywords(content_lower, self.error_keywords)
+        return self._status_from_context(self.build_context(email))
+    
+    def build_context(self, email: Dict) -> AnalysisContext:
+        """
+        Tạo ngữ cảnh phân tích (nội dung đã ghép và chuyển chữ thường) cho một email
+        
+        Args:
+            email: Email object
+            
+        Returns:
+            AnalysisContext dùng cho các bước phân tích
+        """
+        return AnalysisContext(email.get('subject', ''), email.get('from', ''), self._get_analyze_content(email))
+    
+    def _status_from_context(self, context: AnalysisContext) -> Tuple[str, float]:
+        """Xác định (status, confidence) từ ngữ cảnh đã chuẩn hóa"""
+        logger.debug("Subject: %s", context.subject)
+        logger.debug("Sender: %s", context.sender)
+        
+        # PACKAGE_FAILED (chỉ cần subject chứa từ khóa) / PACKAGE_SUCCESS (subject VÀ sender đúng,
+        # kể cả email forward) theo quy tắc merchant; mọi merchant được xét trong một lần quét subject
+        status, _ = self._rule_match(context)
+        if status:
+            return status, 1.0
+        
+        # Đếm số từ khóa COMPLETE và ERROR (một lần quét cho cả hai nhóm)
+        keyword_hits = self._keyword_hits(context)
+        complete_count = sum(count for _, count in keyword_hits['complete'])
+        error_count = sum(count for _, count in keyword_hits['error'])
         
         # Xác định trạng thái dựa trên số lượng từ khóa
         if complete_count > 0 and error_count == 0:
@@ -105,6 +337,24 @@ class ContentAnalyzer:
         else:
             return "UNKNOWN", 0.0
     
+    def needs_body(self, email: Dict) -> bool:
+        """
+        Kiểm tra email (chỉ có headers) có cần tải body để phân tích đơn hàng không
+        
+        Chỉ email có tiêu đề khớp từ khóa PACKAGE_SUCCESS/PACKAGE_FAILED mới cần body
+        (để kiểm tra sender forward, trích xuất order number và quantity).
+        Dùng làm body_filter cho EmailFetcher.iter_emails; khi đó trạng thái
+        COMPLETE/ERROR và từ khóa của email còn lại chỉ dựa trên headers, không
+        nên hiển thị cho người dùng.
+        
+        Args:
+            email: Email object (có thể chưa có body)
+            
+        Returns:
+            True nếu cần tải body đầy đủ
+        """
+        return self.rule_engine.subject_matches(email.get('subject', '').lower())
+    
     def _get_analyze_content(self, email: Dict) -> str:
         """
         Lấy nội dung để phân tích từ email
@@ -129,37 +379,46 @@ class ContentAnalyzer:
         
         content = ' '.join(content_parts)
         
-        # Debug: In ra nội dung để kiểm tra
-        print(f"   Debug - Content length: {len(content)}")
-        if len(content) > 200:
-            print(f"   Debug - Content preview: {content[:200]}...")
-        else:
-            print(f"   Debug - Full content: {content}")
+        # Preview chỉ được cắt/định dạng khi log debug đang bật (%.200s)
+        logger.debug("Content length: %d, preview: %.200s", len(content), content)
         
         return content
     
-    def _count_keywords(self, content: str, keywords: List[str]) -> int:
+    def _rule_match(self, context: AnalysisContext) -> Tuple[Optional[str], Optional[MerchantRule]]:
+        """Trạng thái và quy tắc merchant khớp với email (kết quả được giữ trong context)"""
+        if context.rule_match is None:
+            # Domain người gửi được parse một lần, rồi chỉ quy tắc của các domain đó được xét
+            if context.sender_domains is None:
+                context.sender_domains = parse_sender_domains(context.sender, context.content_lower)
+            context.rule_match = self.rule_engine.classify(
+                context.subject, context.sender, context.content_lower, context.sender_domains
+            )
+        return context.rule_match
+    
+    def _keyword_hits(self, context: AnalysisContext) -> Dict[str, List[Tuple[str, int]]]:
         """
-        Đếm số lượng từ khóa xuất hiện trong nội dung
+        Quét nội dung một lần để tìm mọi từ khóa COMPLETE/ERROR (kết quả được giữ trong context)
         
         Args:
-            content: Nội dung text
-            keywords: Danh sách từ khóa
+            context: Ngữ cảnh phân tích của email
             
         Returns:
-            Số lượng từ khóa tìm thấy
+            Dict 'complete'/'error' -> danh sách (từ khóa, số lần xuất hiện)
         """
-        count = 0
-        
-        for keyword in keywords:
-            # Tìm kiếm không phân biệt hoa thường
-            keyword_lower = keyword.lower()
-            
-            # Đếm số lần xuất hiện
-            matches = len(re.findall(re.escape(keyword_lower), content))
-            count += matches
-        
-        return count
+        if context.keyword_hits is None:
+            context.keyword_hits = self._get_content_matcher().scan(context.content_lower)
+        return context.keyword_hits
+    
+    def _get_content_matcher(self) -> KeywordMatcher:
+        """Trả về matcher cho từ khóa COMPLETE/ERROR, biên dịch lại khi danh sách từ khóa thay đổi"""
+        key = (tuple(self.complete_keywords), tuple(self.error_keywords))
+        if key != self._content_matcher_key:
+            self._content_matcher = KeywordMatcher({
+                'complete': self.complete_keywords,
+                'error': self.error_keywords,
+            })
+            self._content_matcher_key = key
+        return self._content_matcher
     
     def _get_matched_keywords(self, email: Dict) -> Dict[str, List[str]]:
         """
@@ -171,25 +430,15 @@ class ContentAnalyzer:
         Returns:
             Dict chứa các từ khóa đã match
         """
-        content = self._get_analyze_content(email)
-        content_lower = content.lower()
-        
-        matched_complete = []
-        matched_error = []
-        
-        # Tìm từ khóa COMPLETE
-        for keyword in self.complete_keywords:
-            if keyword.lower() in content_lower:
-                matched_complete.append(keyword)
-        
-        # Tìm từ khóa ERROR
-        for keyword in self.error_keywords:
-            if keyword.lower() in content_lower:
-                matched_error.append(keyword)
+        return self._matched_keywords_from_context(self.build_context(email))
+    
+    def _matched_keywords_from_context(self, context: AnalysisContext) -> Dict[str, List[str]]:
+        """Lấy danh sách từ khóa đã match từ ngữ cảnh đã chuẩn hóa"""
+        keyword_hits = self._keyword_hits(context)
         
         return {
-            'complete': matched_complete,
-            'error': matched_error
+            'complete': [keyword for keyword, _ in keyword_hits['complete']],
+            'error': [keyword for keyword, _ in keyword_hits['error']]
         }
     
     def get_status_summary(self, analyzed_emails: List[Dict]) -> Dict[str, int]:
@@ -255,25 +504,13 @@ class ContentAnalyzer:
         Returns:
             Order number nếu tìm thấy, empty string nếu không
         """
-        content = self._get_analyze_content(email)
-        
-        # Các pattern để tìm order number
-        patterns = [
-            r'order\s*number\s*([0-9]+)',
-            r'order\s*#?\s*:?\s*([0-9]+)',
-            r'order\s*number\s*:?\s*([0-9]+)',
-            r'order\s*id\s*:?\s*([0-9]+)',
-            r'#([0-9]+)',
-            r'order\s*([0-9]+)',
-            r'([0-9]{10,})',  # Tìm số có ít nhất 10 chữ số
-        ]
-        
-        for pattern in patterns:
-            matches = re.findall(pattern, content, re.IGNORECASE)
-            if matches:
-                return matches[0]
-        
-        return ""
+        return self._order_number_from_context(self.build_context(email))
+    
+    def _order_number_from_context(self, context: AnalysisContext) -> str:
+        """Trích xuất order number từ ngữ cảnh đã chuẩn hóa"""
+        # Pattern riêng của merchant khớp với email được thử trước pattern mặc định
+        _, rule = self._rule_match(context)
+        return self.rule_engine.order_extractor(rule).extract(context.content)
     
     def extract_quantity(self, email: Dict, status: str) -> str:
         """
@@ -286,28 +523,28 @@ class ContentAnalyzer:
         Returns:
             Số lượng sản phẩm string
         """
-        content = self._get_analyze_content(email)
-        
-        if status == "PACKAGE_SUCCESS":
-            # Tìm kiếm "QTY" cho ORDER SUCCESS
-            patterns = [
-                r'qty\s*:?\s*([0-9]+)',
-                r'quantity\s*:?\s*([0-9]+)',
-                r'số\s*lượng\s*:?\s*([0-9]+)',
-            ]
-        elif status == "PACKAGE_FAILED":
-            # Tìm kiếm "Quantity" cho ORDER FAILED
-            patterns = [
-                r'quantity\s*:?\s*([0-9]+)',
-                r'qty\s*:?\s*([0-9]+)',
-                r'số\s*lượng\s*:?\s*([0-9]+)',
-            ]
-        else:
+        return self._quantity_from_context(self.build_context(email), status)
+    
+    def _quantity_from_context(self, context: AnalysisContext, status: str) -> str:
+        """Trích xuất số lượng sản phẩm từ ngữ cảnh đã chuẩn hóa"""
+        # Chỉ email PACKAGE_SUCCESS/PACKAGE_FAILED có quantity
+        _, rule = self._rule_match(context)
+        extractor = self.rule_engine.quantity_extractor(status, rule)
+        if extractor is None:
             return ""
-        
-        for pattern in patterns:
-            matches = re.findall(pattern, content, re.IGNORECASE)
-            if matches:
-                return matches[0]
-        
-        return ""
+        return extractor.extract(context.content)
+
+
+# Analyzer của worker process (được tạo một lần cho mỗi process)
+_worker_analyzer = None
+
+
+def _init_worker(complete_keywords: List[str], error_keywords: List[str], rules: List[MerchantRule]):
+    """Khởi tạo ContentAnalyzer trong worker process với cùng bộ từ khóa và quy tắc merchant"""
+    global _worker_analyzer
+    _worker_analyzer = ContentAnalyzer(complete_keywords, error_keywords, rule_engine=RuleEngine(rules=rules))
+
+
+def _analyze_chunk(texts: List[Tuple[str, ...]]) -> List[Tuple]:
+    """Phân tích một nhóm email (dạng tuple theo TEXT_FIELDS) trong worker process"""
+    return [_worker_analyzer._analyze_fields(dict(zip(TEXT_FIELDS, fields))) for fields in texts]
@@ -3,14 +3,56 @@ Module lấy email từ Gmail
 """
 import base64
 import email
+import heapq
+import logging
+from email import policy
+from email.message import EmailMessage
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import List, Dict, Optional
-from config import DEFAULT_MAX_RESULTS
+from typing import List, Dict, Optional, Iterator, Callable, Tuple
+from config import (
+    DEFAULT_MAX_RESULTS, USE_BATCH_REQUESTS, BATCH_SIZE, LIST_PAGE_SIZE,
+    METADATA_HEADERS, FETCH_CONCURRENCY, FETCH_FORMAT
+)
+from email_record import EmailRecord
+from html_text import html_to_text
+from log_config import log_duration
+from message_cache import MessageCache
+from rate_limiter import RateLimiter, QUOTA_UNITS, get_rate_limiter
+
+logger = logging.getLogger(__name__)
+
+
+class FetchError(Exception):
+    """Không lấy được chi tiết một số email có trong kết quả messages().list"""
+    
+    def __init__(self, message_ids: List[str]):
+        super().__init__(f"Không lấy được {len(message_ids)} email: {', '.join(message_ids[:5])}")
+        self.message_ids = list(message_ids)
 
 
 class EmailFetcher:
-    def __init__(self, service):
+    def __init__(self, service, use_batch: bool = USE_BATCH_REQUESTS, batch_size: int = BATCH_SIZE,
+                 cache: Optional[MessageCache] = None, rate_limiter: Optional[RateLimiter] = None,
+                 fetch_format: str = FETCH_FORMAT):
+        """
+        Khởi tạo fetcher
+        
+        Args:
+            service: Gmail service object
+            use_batch: Gom nhiều request messages().get vào một Gmail batch request
+            batch_size: Số request tối đa trong một batch (Gmail giới hạn 100)
+            cache: Cache SQLite lưu email đã parse (None = không dùng cache)
+            rate_limiter: Rate limiter theo quota (mặc định dùng limiter chung của tiến trình)
+            fetch_format: 'full' (payload đã tách part) hoặc 'raw' (RFC 822, parse cục bộ)
+        """
         self.service = service
+        self.fetch_format = fetch_format
+        self.cache = cache
+        self.rate_limiter = rate_limiter or get_rate_limiter()
+        self.use_batch = use_batch
+        self.batch_size = max(1, min(batch_size, 100))
     
     def get_emails(self, query: str = '', max_results: int = DEFAULT_MAX_RESULTS) -> List[Dict]:
         """
@@ -18,60 +60,358 @@ class EmailFetcher:
         
         Args:
             query: Query string để lọc email (ví dụ: 'from:example@gmail.com subject:test')
-            max_results: Số lượng email tối đa cần lấy
-            
+            max_results: Số lượng email tối đa cần lấy (có thể vượt quá một trang kết quả)
+        
         Returns:
             List các email với thông tin cơ bản
         """
         try:
-            # Lấy danh sách message IDs
-            results = self.service.users().messages().list(
-                userId='me', 
-                q=query, 
-                maxResults=max_results
-            ).execute()
+            logger.info("📧 Đang lấy tối đa %d email...", max_results)
+            emails = list(self.iter_emails(query, limit=max_results))
+            logger.info("✅ Hoàn thành lấy %d email", len(emails))
+            return emails
+        
+        except Exception as e:
+            logger.error("❌ Lỗi khi lấy danh sách email: %s", e)
+            return []
+    
+    def iter_emails(self, query: str = '', limit: Optional[int] = None,
+                    body_filter: Optional[Callable[[Dict], bool]] = None,
+                    chunk_size: Optional[int] = None, strict: bool = False) -> Iterator[Dict]:
+        """
+        Duyệt email theo từng trang kết quả của messages().list (theo nextPageToken)
+        
+        Email được lấy chi tiết và trả về ngay khi mỗi trang về tới, nên bộ nhớ
+        không tăng theo kích thước hộp thư.
+        
+        Args:
+            query: Query string để lọc email
+            limit: Số lượng email tối đa (None = không giới hạn)
+            body_filter: Nếu có, email được lấy 2 bước: trước tiên chỉ lấy headers
+                (format=metadata), sau đó chỉ tải body đầy đủ cho email mà
+                body_filter(email) trả về True. Email còn lại có body rỗng.
+            chunk_size: Số email lấy chi tiết mỗi lần (None = cả trang). Với 1,
+                email tiếp theo chỉ được tải khi bên gọi cần tới, nên dừng
+                duyệt sớm thì không tốn request cho các email còn lại.
+            strict: Raise FetchError khi có email không lấy được (mặc định email
+                lỗi chỉ được ghi log và bỏ qua)
+        
+        Yields:
+            Từng email đã được parse
+        
+        Raises:
+            FetchError: strict=True và có email (hoặc body cần tải) không lấy được
+        """
+        page_token = None
+        remaining = limit
+        
+        while remaining is None or remaining > 0:
+            page_size = LIST_PAGE_SIZE if remaining is None else min(LIST_PAGE_SIZE, remaining)
+            params = {'userId': 'me', 'q': query, 'maxResults': page_size}
+            if page_token:
+                params['pageToken'] = page_token
             
-            messages = results.get('messages', [])
-            emails = []
+            results = self.rate_limiter.execute(self.service.users().messages().list(**params), 'messages.list')
+            message_ids = [message['id'] for message in results.get('messages', [])]
+            if remaining is not None:
+                message_ids = message_ids[:remaining]
+                remaining -= len(message_ids)
             
-            print(f"📧 Đang lấy {len(messages)} email...")
+            step = chunk_size or len(message_ids) or 1
+            for start in range(0, len(message_ids), step):
+                chunk = message_ids[start:start + step]
+                if body_filter is None:
+                    emails = self._fetch_messages(chunk)
+                else:
+                    emails = self._fetch_messages_two_tier(chunk, body_filter, strict)
+                
+                if strict and len(emails) < len(chunk):
+                    fetched_ids = {email_data['id'] for email_data in emails}
+                    raise FetchError([message_id for message_id in chunk if message_id not in fetched_ids])
+                
+                for email_data in emails:
+                    yield email_data
             
-            for i, message in enumerate(messages):
-                try:
-                    # Lấy chi tiết từng email
-                    msg = self.service.users().messages().get(
-                        userId='me', 
-                        id=message['id']
-                    ).execute()
-                    
-                    email_data = self._parse_email(msg)
-                    emails.append(email_data)
-                    
-                    # Hiển thị tiến trình
-                    if (i + 1) % 10 == 0:
-                        print(f"   Đã xử lý {i + 1}/{len(messages)} email...")
-                        
-                except Exception as e:
-                    print(f"⚠️ Lỗi khi lấy email {message['id']}: {str(e)}")
+            page_token = results.get('nextPageToken')
+            if not page_token or not message_ids:
+                break
+    
+    def iter_emails_any(self, queries: List[str], limit: Optional[int] = None,
+                        body_filter: Optional[Callable[[Dict], bool]] = None) -> Iterator[Dict]:
+        """
+        Duyệt email khớp ít nhất một trong các query (mỗi email chỉ trả về một lần)
+        
+        Kết quả của các query (mỗi query mới nhất trước) được trộn theo timestamp,
+        nên limit giữ đúng các email mới nhất của cả hợp, như một query duy nhất.
+        
+        Args:
+            queries: Danh sách query
+            limit: Tổng số email tối đa (None = không giới hạn)
+            body_filter: Như iter_emails
+        
+        Yields:
+            Từng email đã được parse, mới nhất trước
+        """
+        streams = [self.iter_emails(query=query, limit=limit, body_filter=body_filter) for query in queries]
+        seen = set()
+        try:
+            for email_data in heapq.merge(*streams, key=lambda item: -int(item.get('timestamp') or 0)):
+                if email_data['id'] in seen:
                     continue
-            
-            print(f"✅ Hoàn thành lấy {len(emails)} email")
+                seen.add(email_data['id'])
+                yield email_data
+                if limit is not None and len(seen) >= limit:
+                    return
+        finally:
+            for emails in streams:
+                emails.close()
+    
+    def get_emails_by_ids(self, message_ids: List[str]) -> List[Dict]:
+        """
+        Lấy chi tiết email theo danh sách message ID (dùng cache nếu có)
+        
+        Args:
+            message_ids: Danh sách Gmail message ID
+        
+        Returns:
+            List các email đã parse, giữ nguyên thứ tự của message_ids
+        """
+        return self._fetch_messages(message_ids)
+    
+    def _fetch_messages_two_tier(self, message_ids: List[str], body_filter: Callable[[Dict], bool],
+                                 strict: bool = False) -> List[Dict]:
+        """
+        Lấy headers của cả nhóm, chỉ tải body đầy đủ cho email cần thiết
+        
+        Args:
+            message_ids: Danh sách message ID
+            body_filter: Hàm quyết định email nào cần tải body
+            strict: Raise FetchError nếu không tải được body cần thiết (mặc định
+                giữ bản chỉ có headers)
+        
+        Returns:
+            List các email đã parse, giữ nguyên thứ tự của message_ids
+        """
+        emails = self._fetch_messages(message_ids, metadata_only=True)
+        
+        full_ids = [email_data['id'] for email_data in emails if body_filter(email_data)]
+        if not full_ids:
             return emails
+        
+        full_emails = {email_data['id']: email_data for email_data in self._fetch_messages(full_ids)}
+        if strict and len(full_emails) < len(full_ids):
+            raise FetchError([message_id for message_id in full_ids if message_id not in full_emails])
+        return [full_emails.get(email_data['id'], email_data) for email_data in emails]
+    
+    def _fetch_messages(self, message_ids: List[str], metadata_only: bool = False) -> List[Dict]:
+        """
+        Lấy chi tiết một nhóm email, ưu tiên lấy từ cache
+        
+        Args:
+            message_ids: Danh sách message ID
+            metadata_only: Chỉ lấy headers (format=metadata), không tải body
+        
+        Returns:
+            List các email đã parse, giữ nguyên thứ tự của message_ids
+        """
+        cached = {}
+        if self.cache:
+            cached = {message_id: EmailRecord.from_dict(record)
+                      for message_id, record in self.cache.get_many(message_ids).items()}
+        missing_ids = [message_id for message_id in message_ids if message_id not in cached]
+        fetched = self._fetch_from_api(missing_ids, metadata_only) if missing_ids else []
+        
+        if not cached:
+            return fetched
+        
+        emails_by_id = {email_data['id']: email_data for email_data in fetched}
+        emails_by_id.update(cached)
+        return [emails_by_id[message_id] for message_id in message_ids if message_id in emails_by_id]
+    
+    def _fetch_from_api(self, message_ids: List[str], metadata_only: bool = False) -> List[Dict]:
+        """
+        Lấy chi tiết một nhóm email từ Gmail API theo chế độ đã cấu hình
+        
+        Args:
+            message_ids: Danh sách message ID
+            metadata_only: Chỉ lấy headers (format=metadata), không tải body
+        
+        Returns:
+            List các email đã parse, giữ nguyên thứ tự của message_ids
+        """
+        # Một email thì gọi thẳng, không cần bọc trong batch request
+        if self.use_batch and len(message_ids) > 1:
+            return self._get_emails_batch(message_ids, metadata_only)
+        return self._get_emails_serial(message_ids, metadata_only)
+    
+    def _get_request(self, message_id: str, metadata_only: bool = False, service=None):
+        """Tạo request messages().get cho một email (mặc định dùng self.service)"""
+        service = service or self.service
+        if metadata_only:
+            return service.users().messages().get(
+                userId='me',
+                id=message_id,
+                format='metadata',
+                metadataHeaders=METADATA_HEADERS
+            )
+        if self.fetch_format == 'raw':
+            return service.users().messages().get(userId='me', id=message_id, format='raw')
+        return service.users().messages().get(userId='me', id=message_id)
+    
+    def _get_emails_serial(self, message_ids: List[str], metadata_only: bool = False) -> List[Dict]:
+        """
+        Lấy chi tiết từng email, mỗi email một request
+        
+        Args:
+            message_ids: Danh sách message ID
+            metadata_only: Chỉ lấy headers
+        
+        Returns:
+            List các email đã parse
+        """
+        emails = []
+        
+        for i, message_id in enumerate(message_ids):
+            try:
+                # Lấy chi tiết từng email
+                msg = self.rate_limiter.execute(self._get_request(message_id, metadata_only), 'messages.get')
+                
+                email_data = self._process_message(msg, metadata_only)
+                emails.append(email_data)
+                
+                # Hiển thị tiến trình
+                if (i + 1) % 10 == 0:
+                    logger.info("   Đã xử lý %d/%d email...", i + 1, len(message_ids))
             
-        except Exception as e:
-            print(f"❌ Lỗi khi lấy danh sách email: {str(e)}")
-            return []
+            except Exception as e:
+                logger.warning("⚠️ Lỗi khi lấy email %s: %s", message_id, e)
+                continue
+        
+        return emails
+    
+    def _execute_batch(self, message_ids: List[str],
+                       metadata_only: bool = False) -> Tuple[Dict[str, Dict], Dict[str, Exception]]:
+        """
+        Thực thi một batch request, retry riêng các email bị rate limit
+        
+        Args:
+            message_ids: Danh sách message ID (tối đa batch_size)
+            metadata_only: Chỉ lấy headers
+        
+        Returns:
+            Tuple (message ID -> Gmail message object của các email lấy thành công,
+            message ID -> lỗi của các email không lấy được sau khi retry)
+        """
+        responses = {}
+        failed = {}
+        pending = message_ids
+        attempt = 0
+        
+        while pending:
+            errors = {}
+            
+            def callback(request_id, response, exception):
+                if exception is not None:
+                    errors[request_id] = exception
+                else:
+                    responses[request_id] = response
+            
+            batch = self.service.new_batch_http_request(callback=callback)
+            for message_id in pending:
+                batch.add(self._get_request(message_id, metadata_only), request_id=message_id)
+            
+            try:
+                self.rate_limiter.execute(batch, 'messages.get', units=QUOTA_UNITS['messages.get'] * len(pending))
+            except Exception as e:
+                # Cả batch lỗi sau khi rate limiter đã retry: mọi email còn lại đều không lấy được
+                logger.warning("⚠️ Lỗi khi thực thi batch (%d email): %s", len(pending), e)
+                failed.update((message_id, e) for message_id in pending)
+                break
+            
+            retry_ids = [message_id for message_id in pending
+                         if message_id in errors and RateLimiter.is_retryable(errors[message_id])]
+            if retry_ids and attempt < self.rate_limiter.max_retries:
+                self.rate_limiter.backoff(errors[retry_ids[0]], attempt)
+                attempt += 1
+            else:
+                retry_ids = []
+            
+            for message_id, exception in errors.items():
+                if message_id not in retry_ids:
+                    logger.warning("⚠️ Lỗi khi lấy email %s: %s", message_id, exception)
+                    failed[message_id] = exception
+            
+            pending = retry_ids
+        
+        return responses, failed
+    
+    def _get_emails_batch(self, message_ids: List[str], metadata_only: bool = False) -> List[Dict]:
+        """
+        Lấy chi tiết email bằng Gmail batch request (nhiều messages().get trong một HTTP call)
+        
+        Lỗi của từng email chỉ được báo cáo, không làm hỏng cả batch; email lỗi
+        không có trong kết quả (iter_emails(strict=True) raise FetchError cho chúng).
+        
+        Args:
+            message_ids: Danh sách message ID
+            metadata_only: Chỉ lấy headers
+        
+        Returns:
+            List các email đã parse, giữ nguyên thứ tự của message_ids
+        """
+        emails = []
+        
+        for start in range(0, len(message_ids), self.batch_size):
+            chunk = message_ids[start:start + self.batch_size]
+            with log_duration(logger, "Batch messages.get %d email", len(chunk)):
+                responses, failed = self._execute_batch(chunk, metadata_only)
+            if failed:
+                logger.warning("⚠️ %d/%d email trong batch không lấy được", len(failed), len(chunk))
+            
+            for message_id in chunk:
+                if message_id not in responses:
+                    continue
+                try:
+                    emails.append(self._process_message(responses[message_id], metadata_only))
+                except Exception as e:
+                    logger.warning("⚠️ Lỗi khi parse email %s: %s", message_id, e)
+            
+            # Hiển thị tiến trình
+            logger.info("   Đã xử lý %d/%d email...", min(start + len(chunk), len(message_ids)), len(message_ids))
+        
+        return emails
+    
+    def _process_message(self, msg: Dict, metadata_only: bool = False) -> EmailRecord:
+        """
+        Parse message lấy từ API và lưu vào cache (chỉ lưu message đầy đủ)
+        
+        Args:
+            msg: Gmail message object
+            metadata_only: Message được lấy bằng format=metadata
+        
+        Returns:
+            Dict chứa thông tin email đã được parse
+        """
+        email_data = self._parse_email(msg)
+        
+        if self.cache and not metadata_only:
+            self.cache.put(email_data, raw=msg)
+        
+        return email_data
     
-    def _parse_email(self, msg: Dict) -> Dict:
+    def _parse_email(self, msg: Dict) -> EmailRecord:
         """
         Parse thông tin từ Gmail message object
         
         Args:
             msg: Gmail message object
-            
+        
         Returns:
             Dict chứa thông tin email đã được parse
         """
+        if 'raw' in msg:
+            return self._parse_raw_email(msg)
+        
         headers = msg['payload'].get('headers', [])
         
         # Tạo dict từ headers để dễ truy cập
@@ -80,7 +420,7 @@ class EmailFetcher:
             header_dict[header['name'].lower()] = header['value']
         
         # Lấy thông tin cơ bản
-        email_data = {
+        email_data = EmailRecord.from_dict({
             'id': msg['id'],
             'thread_id': msg['threadId'],
             'subject': header_dict.get('subject', ''),
@@ -91,7 +431,7 @@ class EmailFetcher:
             'snippet': msg.get('snippet', ''),
             'body': self._extract_body(msg['payload']),
             'labels': msg.get('labelIds', [])
-        }
+        })
         
         return email_data
     
@@ -101,47 +441,129 @@ class EmailFetcher:
         
         Args:
             payload: Email payload object
-            
+        
         Returns:
             Nội dung email dưới dạng text
         """
         body = ""
         
         if 'parts' in payload:
-            # Email có nhiều phần
-            for part in payload['parts']:
-                if part['mimeType'] == 'text/plain':
-                    if 'data' in part['body']:
-                        body += base64.urlsafe_b64decode(
-                            part['body']['data']
-                        ).decode('utf-8', errors='ignore')
-                elif part['mimeType'] == 'text/html':
-                    if 'data' in part['body']:
-                        # Chỉ lấy text từ HTML nếu không có text/plain
-                        if not body:
-                            html_content = base64.urlsafe_b64decode(
-                                part['body']['data']
-                            ).decode('utf-8', errors='ignore')
-                            # Loại bỏ HTML tags đơn giản
-                            import re
-                            body = re.sub(r'<[^>]+>', '', html_content)
+            # Email có nhiều phần (có thể lồng nhau, ví dụ multipart/alternative trong multipart/mixed)
+            body = self._extract_parts_body(payload['parts'], body)
         else:
-            # Email chỉ có một phần
-            if payload['mimeType'] == 'text/plain':
-                if 'data' in payload['body']:
+            # Email chỉ có một phần (email lấy bằng format=metadata không có body)
+            if payload.get('mimeType') == 'text/plain':
+                if 'data' in payload.get('body', {}):
                     body = base64.urlsafe_b64decode(
                         payload['body']['data']
                     ).decode('utf-8', errors='ignore')
-            elif payload['mimeType'] == 'text/html':
-                if 'data' in payload['body']:
+            elif payload.get('mimeType') == 'text/html':
+                if 'data' in payload.get('body', {}):
                     html_content = base64.urlsafe_b64decode(
                         payload['body']['data']
                     ).decode('utf-8', errors='ignore')
-                    import re
-                    body = re.sub(r'<[^>]+>', '', html_content)
+                    body = html_to_text(html_content)
         
         return body.strip()
     
+    def _extract_parts_body(self, parts: List[Dict], body: str) -> str:
+        """
+        Duyệt đệ quy các part của email, nối các part text/plain
+        
+        Args:
+            parts: Danh sách part trong payload
+            body: Nội dung đã lấy được từ các part trước
+        
+        Returns:
+            Nội dung email sau khi duyệt các part
+        """
+        for part in parts:
+            if 'parts' in part:
+                body = self._extract_parts_body(part['parts'], body)
+            elif part.get('mimeType') == 'text/plain':
+                if 'data' in part.get('body', {}):
+                    body += base64.urlsafe_b64decode(
+                        part['body']['data']
+                    ).decode('utf-8', errors='ignore')
+            elif part.get('mimeType') == 'text/html':
+                if 'data' in part.get('body', {}):
+                    # Chỉ lấy text từ HTML nếu không có text/plain
+                    if not body:
+                        html_content = base64.urlsafe_b64decode(
+                            part['body']['data']
+                        ).decode('utf-8', errors='ignore')
+                        body = html_to_text(html_content)
+        
+        return body
+    
+    def _parse_raw_email(self, msg: Dict) -> EmailRecord:
+        """
+        Parse Gmail message lấy bằng format=raw (RFC 822) bằng thư viện email chuẩn
+        
+        Toàn bộ message chỉ được decode base64 một lần.
+        
+        Args:
+            msg: Gmail message object có trường 'raw'
+        
+        Returns:
+            Dict chứa thông tin email đã được parse
+        """
+        raw = msg['raw']
+        raw_bytes = base64.urlsafe_b64decode(raw + '=' * (-len(raw) % 4))
+        message = email.message_from_bytes(raw_bytes, policy=policy.default)
+        
+        email_data = EmailRecord.from_dict({
+            'id': msg['id'],
+            'thread_id': msg['threadId'],
+            'subject': str(message.get('subject', '')),
+            'from': str(message.get('from', '')),
+            'to': str(message.get('to', '')),
+            'date': str(message.get('date', '')),
+            'timestamp': msg['internalDate'],
+            'snippet': msg.get('snippet', ''),
+            'body': self._extract_raw_body(message),
+            'labels': msg.get('labelIds', [])
+        })
+        
+        return email_data
+    
+    def _extract_raw_body(self, message: EmailMessage) -> str:
+        """
+        Lấy part text/plain đầu tiên của cây MIME, nếu không có thì dùng text/html đầu tiên
+        
+        Chỉ part được chọn mới được decode; dừng duyệt ngay khi gặp text/plain.
+        
+        Args:
+            message: Email đã parse bằng email.message_from_bytes
+        
+        Returns:
+            Nội dung email dưới dạng text
+        """
+        html_part = None
+        
+        for part in message.walk():
+            if part.is_multipart() or part.get_content_disposition() == 'attachment':
+                continue
+            
+            content_type = part.get_content_type()
+            if content_type == 'text/plain':
+                return self._get_part_text(part).strip()
+            if content_type == 'text/html' and html_part is None:
+                html_part = part
+        
+        if html_part is None:
+            return ""
+        
+        return html_to_text(self._get_part_text(html_part))
+    
+    def _get_part_text(self, part: EmailMessage) -> str:
+        """Decode nội dung một part text, bỏ qua lỗi charset"""
+        try:
+            return part.get_content()
+        except (LookupError, UnicodeDecodeError):
+            payload = part.get_payload(decode=True) or b''
+            return payload.decode('utf-8', errors='ignore')
+    
     def search_emails(self, query: str, max_results: int = DEFAULT_MAX_RESULTS) -> List[Dict]:
         """
         Tìm kiếm email với query cụ thể
@@ -149,8 +571,75 @@ class EmailFetcher:
         Args:
             query: Query string để tìm kiếm
             max_results: Số lượng kết quả tối đa
-            
+        
         Returns:
             List các email phù hợp
         """
         return self.get_emails(query, max_results)
+
+
+class ConcurrentEmailFetcher(EmailFetcher):
+    """
+    Fetcher lấy chi tiết email song song bằng thread pool
+    
+    googleapiclient/httplib2 không thread-safe, nên mỗi worker thread tự tạo
+    Gmail service riêng (qua service_factory) từ credentials dùng chung.
+    messages().list vẫn chạy trên service chính ở thread gọi.
+    """
+    
+    def __init__(self, service, service_factory: Callable[[], object], max_workers: int = FETCH_CONCURRENCY,
+                 cache: Optional[MessageCache] = None, rate_limiter: Optional[RateLimiter] = None,
+                 fetch_format: str = FETCH_FORMAT):
+        """
+        Khởi tạo fetcher song song
+        
+        Args:
+            service: Gmail service object dùng cho thread gọi
+            service_factory: Hàm tạo Gmail service mới cho mỗi worker thread
+            max_workers: Số worker thread tối đa
+            cache: Cache SQLite lưu email đã parse (None = không dùng cache)
+            rate_limiter: Rate limiter theo quota, dùng chung giữa các worker
+            fetch_format: 'full' hoặc 'raw'
+        """
+        super().__init__(service, use_batch=False, cache=cache, rate_limiter=rate_limiter,
+                         fetch_format=fetch_format)
+        self.service_factory = service_factory
+        self.max_workers = max(1, max_workers)
+        self._local = threading.local()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='gmail-fetch')
+    
+    def _fetch_from_api(self, message_ids: List[str], metadata_only: bool = False) -> List[Dict]:
+        """
+        Lấy chi tiết một nhóm email song song
+        
+        Args:
+            message_ids: Danh sách message ID
+            metadata_only: Chỉ lấy headers
+        
+        Returns:
+            List các email đã parse, giữ nguyên thứ tự của message_ids
+        """
+        results = self._executor.map(lambda message_id: self._fetch_one(message_id, metadata_only), message_ids)
+        return [email_data for email_data in results if email_data is not None]
+    
+    def _fetch_one(self, message_id: str, metadata_only: bool) -> Optional[Dict]:
+        """Lấy và parse một email trong worker thread, trả về None nếu lỗi"""
+        try:
+            request = self._get_request(message_id, metadata_only, service=self._worker_service())
+            msg = self.rate_limiter.execute(request, 'messages.get')
+            return self._process_message(msg, metadata_only)
+        except Exception as e:
+            logger.warning("⚠️ Lỗi khi lấy email %s: %s", message_id, e)
+            return None
+    
+    def _worker_service(self):
+        """Trả về Gmail service riêng của worker thread hiện tại"""
+        service = getattr(self._local, 'service', None)
+        if service is None:
+            service = self.service_factory()
+            self._local.service = service
+        return service
+    
+    def close(self):
+        """Dừng thread pool"""
+        self._executor.shutdown(wait=True)
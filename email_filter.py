@@ -2,10 +2,35 @@
 Module lọc email theo các tiêu chí khác nhau
 """
 import re
-from datetime import datetime, timedelta
-from typing import List, Dict, Optional
+from datetime import date, datetime, timedelta, MINYEAR, MAXYEAR
+from typing import List, Dict, Optional, Callable
 from dateutil import parser
 
+# Địa chỉ email đầy đủ (có thể đẩy lên Gmail query dạng from:địa_chỉ)
+EMAIL_ADDRESS_PATTERN = re.compile(r'^[A-Za-z0-9._%+-]+@[A-Za-z0-9-]+(\.[A-Za-z0-9-]+)+$')
+
+
+class FilterPlan:
+    """Kế hoạch lọc: phần đã đẩy lên Gmail query và hàm lọc cục bộ cho phần còn lại"""
+    
+    def __init__(self, query: str, predicate: Callable[[Dict], bool], header_predicate: Callable[[Dict], bool],
+                 needs_body: bool, pushed: List[str], local: List[str]):
+        """
+        Args:
+            query: Gmail query (query gốc + điều kiện đã đẩy lên)
+            predicate: Hàm lọc cục bộ theo mọi tiêu chí (email đầy đủ)
+            header_predicate: Như predicate nhưng bỏ tiêu chí body (dùng cho email chỉ có headers)
+            needs_body: Có tiêu chí cần body không
+            pushed: Tên các tiêu chí đã đẩy lên query
+            local: Tên các tiêu chí được kiểm tra cục bộ
+        """
+        self.query = query
+        self.predicate = predicate
+        self.header_predicate = header_predicate
+        self.needs_body = needs_body
+        self.pushed = pushed
+        self.local = local
+
 
 class EmailFilter:
     def __init__(self):
@@ -22,126 +47,149 @@ class EmailFilter:
         Returns:
             Danh sách email đã được lọc
         """
-        filtered_emails = emails.copy()
-        
-        # Lọc theo ngày
-        if 'date_from' in filters:
-            filtered_emails = self._filter_by_date_from(filtered_emails, filters['date_from'])
-        
-        if 'date_to' in filters:
-            filtered_emails = self._filter_by_date_to(filtered_emails, filters['date_to'])
-        
-        # Lọc theo tháng
-        if 'month' in filters:
-            filtered_emails = self._filter_by_month(filtered_emails, filters['month'])
-        
-        # Lọc theo năm
-        if 'year' in filters:
-            filtered_emails = self._filter_by_year(filtered_emails, filters['year'])
-        
-        # Lọc theo tiêu đề
-        if 'subject_contains' in filters:
-            filtered_emails = self._filter_by_subject(filtered_emails, filters['subject_contains'])
-        
-        # Lọc theo người gửi
-        if 'from_contains' in filters:
-            filtered_emails = self._filter_by_sender(filtered_emails, filters['from_contains'])
-        
-        # Lọc theo nội dung
-        if 'body_contains' in filters:
-            filtered_emails = self._filter_by_body(filtered_emails, filters['body_contains'])
-        
-        return filtered_emails
-    
-    def _filter_by_date_from(self, emails: List[Dict], date_from: str) -> List[Dict]:
-        """Lọc email từ ngày cụ thể"""
-        try:
-            target_date = parser.parse(date_from).date()
-            filtered = []
-            
-            for email in emails:
-                email_date = self._parse_email_date(email['date'])
-                if email_date and email_date >= target_date:
-                    filtered.append(email)
-            
-            return filtered
-        except Exception as e:
-            print(f"⚠️ Lỗi khi lọc theo ngày từ: {str(e)}")
-            return emails
-    
-    def _filter_by_date_to(self, emails: List[Dict], date_to: str) -> List[Dict]:
-        """Lọc email đến ngày cụ thể"""
-        try:
-            target_date = parser.parse(date_to).date()
-            filtered = []
-            
-            for email in emails:
-                email_date = self._parse_email_date(email['date'])
-                if email_date and email_date <= target_date:
-                    filtered.append(email)
-            
-            return filtered
-        except Exception as e:
-            print(f"⚠️ Lỗi khi lọc theo ngày đến: {str(e)}")
-            return emails
-    
-    def _filter_by_month(self, emails: List[Dict], month: int) -> List[Dict]:
-        """Lọc email theo tháng"""
-        filtered = []
-        
-        for email in emails:
-            email_date = self._parse_email_date(email['date'])
-            if email_date and email_date.month == month:
-                filtered.append(email)
-        
-        return filtered
+        predicate = self.compile_predicate(**filters)
+        return [email for email in emails if predicate(email)]
     
-    def _filter_by_year(self, emails: List[Dict], year: int) -> List[Dict]:
-        """Lọc email theo năm"""
-        filtered = []
+    def compile_predicate(self, **filters) -> Callable[[Dict], bool]:
+        """
+        Biên dịch các tiêu chí lọc thành một hàm kiểm tra từng email
         
-        for email in emails:
-            email_date = self._parse_email_date(email['date'])
-            if email_date and email_date.year == year:
-                filtered.append(email)
+        Mọi tiêu chí được kiểm tra trong một lần duyệt; ngày của email chỉ được
+        parse một lần dù có nhiều tiêu chí về ngày.
         
-        return filtered
+        Args:
+            **filters: Các tiêu chí lọc như filter_emails
+            
+        Returns:
+            Hàm nhận email, trả về True nếu email thỏa mọi tiêu chí
+        """
+        return self._build_predicate(self._parse_criteria(filters))
     
-    def _filter_by_subject(self, emails: List[Dict], subject_keyword: str) -> List[Dict]:
-        """Lọc email theo từ khóa trong tiêu đề"""
-        filtered = []
-        keyword_lower = subject_keyword.lower()
-        
-        for email in emails:
-            subject_lower = email['subject'].lower()
-            if keyword_lower in subject_lower:
-                filtered.append(email)
+    def _build_predicate(self, criteria: Dict, include_body: bool = True) -> Callable[[Dict], bool]:
+        """
+        Tạo hàm lọc từ các tiêu chí đã chuẩn hóa
         
-        return filtered
+        Args:
+            criteria: Kết quả _parse_criteria
+            include_body: Kiểm tra cả body_contains (False khi email chưa có body)
+        """
+        date_from = criteria.get('date_from')
+        date_to = criteria.get('date_to')
+        has_month = 'month' in criteria
+        has_year = 'year' in criteria
+        month = criteria.get('month')
+        year = criteria.get('year')
+        needs_date = date_from is not None or date_to is not None or has_month or has_year
+        
+        def keyword(name: str) -> Optional[str]:
+            if name not in criteria:
+                return None
+            return criteria[name].lower()
+        
+        subject_keyword = keyword('subject_contains')
+        sender_keyword = keyword('from_contains')
+        body_keyword = keyword('body_contains') if include_body else None
+        parse_email_date = self._parse_email_date
+        
+        def predicate(email: Dict) -> bool:
+            if needs_date:
+                email_date = parse_email_date(email['date'])
+                if not email_date:
+                    return False
+                if date_from is not None and email_date < date_from:
+                    return False
+                if date_to is not None and email_date > date_to:
+                    return False
+                if has_month and email_date.month != month:
+                    return False
+                if has_year and email_date.year != year:
+                    return False
+            if subject_keyword is not None and subject_keyword not in email['subject'].lower():
+                return False
+            if sender_keyword is not None and sender_keyword not in email['from'].lower():
+                return False
+            if body_keyword is not None and body_keyword not in email['body'].lower():
+                return False
+            return True
+        
+        return predicate
     
-    def _filter_by_sender(self, emails: List[Dict], sender_keyword: str) -> List[Dict]:
-        """Lọc email theo từ khóa trong người gửi"""
-        filtered = []
-        keyword_lower = sender_keyword.lower()
-        
-        for email in emails:
-            from_lower = email['from'].lower()
-            if keyword_lower in from_lower:
-                filtered.append(email)
+    def plan(self, query: str = '', **filters) -> 'FilterPlan':
+        """
+        Chia các tiêu chí lọc thành phần Gmail query và phần lọc cục bộ
+        
+        Chỉ điều kiện mà Gmail trả về tập email chứa mọi email thỏa tiêu chí mới
+        được đẩy lên query; query chỉ thu hẹp số email cần tải, mọi tiêu chí vẫn
+        được kiểm tra cục bộ nên kết quả giống hệt filter_emails:
+        - date_from/date_to, year (và month khi có year): thành after:/before:,
+          nới thêm một ngày mỗi phía vì Gmail tính ngày theo múi giờ khác với
+          header Date
+        - from_contains là địa chỉ email đầy đủ: thành from: (Gmail khớp cả địa
+          chỉ chứa nó như xa@b.com, nên vẫn lọc lại theo chuỗi con)
+        - subject_contains, body_contains, from_contains khác: so khớp chuỗi con,
+          Gmail không hỗ trợ (Gmail tìm theo từ), nên chỉ lọc cục bộ
         
-        return filtered
+        Args:
+            query: Query Gmail sẵn có (được giữ nguyên)
+            **filters: Các tiêu chí lọc như filter_emails
+            
+        Returns:
+            FilterPlan
+        """
+        criteria = self._parse_criteria(filters)
+        terms = [query] if query else []
+        pushed = []
+        
+        start = criteria.get('date_from')
+        end = criteria.get('date_to')
+        year = criteria.get('year')
+        if isinstance(year, int) and MINYEAR < year < MAXYEAR:
+            month = criteria.get('month')
+            if isinstance(month, int) and 1 <= month <= 12:
+                period_start = date(year, month, 1)
+                period_end = date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+            else:
+                period_start, period_end = date(year, 1, 1), date(year, 12, 31)
+            start = max(start, period_start) if start else period_start
+            end = min(end, period_end) if end else period_end
+        if start:
+            terms.append(f"after:{(start - timedelta(days=1)).strftime('%Y-%m-%d')}")
+            pushed.append('date')
+        if end:
+            terms.append(f"before:{(end + timedelta(days=2)).strftime('%Y-%m-%d')}")
+            pushed.append('date')
+        
+        sender = criteria.get('from_contains')
+        if sender and EMAIL_ADDRESS_PATTERN.match(sender):
+            terms.append(f"from:{sender}")
+            pushed.append('from_contains')
+        
+        return FilterPlan(
+            query=' '.join(terms),
+            predicate=self._build_predicate(criteria),
+            header_predicate=self._build_predicate(criteria, include_body=False),
+            needs_body='body_contains' in criteria,
+            pushed=list(dict.fromkeys(pushed)),
+            local=list(criteria),
+        )
     
-    def _filter_by_body(self, emails: List[Dict], body_keyword: str) -> List[Dict]:
-        """Lọc email theo từ khóa trong nội dung"""
-        filtered = []
-        keyword_lower = body_keyword.lower()
-        
-        for email in emails:
-            body_lower = email['body'].lower()
-            if keyword_lower in body_lower:
-                filtered.append(email)
+    def _parse_criteria(self, filters: Dict) -> Dict:
+        """
+        Chuẩn hóa các tiêu chí lọc (parse ngày một lần)
         
-        return filtered
+        Ngày không parse được thì tiêu chí đó bị bỏ qua (kèm cảnh báo), như trước đây.
+        """
+        criteria = {}
+        for name, label in (('date_from', 'từ'), ('date_to', 'đến')):
+            if name in filters:
+                try:
+                    criteria[name] = parser.parse(filters[name]).date()
+                except Exception as e:
+                    print(f"⚠️ Lỗi khi lọc theo ngày {label}: {str(e)}")
+        for name in ('month', 'year', 'subject_contains', 'from_contains', 'body_contains'):
+            if name in filters:
+                criteria[name] = filters[name]
+        return criteria
     
     def _parse_email_date(self, date_str: str) -> Optional[datetime]:
         """Parse ngày từ string"""
@@ -157,7 +205,7 @@ class EmailFilter:
     
     def build_gmail_query(self, **filters) -> str:
         """
-        Xây dựng Gmail query string từ các filter
+        Xây dựng Gmail query string từ các filter (phần query của plan())
         
         Args:
             **filters: Các tiêu chí lọc
@@ -165,25 +213,4 @@ class EmailFilter:
         Returns:
             Gmail query string
         """
-        query_parts = []
-        
-        # Lọc theo ngày
-        if 'date_from' in filters:
-            query_parts.append(f"after:{filters['date_from']}")
-        
-        if 'date_to' in filters:
-            query_parts.append(f"before:{filters['date_to']}")
-        
-        # Lọc theo người gửi
-        if 'from_contains' in filters:
-            query_parts.append(f"from:{filters['from_contains']}")
-        
-        # Lọc theo tiêu đề
-        if 'subject_contains' in filters:
-            query_parts.append(f"subject:{filters['subject_contains']}")
-        
-        # Lọc theo nội dung
-        if 'body_contains' in filters:
-            query_parts.append(f"{filters['body_contains']}")
-        
-        return ' '.join(query_parts)
+        return self.plan(**filters).query
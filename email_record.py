@@ -0,0 +1,150 @@
+"""
+Module định nghĩa EmailRecord - bản ghi email gọn nhẹ dùng __slots__
+"""
+from typing import Any, Dict, Iterator, List, Tuple
+
+# Key kiểu dict -> tên slot ('from' là từ khóa Python nên lưu trong slot 'sender')
+FIELD_SLOTS = {
+    'id': 'id',
+    'thread_id': 'thread_id',
+    'subject': 'subject',
+    'from': 'sender',
+    'to': 'to',
+    'date': 'date',
+    'timestamp': 'timestamp',
+    'snippet': 'snippet',
+    'body': 'body',
+    'labels': 'labels',
+    'status': 'status',
+    'confidence': 'confidence',
+    'matched_keywords': 'matched_keywords',
+    'order_number': 'order_number',
+    'quantity': 'quantity',
+}
+
+
+class EmailRecord:
+    """
+    Bản ghi email dùng chung cho EmailFetcher, EmailFilter và ContentAnalyzer
+    
+    Dùng __slots__ thay vì dict để giảm bộ nhớ khi xử lý hàng nghìn email, nhưng
+    vẫn hỗ trợ truy cập kiểu dict (email['subject'], email.get('status'), ...)
+    để code cũ hoạt động bình thường. Key không có trong FIELD_SLOTS được lưu
+    trong dict phụ.
+    """
+    
+    __slots__ = tuple(FIELD_SLOTS.values()) + ('_extra',)
+    
+    def __init__(self, **fields):
+        self._extra = None
+        for key, value in fields.items():
+            self[key] = value
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'EmailRecord':
+        """Tạo EmailRecord từ dict (ví dụ bản ghi đọc từ cache)"""
+        record = cls()
+        for key, value in data.items():
+            record[key] = value
+        return record
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Chuyển về dict thường (ví dụ để lưu JSON)"""
+        return dict(self.items())
+    
+    def drop_body(self):
+        """
+        Bỏ nội dung body sau khi đã phân tích xong (trạng thái, order number,
+        quantity đã được trích xuất) để giải phóng bộ nhớ
+        """
+        if self.get('body'):
+            self.body = ''
+    
+    # Truy cập kiểu dict
+    
+    def __getitem__(self, key: str) -> Any:
+        slot = FIELD_SLOTS.get(key)
+        if slot is None:
+            if self._extra and key in self._extra:
+                return self._extra[key]
+            raise KeyError(key)
+        try:
+            return getattr(self, slot)
+        except AttributeError:
+            raise KeyError(key) from None
+    
+    def __setitem__(self, key: str, value: Any):
+        slot = FIELD_SLOTS.get(key)
+        if slot is None:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+        else:
+            setattr(self, slot, value)
+    
+    def __delitem__(self, key: str):
+        slot = FIELD_SLOTS.get(key)
+        if slot is None:
+            if not self._extra or key not in self._extra:
+                raise KeyError(key)
+            del self._extra[key]
+            return
+        try:
+            delattr(self, slot)
+        except AttributeError:
+            raise KeyError(key) from None
+    
+    def __contains__(self, key: object) -> bool:
+        try:
+            self[key]
+            return True
+        except KeyError:
+            return False
+    
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+    
+    def keys(self) -> List[str]:
+        keys = [key for key, slot in FIELD_SLOTS.items() if hasattr(self, slot)]
+        if self._extra:
+            keys.extend(self._extra)
+        return keys
+    
+    def values(self) -> List[Any]:
+        return [self[key] for key in self.keys()]
+    
+    def items(self) -> List[Tuple[str, Any]]:
+        return [(key, self[key]) for key in self.keys()]
+    
+    def update(self, other: Dict[str, Any] = None, **fields):
+        for key, value in (other or {}).items():
+            self[key] = value
+        for key, value in fields.items():
+            self[key] = value
+    
+    def copy(self) -> 'EmailRecord':
+        """Bản sao nông (chuỗi body/snippet được dùng chung, không nhân đôi)"""
+        record = EmailRecord()
+        for slot in FIELD_SLOTS.values():
+            if hasattr(self, slot):
+                setattr(record, slot, getattr(self, slot))
+        if self._extra:
+            record._extra = dict(self._extra)
+        return record
+    
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.keys())
+    
+    def __len__(self) -> int:
+        return len(self.keys())
+    
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, (EmailRecord, dict)):
+            return self.to_dict() == dict(other.items())
+        return NotImplemented
+    
+    def __repr__(self) -> str:
+        return f"EmailRecord(id={self.get('id')!r}, subject={self.get('subject')!r}, status={self.get('status')!r})"
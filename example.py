@@ -40,24 +40,16 @@ def example_advanced_filtering():
     if not tool.initialize():
         return
     
-    # Lấy email từ tháng này
-    print("\n1. Lấy email từ tháng này...")
-    emails = tool.fetch_emails(max_results=100)
+    # Lấy và lọc email có chứa từ "test" trong tiêu đề (chỉ tải body của email phù hợp)
+    print("\n1. Lấy email có chứa 'test' trong tiêu đề...")
+    filtered_emails = tool.fetch_filtered_emails(max_results=100, subject_contains='test')
     
-    if emails:
-        # Lọc email có chứa từ "test" trong tiêu đề
-        print("\n2. Lọc email có chứa 'test' trong tiêu đề...")
-        filtered_emails = tool.filter_emails(
-            emails, 
-            subject_contains='test'
-        )
-        
-        if filtered_emails:
-            # Phân tích và hiển thị
-            analyzed_emails = tool.analyze_emails(filtered_emails)
-            tool.display_emails(analyzed_emails)
-        else:
-            print("Không tìm thấy email nào phù hợp")
+    if filtered_emails:
+        # Phân tích và hiển thị
+        analyzed_emails = tool.analyze_emails(filtered_emails)
+        tool.display_emails(analyzed_emails)
+    else:
+        print("Không tìm thấy email nào phù hợp")
 
 
 def example_search_specific():
@@ -65,3 +65,11 @@ class GmailAuthenticator:
     def get_service(self):
         """Trả về Gmail service object"""
         return self.service
+    
+    def build_service(self):
+        """
+        Tạo Gmail service object mới từ credentials hiện tại
+        
+        Service (httplib2) không thread-safe, nên mỗi thread cần một service riêng.
+        """
+        return build('gmail', 'v1', credentials=self.creds)
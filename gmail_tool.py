@@ -1,6 +1,8 @@
 """
 Gmail Tool - Tool chính để truy cập và phân tích email Gmail
 """
+import argparse
+import logging
 import os
 import sys
 from datetime import datetime
@@ -9,22 +11,37 @@ from tabulate import tabulate
 from colorama import init, Fore, Style
 
 from gmail_auth import GmailAuthenticator
-from email_fetcher import EmailFetcher
+from email_fetcher import EmailFetcher, ConcurrentEmailFetcher
 from email_filter import EmailFilter
+from log_config import setup_logging, log_duration
 from content_analyzer import ContentAnalyzer
-from config import DEFAULT_MAX_RESULTS
+from message_cache import MessageCache
+from mailbox_sync import MailboxSync, HISTORY_ID_KEY
+from order_index import OrderIndex
+from order_journal import OrderJournal
+from order_resolver import OrderResolver, ORDER_SUCCESS, ORDER_FAILED, ORDER_NOT_FOUND, ORDER_ERROR
+from query_planner import plan_package_queries
+from config import (
+    DEFAULT_MAX_RESULTS, FETCH_CONCURRENCY, ORDER_SEARCH_BATCHED, ORDER_QUERY_PUSHDOWN, LOG_LEVEL, LOG_JSON_FILE
+)
 
 # Khởi tạo colorama
 init(autoreset=True)
 
+logger = logging.getLogger(__name__)
+
 
 class GmailTool:
-    def __init__(self):
+    def __init__(self, use_cache: bool = True, resume: bool = False):
         self.authenticator = GmailAuthenticator()
         self.fetcher = None
         self.filter = EmailFilter()
         self.analyzer = ContentAnalyzer()
         self.service = None
+        self.use_cache = use_cache
+        self.cache = None
+        self.order_index = None
+        self.resume = resume
     
     def initialize(self) -> bool:
         """
@@ -46,11 +63,58 @@ class GmailTool:
             return False
         
         self.service = self.authenticator.get_service()
-        self.fetcher = EmailFetcher(self.service)
+        
+        # Mở cache email (có thể tắt bằng --no-cache)
+        if self.use_cache and self.cache is None:
+            try:
+                self.cache = MessageCache()
+                self.order_index = OrderIndex(self.cache, self.analyzer)
+                # Email đã phân tích với cùng bộ quy tắc không bị phân tích lại
+                self.analyzer.result_cache = self.cache
+            except Exception as e:
+                print(f"{Fore.YELLOW}⚠️ Không mở được cache ({str(e)}), tiếp tục không dùng cache")
+        
+        if FETCH_CONCURRENCY > 0:
+            self.fetcher = ConcurrentEmailFetcher(
+                self.service,
+                service_factory=self.authenticator.build_service,
+                max_workers=FETCH_CONCURRENCY,
+                cache=self.cache
+            )
+        else:
+            self.fetcher = EmailFetcher(self.service, cache=self.cache)
+        logger.debug("Fetcher: %s (concurrency=%d, cache=%s)", type(self.fetcher).__name__,
+                     FETCH_CONCURRENCY, self.cache.path if self.cache else None)
         
         print(f"{Fore.GREEN}✅ Khởi tạo thành công!")
         return True
     
+    def sync_mailbox(self) -> bool:
+        """
+        Đồng bộ hộp thư vào cache cục bộ (tăng dần nếu đã đồng bộ trước đó)
+        
+        Returns:
+            True nếu đồng bộ thành công
+        """
+        if not self.fetcher:
+            print(f"{Fore.RED}❌ Tool chưa được khởi tạo")
+            return False
+        
+        if not self.cache:
+            print(f"{Fore.YELLOW}⚠️ Đồng bộ cần cache email (không dùng được với --no-cache)")
+            return False
+        
+        try:
+            MailboxSync(self.service, self.fetcher, self.cache, self.order_index).sync()
+            return True
+        except Exception as e:
+            print(f"{Fore.RED}❌ Lỗi khi đồng bộ hộp thư: {str(e)}")
+            return False
+    
+    def _create_worker_fetcher(self) -> EmailFetcher:
+        """Tạo EmailFetcher với Gmail service riêng cho một worker thread"""
+        return EmailFetcher(self.authenticator.build_service(), cache=self.cache)
+    
     def fetch_emails(self, query: str = '', max_results: int = DEFAULT_MAX_RESULTS) -> List[Dict]:
         """
         Lấy danh sách email từ Gmail
@@ -76,6 +140,42 @@ class GmailTool:
         
         return emails
     
+    def fetch_filtered_emails(self, query: str = '', max_results: int = DEFAULT_MAX_RESULTS,
+                              **filters) -> List[Dict]:
+        """
+        Lấy email thỏa các tiêu chí lọc, đẩy tối đa tiêu chí lên Gmail query
+        
+        Kết quả giống fetch_emails + filter_emails, nhưng Gmail chỉ trả về email
+        có thể thỏa tiêu chí (ngày, địa chỉ người gửi), và body chỉ được tải cho
+        email đã thỏa các tiêu chí trên headers.
+        
+        Args:
+            query: Query string sẵn có
+            max_results: Số lượng email tối đa lấy từ Gmail (trước khi lọc cục bộ)
+            **filters: Các tiêu chí lọc như filter_emails
+            
+        Returns:
+            Danh sách email đã lọc
+        """
+        if not self.fetcher:
+            print(f"{Fore.RED}❌ Tool chưa được khởi tạo")
+            return []
+        
+        plan = self.filter.plan(query, **filters)
+        logger.debug("Filter plan: query=%r, pushed=%s, local=%s", plan.query, plan.pushed, plan.local)
+        
+        print(f"{Fore.YELLOW}📧 Đang lấy email từ Gmail...")
+        body_filter = plan.header_predicate if plan.local else None
+        emails = self.fetcher.iter_emails(query=plan.query, limit=max_results, body_filter=body_filter)
+        filtered_emails = [email for email in emails if plan.predicate(email)]
+        
+        if filtered_emails:
+            print(f"{Fore.GREEN}✅ Đã lấy được {len(filtered_emails)} email phù hợp")
+        else:
+            print(f"{Fore.YELLOW}⚠️ Không tìm thấy email nào")
+        
+        return filtered_emails
+    
     def filter_emails(self, emails: List[Dict], **filters) -> List[Dict]:
         """
         Lọc email theo các tiêu chí
@@ -110,7 +210,7 @@ class GmailTool:
             return []
         
         print(f"{Fore.YELLOW}🔬 Đang phân tích {len(emails)} email...")
-        analyzed_emails = self.analyzer.analyze_emails(emails)
+        analyzed_emails = self.analyzer.analyze_emails_parallel(emails)
         
         # Hiển thị tóm tắt
         summary = self.analyzer.get_status_summary(analyzed_emails)
@@ -195,6 +295,16 @@ class GmailTool:
         print(f"{Fore.RED}❌ ERROR: {error_total}")
         print(f"{Fore.WHITE}📧 TỔNG CỘNG: {summary['TOTAL']}")
     
+    def _display_api_stats(self):
+        """Hiển thị thống kê retry/throttle của rate limiter (nếu có)"""
+        if not self.fetcher:
+            return
+        
+        stats = self.fetcher.rate_limiter.stats()
+        if stats['retries'] or stats['throttled_seconds']:
+            print(f"{Fore.WHITE}⏱️ Gmail API: {stats['requests']} request, {stats['retries']} lần retry, "
+                  f"chờ quota {stats['throttled_seconds']}s")
+    
     def _display_order_numbers(self, emails: List[Dict]):
         """Hiển thị danh sách order number theo trạng thái"""
         complete_orders = []
@@ -385,7 +495,6 @@ class GmailTool:
         date_from = "mọi lúc"
         date_to = "mọi lúc"
         date_range_text = "tất cả email (mọi lúc)"
-        query_template = "{order_number}"
         
         # Đọc order numbers từ file
         try:
@@ -401,51 +510,59 @@ class GmailTool:
         success_orders = []  # List of dicts: {'order': 'xxx', 'quantity': 'yy'}
         failed_orders = []   # List of dicts: {'order': 'xxx', 'quantity': 'yy'}
         not_found_orders = []
+        error_orders = []    # Order bị lỗi khi tìm (không ghi journal, được tìm lại khi --resume)
+        
+        # Journal ghi lại từng order đã xử lý để có thể chạy tiếp (--resume) nếu bị dừng
+        journal = OrderJournal()
+        if self.resume:
+            done_results = journal.load()
+            self.resume = False
+            print(f"{Fore.CYAN}⏭️ Bỏ qua {len(set(order_numbers) & set(done_results))} order đã xử lý ở lần chạy trước")
+        else:
+            journal.reset()
+            done_results = {}
+        
+        pending_orders = [order_number for order_number in order_numbers if order_number not in done_results]
+        # Hộp thư đã từng được đồng bộ -> cập nhật tăng dần để chỉ mục order không bị cũ
+        if self.order_index is not None and self.cache.get_state(HISTORY_ID_KEY):
+            self.sync_mailbox()
+        
+        resolver = OrderResolver(self.fetcher, self.analyzer, fetcher_factory=self._create_worker_fetcher,
+                                 index=self.order_index)
+        with log_duration(logger, "Tìm %d order (batched=%s)", len(pending_orders), ORDER_SEARCH_BATCHED,
+                          level=logging.INFO):
+            if ORDER_SEARCH_BATCHED:
+                # Gộp nhiều order vào một query (OR) để giảm số lần gọi Gmail API
+                new_results = resolver.resolve_batch(pending_orders, on_result=journal.record)
+            else:
+                new_results = resolver.resolve_many(pending_orders, on_result=journal.record)
         
-        for i, order_number in enumerate(order_numbers, 1):
+        results_by_order = dict(done_results)
+        results_by_order.update((result['order'], result) for result in new_results)
+        results = [results_by_order[order_number] for order_number in order_numbers]
+        
+        for i, result in enumerate(results, 1):
+            order_number = result['order']
+            status = result['status']
+            quantity = result['quantity']
             print(f"\n{Fore.YELLOW}[{i}/{len(order_numbers)}] Đang tìm kiếm order: {order_number}")
             
-            # Tìm kiếm email chứa order number
-            query = query_template.format(order_number=order_number)
-            emails = self.fetcher.get_emails(query=query, max_results=10)
-            
-            if not emails:
+            if status == ORDER_SUCCESS:
+                print(f"   {Fore.GREEN}✅ Tìm thấy SUCCESS cho order {order_number}")
+                if quantity:
+                    print(f"   {Fore.CYAN}📦 Quantity: {quantity}")
+                success_orders.append({'order': order_number, 'quantity': quantity})
+            elif status == ORDER_FAILED:
+                print(f"   {Fore.RED}❌ Tìm thấy FAILED cho order {order_number}")
+                if quantity:
+                    print(f"   {Fore.CYAN}📦 Quantity: {quantity}")
+                failed_orders.append({'order': order_number, 'quantity': quantity})
+            elif status == ORDER_NOT_FOUND:
                 print(f"   {Fore.RED}❌ Không tìm thấy email cho order {order_number}")
                 not_found_orders.append(order_number)
-                continue
-            
-            # Phân tích email
-            analyzer = ContentAnalyzer()
-            analyzed_emails = analyzer.analyze_emails(emails)
-            
-            # Kiểm tra kết quả phân tích
-            found_success = False
-            found_failed = False
-            order_quantity = ""
-            
-            for email in analyzed_emails:
-                status = email.get('status', '')
-                quantity = email.get('quantity', '')
-                
-                if status == 'PACKAGE_SUCCESS':
-                    found_success = True
-                    order_quantity = quantity
-                    print(f"   {Fore.GREEN}✅ Tìm thấy SUCCESS cho order {order_number}")
-                    if quantity:
-                        print(f"   {Fore.CYAN}📦 Quantity: {quantity}")
-                    break
-                elif status == 'PACKAGE_FAILED':
-                    found_failed = True
-                    order_quantity = quantity
-                    print(f"   {Fore.RED}❌ Tìm thấy FAILED cho order {order_number}")
-                    if quantity:
-                        print(f"   {Fore.CYAN}📦 Quantity: {quantity}")
-                    break
-            
-            if found_success:
-                success_orders.append({'order': order_number, 'quantity': order_quantity})
-            elif found_failed:
-                failed_orders.append({'order': order_number, 'quantity': order_quantity})
+            elif status == ORDER_ERROR:
+                print(f"   {Fore.RED}⚠️ Lỗi khi tìm order {order_number}, chạy lại với --resume để tìm lại")
+                error_orders.append(order_number)
             else:
                 print(f"   {Fore.YELLOW}⚠️ Không xác định được trạng thái cho order {order_number}")
                 not_found_orders.append(order_number)
@@ -500,7 +617,13 @@ class GmailTool:
         else:
             print(f"   {Fore.YELLOW}Không có order nào không tìm thấy")
         
+        if error_orders:
+            print(f"\n{Fore.RED}⚠️ ORDER LỖI KHI TÌM ({len(error_orders)}) - chạy lại với --resume để tìm lại:")
+            for order in error_orders:
+                print(f"   {Fore.RED}• {order}")
+        
         print(f"\n{Fore.CYAN}📈 Tổng cộng: {len(success_orders)} thành công, {len(failed_orders)} thất bại, {len(not_found_orders)} không tìm thấy")
+        self._display_api_stats()
         
         # Lưu kết quả vào instance để có thể export
         self.last_search_results = {
@@ -557,24 +680,33 @@ class GmailTool:
             # Tạo query để tìm tất cả email trong hộp thư đến theo khoảng thời gian
             query = f"after:{date_from} before:{date_to}"
             
-            # Lấy email
-            emails = self.fetch_emails(query=query, max_results=max_results)
-            
-            if not emails:
-                print(f"{Fore.YELLOW}⚠️ Không tìm thấy email nào trong khoảng thời gian này")
-                return
+            # Chỉ lấy email có tiêu đề khớp quy tắc merchant (Gmail lọc sẵn), phân tích cục bộ xác nhận lại
+            queries = plan_package_queries(query, self.analyzer.rule_engine.rules) if ORDER_QUERY_PUSHDOWN else None
+            logger.debug("Order queries: %s", queries or [query])
             
-            # Phân tích email
-            print(f"\n{Fore.YELLOW}🔬 Đang phân tích {len(emails)} email...")
-            analyzed_emails = self.analyze_emails(emails)
+            # Lấy và phân tích email theo từng trang, chỉ giữ lại email liên quan đến đơn hàng
+            print(f"\n{Fore.YELLOW}🔬 Đang lấy và phân tích email...")
+            emails = self.fetcher.iter_emails_any(queries or [query], limit=max_results,
+                                                  body_filter=self.analyzer.needs_body)
             
-            # Lọc chỉ email liên quan đến đơn hàng
+            # Email không có tiêu đề đơn hàng chỉ được phân tích trên headers (không tải body),
+            # nên chỉ đếm tổng, không hiển thị COMPLETE/ERROR hay từ khóa của chúng
             package_emails = []
-            for email in analyzed_emails:
-                status = email.get('status', '')
-                if status in ['PACKAGE_SUCCESS', 'PACKAGE_FAILED']:
+            total = 0
+            for email in self.analyzer.iter_analyze_emails(emails):
+                total += 1
+                if email.get('status', '') in ['PACKAGE_SUCCESS', 'PACKAGE_FAILED']:
                     package_emails.append(email)
             
+            if total == 0:
+                print(f"{Fore.YELLOW}⚠️ Không tìm thấy email đơn hàng nào trong khoảng thời gian này")
+                return
+            
+            # Khi có quy tắc được đẩy lên query, đây chỉ là các email có tiêu đề khớp quy tắc đơn hàng
+            candidates = "email có tiêu đề khớp quy tắc đơn hàng" if queries else "email"
+            print(f"{Fore.GREEN}✅ Đã phân tích {total} {candidates}")
+            self._display_api_stats()
+            
             if package_emails:
                 print(f"\n{Fore.GREEN}📦 Tìm thấy {len(package_emails)} email liên quan đến đơn hàng:")
                 self.display_emails(package_emails, show_body=True)
@@ -752,6 +884,8 @@ class GmailTool:
                     print(f"{Fore.WHITE}4. Token mới sẽ được lưu tự động")
                     
                     # Reset authenticator để chuẩn bị cho lần đăng nhập mới
+                    if isinstance(self.fetcher, ConcurrentEmailFetcher):
+                        self.fetcher.close()
                     self.authenticator = GmailAuthenticator()
                     self.service = None
                     self.fetcher = None
@@ -768,14 +902,38 @@ class GmailTool:
             print(f"{Fore.WHITE}Tool sẽ tự động yêu cầu đăng nhập khi cần thiết.")
 
 
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Đọc tham số dòng lệnh"""
+    parser = argparse.ArgumentParser(description="Gmail Tool - phân tích email đơn hàng")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="Không dùng cache email trên ổ đĩa (luôn lấy lại từ Gmail)")
+    parser.add_argument('--sync', action='store_true',
+                        help="Đồng bộ hộp thư vào cache trước khi chạy (tăng dần theo historyId)")
+    parser.add_argument('--resume', action='store_true',
+                        help="Tìm kiếm order: bỏ qua các order đã xử lý ở lần chạy trước bị dừng giữa chừng")
+    parser.add_argument('--log-level', default=LOG_LEVEL, type=str.upper,
+                        choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                        help="Mức log chung (mặc định: %(default)s)")
+    parser.add_argument('--log-json', metavar='FILE', default=LOG_JSON_FILE,
+                        help="Ghi thêm log dạng JSON (mỗi dòng một bản ghi) vào FILE")
+    parser.add_argument('--verbose', metavar='MODULE', action='append', default=[],
+                        help="Bật log debug cho một module, ví dụ --verbose content_analyzer (dùng nhiều lần được)")
+    return parser.parse_args(argv)
+
+
 def main():
     """Hàm main để chạy tool"""
-    tool = GmailTool()
+    args = parse_args()
+    setup_logging(args.log_level, args.log_json, {module: 'DEBUG' for module in args.verbose})
+    tool = GmailTool(use_cache=not args.no_cache, resume=args.resume)
     
     # Khởi tạo tool
     if not tool.initialize():
         sys.exit(1)
     
+    if args.sync:
+        tool.sync_mailbox()
+    
     # Chạy chế độ tương tác
     tool.run_interactive_mode()
 
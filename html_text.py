@@ -0,0 +1,81 @@
+"""
+Module chuyển HTML thành text (bỏ style/script, decode entity, gộp khoảng trắng)
+"""
+from html.parser import HTMLParser
+from typing import List, Optional
+from config import HTML_TEXT_MAX_CHARS
+
+# Nội dung trong các thẻ này không phải text hiển thị
+SKIP_TAGS = {'style', 'script'}
+
+# Các thẻ tạo ngắt dòng/ô, cần chèn khoảng trắng để chữ hai bên không dính vào nhau
+BREAK_TAGS = {
+    'br', 'p', 'div', 'tr', 'td', 'th', 'li', 'table', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+    'hr', 'blockquote', 'section', 'header', 'footer',
+}
+
+FEED_CHUNK_SIZE = 8192
+
+
+class _HTMLTextExtractor(HTMLParser):
+    def __init__(self, max_chars: Optional[int] = None):
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self.parts: List[str] = []
+        self.length = 0
+        self.skip_depth = 0
+        self.done = False
+    
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIP_TAGS:
+            self.skip_depth += 1
+        elif tag in BREAK_TAGS:
+            self.parts.append(' ')
+    
+    def handle_startendtag(self, tag, attrs):
+        if tag in BREAK_TAGS:
+            self.parts.append(' ')
+    
+    def handle_endtag(self, tag):
+        if tag in SKIP_TAGS:
+            self.skip_depth = max(0, self.skip_depth - 1)
+        elif tag in BREAK_TAGS:
+            self.parts.append(' ')
+    
+    def handle_data(self, data):
+        if self.skip_depth or self.done:
+            return
+        
+        self.parts.append(data)
+        self.length += len(data)
+        if self.max_chars is not None and self.length >= self.max_chars:
+            self.done = True
+
+
+def html_to_text(html: str, max_chars: Optional[int] = HTML_TEXT_MAX_CHARS) -> str:
+    """
+    Chuyển nội dung HTML thành text để phân tích
+    
+    HTML được đưa vào parser theo từng đoạn và dừng ngay khi đã đủ max_chars
+    ký tự text, nên email marketing lớn không phải parse hết.
+    
+    Args:
+        html: Nội dung HTML
+        max_chars: Số ký tự text tối đa cần lấy (None = không giới hạn)
+        
+    Returns:
+        Text đã bỏ thẻ, bỏ style/script, decode entity và gộp khoảng trắng
+    """
+    parser = _HTMLTextExtractor(max_chars)
+    
+    for start in range(0, len(html), FEED_CHUNK_SIZE):
+        parser.feed(html[start:start + FEED_CHUNK_SIZE])
+        if parser.done:
+            break
+    else:
+        parser.close()
+    
+    text = ' '.join(''.join(parser.parts).split())
+    if max_chars is not None:
+        text = text[:max_chars]
+    return text
@@ -0,0 +1,121 @@
+"""
+Module tìm nhiều từ khóa trong một lần quét text (automaton Aho-Corasick)
+"""
+from collections import deque
+from typing import Dict, List, Tuple
+from config import KEYWORD_AUTOMATON_MIN_KEYWORDS
+
+
+class KeywordMatcher:
+    def __init__(self, categories: Dict[str, List[str]], min_automaton_keywords: int = KEYWORD_AUTOMATON_MIN_KEYWORDS):
+        """
+        Biên dịch các nhóm từ khóa (ví dụ {'complete': [...], 'error': [...]}) một lần
+        
+        Với nhiều từ khóa, text được quét đúng một lần bằng automaton Aho-Corasick
+        nên chi phí gần như không tăng theo số từ khóa. Với ít từ khóa, đếm bằng
+        str.count (chạy trong C) vẫn nhanh hơn vòng lặp Python của automaton, nên
+        automaton chỉ được dùng khi số từ khóa >= min_automaton_keywords. Hai
+        cách cho kết quả giống hệt nhau.
+        
+        Args:
+            categories: Dict tên nhóm -> danh sách từ khóa (không phân biệt hoa thường)
+            min_automaton_keywords: Số từ khóa (khác nhau) tối thiểu để dùng automaton
+        """
+        self.categories = {category: list(keywords) for category, keywords in categories.items()}
+        
+        # Mỗi từ khóa (chữ thường) chỉ được tìm một lần dù xuất hiện ở nhiều nhóm
+        self._patterns: List[str] = []
+        pattern_ids: Dict[str, int] = {}
+        self._entries: Dict[str, List[Tuple[str, int]]] = {}  # nhóm -> [(từ khóa gốc, pattern id)]
+        for category, keywords in self.categories.items():
+            entries = []
+            for keyword in keywords:
+                pattern = keyword.lower()
+                if not pattern:
+                    continue
+                if pattern not in pattern_ids:
+                    pattern_ids[pattern] = len(self._patterns)
+                    self._patterns.append(pattern)
+                entries.append((keyword, pattern_ids[pattern]))
+            self._entries[category] = entries
+        
+        self._use_automaton = len(self._patterns) >= max(1, min_automaton_keywords)
+        if self._use_automaton:
+            self._build_automaton()
+    
+    def scan(self, text: str) -> Dict[str, List[Tuple[str, int]]]:
+        """
+        Tìm mọi từ khóa trong text
+        
+        Số lần xuất hiện được đếm giống re.findall(re.escape(keyword), text):
+        các lần xuất hiện không chồng lên nhau của từng từ khóa.
+        
+        Args:
+            text: Text cần tìm (đã chuyển chữ thường)
+            
+        Returns:
+            Dict nhóm -> danh sách (từ khóa, số lần xuất hiện) của các từ khóa có
+            xuất hiện, theo thứ tự trong danh sách từ khóa của nhóm
+        """
+        counts = self._count_automaton(text) if self._use_automaton else [text.count(p) for p in self._patterns]
+        
+        return {
+            category: [(keyword, counts[pattern_id]) for keyword, pattern_id in entries if counts[pattern_id]]
+            for category, entries in self._entries.items()
+        }
+    
+    def _build_automaton(self):
+        """Dựng trie, failure link và bảng chuyển trạng thái đầy đủ (DFA)"""
+        goto: List[Dict[str, int]] = [{}]
+        outputs: List[List[int]] = [[]]
+        
+        for pattern_id, pattern in enumerate(self._patterns):
+            state = 0
+            for char in pattern:
+                next_state = goto[state].get(char)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto.append({})
+                    outputs.append([])
+                    goto[state][char] = next_state
+                state = next_state
+            outputs[state].append(pattern_id)
+        
+        # Duyệt theo chiều rộng: failure link của một trạng thái luôn nông hơn nó,
+        # nên bảng chuyển của trạng thái failure đã đầy đủ khi được dùng
+        fail = [0] * len(goto)
+        delta = [dict(transitions) for transitions in goto]
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, target in delta[fail[state]].items():
+                if char not in delta[state]:
+                    delta[state][char] = target
+            for char, child in goto[state].items():
+                fail[child] = delta[fail[state]].get(char, 0)
+                outputs[child] = outputs[child] + outputs[fail[child]]
+                queue.append(child)
+        
+        self._delta = delta
+        self._outputs = outputs
+        self._lengths = [len(pattern) for pattern in self._patterns]
+    
+    def _count_automaton(self, text: str) -> List[int]:
+        """Đếm số lần xuất hiện (không chồng nhau) của từng pattern trong một lần quét"""
+        delta = self._delta
+        outputs = self._outputs
+        lengths = self._lengths
+        counts = [0] * len(self._patterns)
+        next_start = [0] * len(self._patterns)
+        state = 0
+        
+        for index, char in enumerate(text):
+            state = delta[state].get(char, 0)
+            if outputs[state]:
+                for pattern_id in outputs[state]:
+                    # Chỉ tính lần xuất hiện bắt đầu sau lần trước của cùng từ khóa (như re.findall)
+                    if index - lengths[pattern_id] + 1 >= next_start[pattern_id]:
+                        counts[pattern_id] += 1
+                        next_start[pattern_id] = index + 1
+        
+        return counts
@@ -0,0 +1,103 @@
+"""
+Module cấu hình logging cho tool (mức log theo module, ghi log JSON tùy chọn)
+"""
+import json
+import logging
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, Iterator, Optional
+from config import LOG_LEVEL, LOG_JSON_FILE, LOG_MODULE_LEVELS
+
+# Các thuộc tính có sẵn của LogRecord; thuộc tính khác được coi là dữ liệu thêm (extra=...)
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+# Handler và mức log theo module do setup_logging đặt, được gỡ khi cấu hình lại
+_installed_handlers = []
+_configured_modules = set()
+
+
+class JsonFormatter(logging.Formatter):
+    """Định dạng mỗi bản ghi log thành một dòng JSON (dùng cho hệ thống thu thập log)"""
+    
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def setup_logging(level: str = LOG_LEVEL, json_file: Optional[str] = LOG_JSON_FILE,
+                  module_levels: Optional[Dict[str, str]] = None):
+    """
+    Cấu hình logging cho cả tiến trình
+    
+    Mặc định chỉ hiện cảnh báo/lỗi trên console, nên log debug (ví dụ của
+    ContentAnalyzer cho từng email) không tốn chi phí định dạng hay ghi ra màn hình.
+    
+    Args:
+        level: Mức log chung ('DEBUG', 'INFO', 'WARNING', ...)
+        json_file: Nếu có, ghi thêm mọi bản ghi log (theo mức đã cấu hình) vào
+            file này dưới dạng JSON, mỗi dòng một bản ghi
+        module_levels: Mức log riêng cho từng module, ví dụ {'content_analyzer': 'DEBUG'}
+            (mặc định LOG_MODULE_LEVELS trong config)
+    """
+    root = logging.getLogger()
+    for handler in _installed_handlers:
+        root.removeHandler(handler)
+        handler.close()
+    _installed_handlers.clear()
+    
+    console = logging.StreamHandler()
+    console.setFormatter(logging.Formatter('%(message)s'))
+    _installed_handlers.append(console)
+    
+    if json_file:
+        json_handler = logging.FileHandler(json_file, encoding='utf-8')
+        json_handler.setFormatter(JsonFormatter())
+        _installed_handlers.append(json_handler)
+    
+    for handler in _installed_handlers:
+        root.addHandler(handler)
+    root.setLevel(level.upper())
+    
+    for name in _configured_modules:
+        logging.getLogger(name).setLevel(logging.NOTSET)
+    _configured_modules.clear()
+    
+    levels = dict(LOG_MODULE_LEVELS)
+    levels.update(module_levels or {})
+    for name, module_level in levels.items():
+        logging.getLogger(name).setLevel(module_level.upper())
+        _configured_modules.add(name)
+
+
+@contextmanager
+def log_duration(logger: logging.Logger, message: str, *args, level: int = logging.DEBUG) -> Iterator[None]:
+    """
+    Ghi thời gian chạy của một đoạn code (chỉ đo khi mức log đang bật)
+    
+    Args:
+        logger: Logger của module
+        message: Mô tả (kiểu %-format, được nối thêm thời gian)
+        *args: Tham số cho message
+        level: Mức log
+    """
+    if not logger.isEnabledFor(level):
+        yield
+        return
+    
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        logger.log(level, message + ' (%.3fs)', *args, elapsed, extra={'duration': round(elapsed, 6)})
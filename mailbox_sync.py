@@ -0,0 +1,238 @@
+"""
+Module đồng bộ hộp thư tăng dần (incremental) bằng Gmail history API
+"""
+import logging
+from typing import List, Dict, Iterator, Optional, Set, Tuple
+from googleapiclient.errors import HttpError
+from config import SYNC_QUERY, LIST_PAGE_SIZE
+from email_fetcher import EmailFetcher
+from message_cache import MessageCache
+from order_index import OrderIndex
+
+logger = logging.getLogger(__name__)
+
+HISTORY_ID_KEY = 'history_id'
+
+
+class MailboxSync:
+    def __init__(self, service, fetcher: EmailFetcher, cache: MessageCache, index: Optional[OrderIndex] = None):
+        """
+        Khởi tạo engine đồng bộ
+        
+        Sau lần đồng bộ đầy đủ đầu tiên, historyId của hộp thư được lưu trong cache.
+        Các lần sau chỉ gọi users().history().list để lấy email được thêm/xóa.
+        History API không lọc theo query, nên query chỉ áp dụng cho lần đồng bộ
+        đầy đủ; đồng bộ tăng dần thêm mọi email mới của hộp thư.
+        
+        Args:
+            service: Gmail service object
+            fetcher: EmailFetcher dùng để tải email mới (phải dùng cùng cache)
+            cache: Cache SQLite đóng vai trò kho email cục bộ
+            index: Chỉ mục order number được cập nhật cùng lúc với kho email
+        """
+        self.service = service
+        self.fetcher = fetcher
+        self.cache = cache
+        self.index = index
+    
+    def sync(self, query: str = SYNC_QUERY) -> Dict[str, int]:
+        """
+        Đồng bộ hộp thư: tăng dần nếu đã có historyId, ngược lại đồng bộ đầy đủ
+        
+        Args:
+            query: Query dùng cho lần đồng bộ đầy đủ (không áp dụng cho đồng bộ tăng dần)
+        
+        Returns:
+            Dict thống kê: 'added', 'removed', 'failed' (số email không tải được),
+            'full_sync' (1 nếu đã đồng bộ đầy đủ)
+        """
+        history_id = self.cache.get_state(HISTORY_ID_KEY)
+        if not history_id:
+            return self.full_sync(query)
+        
+        # Cache đồng bộ từ trước khi có chỉ mục order, hoặc quy tắc phân tích đã đổi
+        # (trạng thái/quantity trong chỉ mục đã cũ) -> lập lại chỉ mục
+        if self.index is not None and not self.index.is_built():
+            logger.info("🗂️ Đang lập chỉ mục order cho email trong cache...")
+            self.index.build()
+        
+        try:
+            return self.incremental_sync(history_id)
+        except HttpError as e:
+            # historyId quá cũ (Gmail chỉ giữ lịch sử có hạn) -> đồng bộ lại từ đầu
+            if e.resp.status == 404:
+                logger.warning("⚠️ historyId đã hết hạn, đồng bộ lại toàn bộ hộp thư...")
+                return self.full_sync(query, purge=True)
+            raise
+    
+    def full_sync(self, query: str = SYNC_QUERY, purge: bool = False) -> Dict[str, int]:
+        """
+        Đồng bộ đầy đủ: tải mọi email khớp query vào kho cục bộ và lưu historyId
+        
+        historyId chỉ được lưu khi mọi email đều tải được; nếu không, lần đồng bộ
+        sau sẽ đồng bộ đầy đủ lại thay vì bỏ sót vĩnh viễn các email bị lỗi.
+        
+        Args:
+            query: Query để lọc email cần đồng bộ
+            purge: Xóa khỏi cache các email không còn trên server (dùng khi
+                historyId hết hạn, lúc đó không biết email nào đã bị xóa)
+        
+        Returns:
+            Dict thống kê đồng bộ
+        """
+        # Lấy historyId trước khi liệt kê để không bỏ sót thay đổi trong lúc đồng bộ
+        profile = self.fetcher.rate_limiter.execute(self.service.users().getProfile(userId='me'), 'getProfile')
+        history_id = str(profile['historyId'])
+        
+        logger.info("🔄 Đang đồng bộ đầy đủ hộp thư...")
+        removed = self._purge_deleted() if purge else 0
+        if self.index is not None:
+            # Lập lại chỉ mục từ đầu, không giữ dòng của email đã bị xóa trên server
+            self.index.clear()
+        
+        added = 0
+        failed_ids = []
+        for message_ids in self._iter_message_ids(query):
+            emails = self.fetcher.get_emails_by_ids(message_ids)
+            fetched_ids = {email['id'] for email in emails}
+            failed_ids.extend(message_id for message_id in message_ids if message_id not in fetched_ids)
+            added += self._add_emails(emails)
+        
+        if failed_ids:
+            # Thử lại một lần các email bị lỗi (quota, mạng, ...)
+            emails = self.fetcher.get_emails_by_ids(failed_ids)
+            fetched_ids = {email['id'] for email in emails}
+            failed_ids = [message_id for message_id in failed_ids if message_id not in fetched_ids]
+            added += self._add_emails(emails)
+        
+        if self.index is not None:
+            self.index.mark_built()
+        if failed_ids:
+            logger.warning("⚠️ Đã đồng bộ %d email, %d email bị lỗi; "
+                           "chưa lưu historyId, lần sau sẽ đồng bộ đầy đủ lại", added, len(failed_ids))
+        else:
+            self.cache.set_state(HISTORY_ID_KEY, history_id)
+            logger.info("✅ Đã đồng bộ %d email (historyId %s)", added, history_id)
+        return {'added': added, 'removed': removed, 'failed': len(failed_ids), 'full_sync': 1}
+    
+    def incremental_sync(self, start_history_id: str) -> Dict[str, int]:
+        """
+        Đồng bộ tăng dần từ start_history_id
+        
+        Args:
+            start_history_id: historyId của lần đồng bộ trước
+        
+        Returns:
+            Dict thống kê đồng bộ
+        
+        Raises:
+            HttpError: 404 nếu historyId đã hết hạn
+        """
+        added_ids, removed_ids, history_id = self._list_history(start_history_id)
+        
+        for message_id in removed_ids:
+            self.cache.delete(message_id)
+        if self.index is not None:
+            self.index.remove(removed_ids)
+        
+        new_ids = [message_id for message_id in added_ids if message_id not in removed_ids]
+        failed = 0
+        if new_ids:
+            new_emails = self.fetcher.get_emails_by_ids(new_ids)
+            failed = len(new_ids) - len(new_emails)
+            self._add_emails(new_emails)
+        
+        if failed:
+            # Giữ historyId cũ: lần sau duyệt lại cùng đoạn lịch sử (email đã tải lấy từ cache)
+            logger.warning("⚠️ Đồng bộ tăng dần: %d email bị lỗi, chưa lưu historyId mới", failed)
+        else:
+            self.cache.set_state(HISTORY_ID_KEY, history_id)
+            logger.info("✅ Đồng bộ tăng dần: +%d / -%d email (historyId %s)",
+                        len(new_ids), len(removed_ids), history_id)
+        return {'added': len(new_ids) - failed, 'removed': len(removed_ids), 'failed': failed, 'full_sync': 0}
+    
+    def _add_emails(self, emails: List[Dict]) -> int:
+        """Thêm email vừa tải vào chỉ mục, trả về số email"""
+        if self.index is not None:
+            self.index.add_emails(emails)
+        return len(emails)
+    
+    def _iter_message_ids(self, query: str, include_spam_trash: bool = False) -> Iterator[List[str]]:
+        """
+        Liệt kê message ID khớp query theo từng trang của messages().list
+        
+        Yields:
+            Danh sách message ID của mỗi trang
+        """
+        page_token = None
+        while True:
+            params = {'userId': 'me', 'q': query, 'maxResults': LIST_PAGE_SIZE, 'includeSpamTrash': include_spam_trash}
+            if page_token:
+                params['pageToken'] = page_token
+            
+            response = self.fetcher.rate_limiter.execute(self.service.users().messages().list(**params), 'messages.list')
+            message_ids = [message['id'] for message in response.get('messages', [])]
+            if message_ids:
+                yield message_ids
+            
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                break
+    
+    def _purge_deleted(self) -> int:
+        """
+        Xóa khỏi cache (kèm chỉ mục order và kết quả phân tích) các email không còn trên server
+        
+        Returns:
+            Số email đã xóa
+        """
+        existing = set()
+        for message_ids in self._iter_message_ids('', include_spam_trash=True):
+            existing.update(message_ids)
+        
+        deleted_ids = [message_id for message_id in self.cache.message_ids() if message_id not in existing]
+        for message_id in deleted_ids:
+            self.cache.delete(message_id)
+        if deleted_ids:
+            logger.info("🗑️ Đã xóa %d email không còn trên server khỏi cache", len(deleted_ids))
+        return len(deleted_ids)
+    
+    def _list_history(self, start_history_id: str) -> Tuple[List[str], Set[str], str]:
+        """
+        Duyệt toàn bộ các trang history kể từ start_history_id
+        
+        Returns:
+            Tuple (ID email được thêm theo thứ tự, tập ID email bị xóa, historyId mới nhất)
+        """
+        added_ids = []
+        seen = set()
+        removed_ids = set()
+        history_id = start_history_id
+        page_token = None
+        
+        while True:
+            params = {
+                'userId': 'me',
+                'startHistoryId': start_history_id,
+                'historyTypes': ['messageAdded', 'messageDeleted'],
+            }
+            if page_token:
+                params['pageToken'] = page_token
+            
+            response = self.fetcher.rate_limiter.execute(self.service.users().history().list(**params), 'history.list')
+            
+            for record in response.get('history', []):
+                for item in record.get('messagesAdded', []):
+                    message_id = item['message']['id']
+                    if message_id not in seen:
+                        seen.add(message_id)
+                        added_ids.append(message_id)
+                for item in record.get('messagesDeleted', []):
+                    removed_ids.add(item['message']['id'])
+            
+            history_id = str(response.get('historyId', history_id))
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                break
+        
+        return added_ids, removed_ids, history_id
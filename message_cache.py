@@ -0,0 +1,353 @@
+"""
+Module cache email đã parse trên ổ đĩa (SQLite), key theo Gmail message ID
+"""
+import json
+import sqlite3
+import threading
+import time
+from typing import List, Dict, Iterator, Optional, Tuple
+from config import CACHE_FILE, CACHE_MAX_SIZE_MB, CACHE_STORE_RAW
+
+
+class MessageCache:
+    def __init__(self, path: str = CACHE_FILE, max_size_mb: float = CACHE_MAX_SIZE_MB,
+                 store_raw: bool = CACHE_STORE_RAW):
+        """
+        Mở (hoặc tạo) cache SQLite
+        
+        Email Gmail không thay đổi sau khi được gửi, nên bản parse có thể dùng lại
+        giữa các lần chạy. Khi dung lượng vượt max_size_mb, các email ít được truy
+        cập gần đây nhất sẽ bị xóa (kèm kết quả phân tích của chúng).
+        
+        Args:
+            path: Đường dẫn file SQLite
+            max_size_mb: Dung lượng tối đa (MB) của dữ liệu email và kết quả phân tích trong cache
+            store_raw: Lưu cả Gmail message object gốc (payload) bên cạnh bản parse
+        """
+        self.path = path
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self.store_raw = store_raw
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS messages ('
+            ' id TEXT PRIMARY KEY,'
+            ' record TEXT NOT NULL,'
+            ' raw TEXT,'
+            ' size INTEGER NOT NULL,'
+            ' accessed REAL NOT NULL)'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_messages_accessed ON messages (accessed)')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS sync_state (key TEXT PRIMARY KEY, value TEXT)')
+        # Chỉ mục order number -> message ID (xem order_index.py); không bị xóa khi evict
+        # vì mỗi dòng đã chứa đủ trạng thái và quantity của email
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS order_index ('
+            ' token TEXT NOT NULL,'
+            ' message_id TEXT NOT NULL,'
+            ' timestamp INTEGER NOT NULL,'
+            ' status TEXT,'
+            ' quantity TEXT,'
+            ' PRIMARY KEY (token, message_id))'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_order_index_message ON order_index (message_id)')
+        # Kết quả phân tích email theo bộ quy tắc (xem ContentAnalyzer.ruleset_hash); full = 1 nếu
+        # email được phân tích cùng body. Email không đổi nên kết quả dùng lại được đến khi quy tắc đổi.
+        # Dung lượng kết quả được tính vào giới hạn cache và bị xóa cùng email khi evict
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS analysis_results ('
+            ' message_id TEXT NOT NULL,'
+            ' ruleset TEXT NOT NULL,'
+            ' full INTEGER NOT NULL,'
+            ' result TEXT NOT NULL,'
+            ' PRIMARY KEY (message_id, ruleset, full))'
+        )
+        self.conn.commit()
+        # Tổng dung lượng được theo dõi trong bộ nhớ để không phải SUM sau mỗi lần ghi
+        self._size = self._total_size()
+    
+    def get(self, message_id: str) -> Optional[Dict]:
+        """
+        Lấy email đã parse theo message ID
+        
+        Args:
+            message_id: Gmail message ID
+            
+        Returns:
+            Dict email nếu có trong cache, None nếu không
+        """
+        return self.get_many([message_id]).get(message_id)
+    
+    def get_many(self, message_ids: List[str]) -> Dict[str, Dict]:
+        """
+        Lấy nhiều email đã parse theo message ID
+        
+        Args:
+            message_ids: Danh sách Gmail message ID
+            
+        Returns:
+            Dict message ID -> email cho các email có trong cache
+        """
+        found = {}
+        if not message_ids:
+            return found
+        
+        with self._lock:
+            # SQLite giới hạn số tham số mỗi câu lệnh, nên chia nhỏ danh sách ID
+            for start in range(0, len(message_ids), 500):
+                chunk = message_ids[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self.conn.execute(
+                    f'SELECT id, record FROM messages WHERE id IN ({placeholders})', chunk
+                ).fetchall()
+                for message_id, record in rows:
+                    found[message_id] = json.loads(record)
+            
+            if found:
+                now = time.time()
+                self.conn.executemany(
+                    'UPDATE messages SET accessed = ? WHERE id = ?',
+                    [(now, message_id) for message_id in found]
+                )
+                self.conn.commit()
+        
+        return found
+    
+    def put(self, email_data: Dict, raw: Optional[Dict] = None):
+        """
+        Lưu email đã parse vào cache
+        
+        Args:
+            email_data: Email đã parse (dict hoặc EmailRecord, phải có 'id')
+            raw: Gmail message object gốc, chỉ lưu nếu store_raw=True
+        """
+        record = json.dumps(dict(email_data), ensure_ascii=False)
+        raw_text = json.dumps(raw, ensure_ascii=False) if (raw is not None and self.store_raw) else None
+        size = len(record) + (len(raw_text) if raw_text else 0)
+        
+        with self._lock:
+            old = self.conn.execute('SELECT size FROM messages WHERE id = ?', (email_data['id'],)).fetchone()
+            self.conn.execute(
+                'INSERT OR REPLACE INTO messages (id, record, raw, size, accessed) VALUES (?, ?, ?, ?, ?)',
+                (email_data['id'], record, raw_text, size, time.time())
+            )
+            self.conn.commit()
+            self._size += size - (old[0] if old else 0)
+            self._evict_if_needed()
+    
+    def get_raw(self, message_id: str) -> Optional[Dict]:
+        """Lấy Gmail message object gốc (nếu đã lưu)"""
+        with self._lock:
+            row = self.conn.execute('SELECT raw FROM messages WHERE id = ?', (message_id,)).fetchone()
+        if row and row[0]:
+            return json.loads(row[0])
+        return None
+    
+    def iter_records(self, chunk_size: int = 500) -> Iterator[Dict]:
+        """
+        Duyệt toàn bộ email đã parse trong cache (đọc theo từng nhóm)
+        
+        Args:
+            chunk_size: Số email đọc mỗi lần
+            
+        Yields:
+            Từng dict email
+        """
+        last_id = ''
+        while True:
+            with self._lock:
+                rows = self.conn.execute(
+                    'SELECT id, record FROM messages WHERE id > ? ORDER BY id LIMIT ?', (last_id, chunk_size)
+                ).fetchall()
+            if not rows:
+                return
+            for message_id, record in rows:
+                yield json.loads(record)
+            last_id = rows[-1][0]
+    
+    def message_ids(self) -> List[str]:
+        """Danh sách message ID của mọi email trong cache"""
+        with self._lock:
+            return [row[0] for row in self.conn.execute('SELECT id FROM messages').fetchall()]
+    
+    def delete(self, message_id: str):
+        """Xóa một email khỏi cache (kể cả chỉ mục order và kết quả phân tích của email đó)"""
+        with self._lock:
+            old = self.conn.execute('SELECT size FROM messages WHERE id = ?', (message_id,)).fetchone()
+            old_results = self.conn.execute(
+                'SELECT COALESCE(SUM(LENGTH(result)), 0) FROM analysis_results WHERE message_id = ?', (message_id,)
+            ).fetchone()[0]
+            self.conn.execute('DELETE FROM messages WHERE id = ?', (message_id,))
+            self.conn.execute('DELETE FROM order_index WHERE message_id = ?', (message_id,))
+            self.conn.execute('DELETE FROM analysis_results WHERE message_id = ?', (message_id,))
+            self.conn.commit()
+            self._size -= (old[0] if old else 0) + old_results
+    
+    def get_state(self, key: str) -> Optional[str]:
+        """
+        Đọc một giá trị trạng thái đồng bộ (ví dụ historyId)
+        
+        Args:
+            key: Tên trạng thái
+            
+        Returns:
+            Giá trị đã lưu, None nếu chưa có
+        """
+        with self._lock:
+            row = self.conn.execute('SELECT value FROM sync_state WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+    
+    def set_state(self, key: str, value: Optional[str]):
+        """
+        Lưu một giá trị trạng thái đồng bộ (None = xóa)
+        
+        Args:
+            key: Tên trạng thái
+            value: Giá trị cần lưu
+        """
+        with self._lock:
+            if value is None:
+                self.conn.execute('DELETE FROM sync_state WHERE key = ?', (key,))
+            else:
+                self.conn.execute('INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)', (key, value))
+            self.conn.commit()
+    
+    def put_order_tokens(self, message_id: str, entries: List[Tuple[str, int, str, str]]):
+        """
+        Ghi (thay thế) các dòng chỉ mục order của một email
+        
+        Args:
+            message_id: Gmail message ID
+            entries: Danh sách (token, timestamp, status, quantity)
+        """
+        with self._lock:
+            self.conn.execute('DELETE FROM order_index WHERE message_id = ?', (message_id,))
+            self.conn.executemany(
+                'INSERT INTO order_index (token, message_id, timestamp, status, quantity) VALUES (?, ?, ?, ?, ?)',
+                [(token, message_id, timestamp, status, quantity) for token, timestamp, status, quantity in entries]
+            )
+            self.conn.commit()
+    
+    def clear_order_tokens(self):
+        """Xóa toàn bộ chỉ mục order"""
+        with self._lock:
+            self.conn.execute('DELETE FROM order_index')
+            self.conn.commit()
+    
+    def load_order_tokens(self) -> List[Tuple[str, str, int, str, str]]:
+        """
+        Đọc toàn bộ chỉ mục order
+        
+        Returns:
+            Danh sách (token, message_id, timestamp, status, quantity)
+        """
+        with self._lock:
+            return self.conn.execute(
+                'SELECT token, message_id, timestamp, status, quantity FROM order_index'
+            ).fetchall()
+    
+    def get_analyses(self, ruleset: str, keys: List[Tuple[str, bool]]) -> Dict[Tuple[str, bool], List]:
+        """
+        Lấy kết quả phân tích đã lưu của nhiều email
+        
+        Args:
+            ruleset: Hash bộ quy tắc phân tích
+            keys: Danh sách (message ID, có body hay không)
+            
+        Returns:
+            Dict (message ID, có body) -> kết quả đã lưu, cho các email có kết quả
+        """
+        found = {}
+        message_ids = list({message_id for message_id, _ in keys})
+        wanted = set(keys)
+        
+        with self._lock:
+            for start in range(0, len(message_ids), 500):
+                chunk = message_ids[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self.conn.execute(
+                    f'SELECT message_id, full, result FROM analysis_results'
+                    f' WHERE ruleset = ? AND message_id IN ({placeholders})', [ruleset] + chunk
+                ).fetchall()
+                for message_id, full, result in rows:
+                    key = (message_id, bool(full))
+                    if key in wanted:
+                        found[key] = json.loads(result)
+        
+        return found
+    
+    def put_analyses(self, ruleset: str, results: List[Tuple[str, bool, List]]):
+        """
+        Lưu kết quả phân tích của nhiều email (một transaction)
+        
+        Args:
+            ruleset: Hash bộ quy tắc phân tích
+            results: Danh sách (message ID, có body hay không, kết quả)
+        """
+        if not results:
+            return
+        with self._lock:
+            # Kết quả của cùng (email, bộ quy tắc) không đổi nên dòng đã có được giữ nguyên
+            added = 0
+            for message_id, full, result in results:
+                encoded = json.dumps(result, ensure_ascii=False)
+                cursor = self.conn.execute(
+                    'INSERT OR IGNORE INTO analysis_results (message_id, ruleset, full, result) VALUES (?, ?, ?, ?)',
+                    (message_id, ruleset, int(full), encoded)
+                )
+                if cursor.rowcount > 0:
+                    added += len(encoded)
+            self.conn.commit()
+            self._size += added
+            self._evict_if_needed()
+    
+    def prune_analyses(self, ruleset: str):
+        """Xóa kết quả phân tích của các bộ quy tắc khác (đã lỗi thời)"""
+        with self._lock:
+            self.conn.execute('DELETE FROM analysis_results WHERE ruleset != ?', (ruleset,))
+            self.conn.commit()
+            self._size = self._total_size()
+    
+    def total_size(self) -> int:
+        """Tổng dung lượng (bytes) dữ liệu email và kết quả phân tích trong cache"""
+        with self._lock:
+            return self._size
+    
+    def _total_size(self) -> int:
+        messages = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM messages').fetchone()[0]
+        results = self.conn.execute('SELECT COALESCE(SUM(LENGTH(result)), 0) FROM analysis_results').fetchone()[0]
+        return messages + results
+    
+    def _evict_if_needed(self):
+        """Xóa các email truy cập lâu nhất khi cache vượt dung lượng (gọi khi đã giữ lock)"""
+        if self._size <= self.max_size_bytes:
+            return
+        
+        # Xóa xuống còn 90% dung lượng để không phải evict sau mỗi lần ghi. Kết quả phân tích của
+        # email không nằm trong cache (email chỉ lấy headers) được xóa trước vì tính lại rẻ nhất
+        target = int(self.max_size_bytes * 0.9)
+        self.conn.execute('DELETE FROM analysis_results WHERE message_id NOT IN (SELECT id FROM messages)')
+        total = self._total_size()
+        
+        if total > target:
+            result_sizes = dict(self.conn.execute(
+                'SELECT message_id, SUM(LENGTH(result)) FROM analysis_results GROUP BY message_id'
+            ).fetchall())
+            rows = self.conn.execute('SELECT id, size FROM messages ORDER BY accessed ASC').fetchall()
+            to_delete = []
+            for message_id, size in rows:
+                if total <= target:
+                    break
+                to_delete.append((message_id,))
+                total -= size + result_sizes.get(message_id, 0)
+            
+            self.conn.executemany('DELETE FROM messages WHERE id = ?', to_delete)
+            self.conn.executemany('DELETE FROM analysis_results WHERE message_id = ?', to_delete)
+        
+        self.conn.commit()
+        self._size = total
+    
+    def close(self):
+        """Đóng kết nối SQLite"""
+        with self._lock:
+            self.conn.close()
@@ -0,0 +1,142 @@
+"""
+Module chỉ mục order number -> email trong kho email cục bộ (cache SQLite)
+"""
+import re
+import threading
+from typing import List, Dict, Iterable, Optional, Set
+from content_analyzer import ContentAnalyzer
+from message_cache import MessageCache
+
+# Token giống order number: chuỗi số có ít nhất 10 chữ số (cùng pattern cuối của extract_order_number)
+ORDER_TOKEN_PATTERN = re.compile(r'(?<![0-9])([0-9]{10,})(?![0-9])')
+
+INDEX_BUILT_KEY = 'order_index_built'
+
+
+class OrderIndex:
+    def __init__(self, cache: MessageCache, analyzer: Optional[ContentAnalyzer] = None):
+        """
+        Nạp chỉ mục order number -> email từ cache vào bộ nhớ
+        
+        Mỗi email trong kho cục bộ được phân tích một lần khi đồng bộ; các token
+        order (kết quả extract_order_number và mọi chuỗi số >= 10 chữ số) được
+        lưu kèm trạng thái và quantity. Tìm order khi đó chỉ là tra dict thay vì
+        một lần tìm kiếm Gmail. Chỉ mục gắn với hash bộ quy tắc phân tích lúc lập
+        chỉ mục, nên hết hiệu lực khi quy tắc hoặc từ khóa thay đổi.
+        
+        Args:
+            cache: Cache SQLite chứa email và bảng chỉ mục
+            analyzer: ContentAnalyzer dùng để phân tích email (mặc định tạo mới)
+        """
+        self.cache = cache
+        self.analyzer = analyzer or ContentAnalyzer()
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Dict]] = {}   # token -> message ID -> entry
+        self._tokens: Dict[str, Set[str]] = {}           # message ID -> các token của email
+        self._built_ruleset = cache.get_state(INDEX_BUILT_KEY)
+        
+        for token, message_id, timestamp, status, quantity in cache.load_order_tokens():
+            self._insert(token, message_id, timestamp, status, quantity)
+    
+    def lookup(self, order_number: str) -> List[Dict]:
+        """
+        Tra các email chứa order number
+        
+        Args:
+            order_number: Order number cần tìm
+            
+        Returns:
+            Danh sách {'id', 'timestamp', 'status', 'quantity'}, mới nhất trước
+            (rỗng nếu order không có trong chỉ mục)
+        """
+        with self._lock:
+            entries = list(self._entries.get(order_number, {}).values())
+        return sorted(entries, key=lambda entry: entry['timestamp'], reverse=True)
+    
+    def add_email(self, email: Dict):
+        """
+        Phân tích một email và thêm các token order của nó vào chỉ mục
+        
+        Args:
+            email: Email đầy đủ (có body)
+        """
+        analyzed = self.analyzer.analyze_email(email)
+        content = ' '.join([analyzed.get('subject', ''), analyzed.get('snippet', ''), analyzed.get('body', '')])
+        tokens = set(ORDER_TOKEN_PATTERN.findall(content))
+        if analyzed.get('order_number'):
+            tokens.add(analyzed['order_number'])
+        
+        message_id = analyzed['id']
+        timestamp = int(analyzed.get('timestamp') or 0)
+        status = analyzed.get('status', '')
+        quantity = analyzed.get('quantity', '')
+        
+        self.cache.put_order_tokens(message_id, [(token, timestamp, status, quantity) for token in tokens])
+        
+        with self._lock:
+            self._discard(message_id)
+            for token in tokens:
+                self._insert(token, message_id, timestamp, status, quantity)
+    
+    def add_emails(self, emails: Iterable[Dict]):
+        """Thêm nhiều email vào chỉ mục"""
+        for email in emails:
+            self.add_email(email)
+    
+    def remove(self, message_ids: Iterable[str]):
+        """
+        Bỏ các email đã bị xóa khỏi hộp thư ra khỏi chỉ mục trong bộ nhớ
+        
+        (Các dòng trong SQLite được xóa cùng email bởi MessageCache.delete)
+        
+        Args:
+            message_ids: Danh sách Gmail message ID
+        """
+        with self._lock:
+            for message_id in message_ids:
+                self._discard(message_id)
+    
+    def is_built(self) -> bool:
+        """Kiểm tra chỉ mục đã bao phủ toàn bộ email trong cache với bộ quy tắc phân tích hiện tại chưa"""
+        return self._built_ruleset is not None and self._built_ruleset == self.analyzer.ruleset_hash()
+    
+    def mark_built(self):
+        """Đánh dấu chỉ mục đã bao phủ toàn bộ email trong cache (lưu hash bộ quy tắc hiện tại)"""
+        ruleset = self.analyzer.ruleset_hash()
+        self.cache.set_state(INDEX_BUILT_KEY, ruleset)
+        self._built_ruleset = ruleset
+    
+    def clear(self):
+        """Xóa toàn bộ chỉ mục (trong bộ nhớ và trong SQLite)"""
+        self.cache.clear_order_tokens()
+        self.cache.set_state(INDEX_BUILT_KEY, None)
+        with self._lock:
+            self._built_ruleset = None
+            self._entries.clear()
+            self._tokens.clear()
+    
+    def build(self):
+        """Lập lại chỉ mục cho toàn bộ email đang có trong cache (cache có từ trước hoặc quy tắc đã đổi)"""
+        self.clear()
+        self.add_emails(self.cache.iter_records())
+        self.mark_built()
+    
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+    
+    def _insert(self, token: str, message_id: str, timestamp: int, status: str, quantity: str):
+        """Thêm một dòng chỉ mục vào bộ nhớ"""
+        self._entries.setdefault(token, {})[message_id] = {
+            'id': message_id, 'timestamp': timestamp, 'status': status, 'quantity': quantity,
+        }
+        self._tokens.setdefault(message_id, set()).add(token)
+    
+    def _discard(self, message_id: str):
+        """Xóa message_id khỏi mọi token (gọi khi đã giữ lock)"""
+        for token in self._tokens.pop(message_id, ()):
+            messages = self._entries.get(token)
+            if messages is not None:
+                messages.pop(message_id, None)
+                if not messages:
+                    del self._entries[token]
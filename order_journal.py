@@ -0,0 +1,88 @@
+"""
+Module ghi nhật ký (journal) kết quả tìm kiếm order để có thể chạy tiếp khi bị dừng
+"""
+import json
+import os
+import threading
+from typing import Dict
+from config import ORDER_JOURNAL_FILE
+from order_resolver import ORDER_ERROR
+
+
+class OrderJournal:
+    def __init__(self, path: str = ORDER_JOURNAL_FILE):
+        """
+        Khởi tạo journal dạng JSONL (mỗi dòng là kết quả của một order)
+        
+        Mỗi kết quả được ghi thêm vào cuối file và fsync ngay, nên tiến trình có
+        thể bị dừng bất cứ lúc nào mà không mất các order đã xử lý xong.
+        
+        Args:
+            path: Đường dẫn file journal
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._checked_tail = False
+    
+    def load(self) -> Dict[str, Dict]:
+        """
+        Đọc các kết quả đã ghi
+        
+        Dòng cuối bị ghi dở (do tiến trình bị dừng giữa chừng) và kết quả lỗi
+        (ORDER_ERROR) được bỏ qua, nên các order đó được tìm lại khi --resume.
+        
+        Returns:
+            Dict order number -> kết quả {'order', 'status', 'quantity'}
+        """
+        results = {}
+        if not os.path.exists(self.path):
+            return results
+        
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    result = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(result, dict) and 'order' in result and result.get('status') != ORDER_ERROR:
+                    results[result['order']] = result
+        
+        return results
+    
+    def record(self, result: Dict):
+        """
+        Ghi kết quả của một order vào cuối journal (kết quả lỗi ORDER_ERROR không được ghi)
+        
+        Args:
+            result: Kết quả {'order', 'status', 'quantity'}
+        """
+        if result.get('status') == ORDER_ERROR:
+            return
+        
+        line = json.dumps(result, ensure_ascii=False) + '\n'
+        
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                # Lần ghi đầu: nếu dòng cuối bị ghi dở, bắt đầu dòng mới để không làm hỏng bản ghi này
+                if not self._checked_tail:
+                    if f.tell() > 0 and not self._ends_with_newline():
+                        f.write('\n')
+                    self._checked_tail = True
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+    
+    def reset(self):
+        """Xóa journal để bắt đầu lượt tìm kiếm mới"""
+        with self._lock:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            self._checked_tail = False
+    
+    def _ends_with_newline(self) -> bool:
+        with open(self.path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b'\n'
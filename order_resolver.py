@@ -0,0 +1,293 @@
+"""
+Module xác định trạng thái đơn hàng (SUCCESS/FAILED) từ order number
+"""
+import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Iterable, Optional, Callable
+from config import ORDER_SEARCH_MAX_EMAILS, ORDER_QUERY_MAX_LENGTH, ORDER_SEARCH_WORKERS, ORDER_FETCH_CHUNK_SIZE
+from content_analyzer import ContentAnalyzer
+from email_fetcher import EmailFetcher
+from order_index import OrderIndex
+
+logger = logging.getLogger(__name__)
+
+# Trạng thái kết quả của một order
+ORDER_SUCCESS = 'PACKAGE_SUCCESS'
+ORDER_FAILED = 'PACKAGE_FAILED'
+ORDER_UNKNOWN = 'UNKNOWN'      # Có email nhưng không xác định được trạng thái
+ORDER_NOT_FOUND = 'NOT_FOUND'  # Không có email nào chứa order number
+ORDER_ERROR = 'ERROR'          # Lỗi khi tìm (quota, mạng, ...), chưa có kết quả, cần tìm lại
+
+
+class OrderResolver:
+    def __init__(self, fetcher: EmailFetcher, analyzer: Optional[ContentAnalyzer] = None,
+                 max_emails: int = ORDER_SEARCH_MAX_EMAILS,
+                 fetcher_factory: Optional[Callable[[], EmailFetcher]] = None,
+                 workers: int = ORDER_SEARCH_WORKERS,
+                 index: Optional[OrderIndex] = None):
+        """
+        Khởi tạo resolver
+        
+        Args:
+            fetcher: EmailFetcher dùng để tìm email
+            analyzer: ContentAnalyzer dùng chung (mặc định tạo mới)
+            max_emails: Số email mới nhất tối đa xét cho mỗi order
+            fetcher_factory: Hàm tạo EmailFetcher riêng cho mỗi worker thread (Gmail
+                service không thread-safe). Không có thì chỉ chạy tuần tự.
+            workers: Số order được xử lý song song tối đa
+            index: Chỉ mục order cục bộ, được tra trước khi gọi Gmail API
+        """
+        self.fetcher = fetcher
+        self.analyzer = analyzer or ContentAnalyzer()
+        self.max_emails = max_emails
+        self.fetcher_factory = fetcher_factory
+        self.workers = max(1, workers) if fetcher_factory else 1
+        self.index = index
+        self._local = threading.local()
+    
+    def resolve(self, order_number: str, fetcher: Optional[EmailFetcher] = None) -> Dict:
+        """
+        Tìm trạng thái một order: tra chỉ mục cục bộ trước, nếu không có kết quả
+        quyết định thì dùng một Gmail query riêng
+        
+        Args:
+            order_number: Order number cần tìm
+            fetcher: EmailFetcher dùng cho lần tìm này (mặc định self.fetcher)
+        
+        Returns:
+            Dict {'order', 'status', 'quantity'}
+        """
+        indexed = self._resolve_from_index(order_number)
+        if indexed:
+            return indexed
+        
+        # Email được tải lần lượt (mới nhất trước) và chỉ khi email trước chưa quyết định
+        # được trạng thái, nên thường chỉ cần tải một email cho mỗi order
+        fetcher = fetcher or self.fetcher
+        emails = None
+        try:
+            # strict: email lỗi không được bỏ qua (nếu không order sẽ thành NOT_FOUND/UNKNOWN sai)
+            emails = fetcher.iter_emails(query=order_number, limit=self.max_emails,
+                                         chunk_size=ORDER_FETCH_CHUNK_SIZE, strict=True)
+            # Tra result_cache từng email một để không tải trước email khi đã quyết định được
+            analyzed = self.analyzer.iter_analyze_emails(emails, keep_body=False, lookup_batch_size=1)
+            return self._decide(order_number, analyzed)
+        except Exception as e:
+            # Lỗi (quota, mạng, ...) không có nghĩa là không có email: trả về ERROR để order được tìm lại
+            logger.error("❌ Lỗi khi lấy email cho order %s: %s", order_number, e)
+            return {'order': order_number, 'status': ORDER_ERROR, 'quantity': ''}
+        finally:
+            # Dừng generator ngay, không tải thêm email nào
+            if emails is not None:
+                emails.close()
+    
+    def resolve_batch(self, order_numbers: List[str],
+                      on_result: Optional[Callable[[Dict], None]] = None) -> List[Dict]:
+        """
+        Tìm trạng thái nhiều order bằng ít Gmail query nhất có thể
+        
+        Các order number được gộp vào query dạng {123 456 ...} (OR), chia nhóm để
+        query không vượt ORDER_QUERY_MAX_LENGTH. Mỗi email trong kết quả được gán
+        lại cho các order mà nó chứa (dựa trên extract_order_number và tìm order
+        number trong nội dung). Order không gán được email nào sẽ được tìm lại
+        bằng query riêng để kết quả giống hệt cách tìm từng order.
+        
+        Args:
+            order_numbers: Danh sách order number (giữ nguyên thứ tự)
+            on_result: Hàm được gọi ngay khi mỗi order có kết quả (ví dụ ghi journal)
+        
+        Returns:
+            List kết quả theo thứ tự của order_numbers
+        """
+        results = {}
+        remote_orders = []
+        
+        for order_number in dict.fromkeys(order_numbers):
+            indexed = self._resolve_from_index(order_number)
+            if indexed:
+                results[order_number] = indexed
+                if on_result:
+                    on_result(indexed)
+            else:
+                remote_orders.append(order_number)
+        
+        for chunk in self._chunk_orders(remote_orders):
+            try:
+                emails_by_order = self._fetch_chunk(chunk)
+            except Exception as e:
+                logger.warning("⚠️ Lỗi khi tìm nhóm %d order, chuyển sang tìm từng order: %s", len(chunk), e)
+                emails_by_order = {}
+            
+            fallback_orders = []
+            for order_number in chunk:
+                emails = emails_by_order.get(order_number)
+                if emails:
+                    results[order_number] = self._decide(order_number, emails)
+                    if on_result:
+                        on_result(results[order_number])
+                else:
+                    fallback_orders.append(order_number)
+            
+            for result in self.resolve_many(fallback_orders, show_progress=False, on_result=on_result):
+                results[result['order']] = result
+        
+        return [dict(results[order_number]) for order_number in order_numbers]
+    
+    def resolve_many(self, order_numbers: List[str], show_progress: bool = True,
+                     on_result: Optional[Callable[[Dict], None]] = None) -> List[Dict]:
+        """
+        Tìm trạng thái nhiều order (mỗi order một query), chạy song song tối đa
+        self.workers order cùng lúc
+        
+        Args:
+            order_numbers: Danh sách order number
+            show_progress: In tiến trình (số order/giây)
+            on_result: Hàm được gọi ngay khi mỗi order có kết quả
+        
+        Returns:
+            List kết quả theo đúng thứ tự của order_numbers
+        """
+        total = len(order_numbers)
+        results = [None] * total
+        started = time.monotonic()
+        
+        if self.workers <= 1 or total <= 1:
+            for index, order_number in enumerate(order_numbers):
+                results[index] = self.resolve(order_number)
+                if on_result:
+                    on_result(results[index])
+                if show_progress:
+                    self._print_progress(index + 1, total, started)
+            return results
+        
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='order-resolve') as executor:
+            futures = {
+                executor.submit(self._resolve_in_worker, order_number): index
+                for index, order_number in enumerate(order_numbers)
+            }
+            for done, future in enumerate(as_completed(futures), 1):
+                results[futures[future]] = future.result()
+                if on_result:
+                    on_result(results[futures[future]])
+                if show_progress:
+                    self._print_progress(done, total, started)
+        
+        return results
+    
+    def _resolve_from_index(self, order_number: str) -> Optional[Dict]:
+        """
+        Tra order trong chỉ mục cục bộ
+        
+        Returns:
+            Kết quả nếu chỉ mục có email quyết định (SUCCESS/FAILED), None nếu
+            cần tìm qua Gmail API (kể cả khi chỉ mục được lập với bộ quy tắc cũ)
+        """
+        if self.index is None or not self.index.is_built():
+            return None
+        
+        result = self._decide(order_number, self.index.lookup(order_number)[:self.max_emails])
+        if result['status'] in (ORDER_SUCCESS, ORDER_FAILED):
+            return result
+        return None
+    
+    def _resolve_in_worker(self, order_number: str) -> Dict:
+        """Tìm một order trong worker thread, dùng fetcher riêng của thread"""
+        fetcher = getattr(self._local, 'fetcher', None)
+        if fetcher is None:
+            fetcher = self.fetcher_factory()
+            self._local.fetcher = fetcher
+        return self.resolve(order_number, fetcher)
+    
+    def _print_progress(self, done: int, total: int, started: float):
+        """Ghi log tiến trình sau mỗi 10 order và khi hoàn thành"""
+        if done % 10 and done != total:
+            return
+        elapsed = max(time.monotonic() - started, 1e-6)
+        logger.info("   ⏱️ Đã xử lý %d/%d order (%.1f order/giây)", done, total, done / elapsed)
+    
+    def _fetch_chunk(self, chunk: List[str]) -> Dict[str, List[Dict]]:
+        """
+        Lấy hợp các email khớp một nhóm order và gán email về từng order
+        
+        Query hợp được giới hạn max_emails * số order. Nếu chạm giới hạn, email
+        cũ hơn chưa được tải nên chỉ giữ order đã có email quyết định hoặc đủ
+        max_emails email; các order còn lại được tìm lại bằng query riêng.
+        
+        Returns:
+            Dict order number -> email đã phân tích (mới nhất trước, tối đa max_emails)
+        """
+        query = '{' + ' '.join(chunk) + '}'
+        wanted = set(chunk)
+        order_pattern = re.compile(
+            r'(?<![0-9A-Za-z])(' + '|'.join(re.escape(order) for order in chunk) + r')(?![0-9A-Za-z])'
+        )
+        emails_by_order = {}
+        limit = self.max_emails * len(chunk)
+        fetched = 0
+        
+        # Tải cả body cho mọi email: order number có thể chỉ nằm trong body (không tải thì không gán được)
+        emails = self.fetcher.iter_emails(query=query, limit=limit, strict=True)
+        for email in self.analyzer.iter_analyze_emails(emails):
+            fetched += 1
+            content = ' '.join([email.get('subject', ''), email.get('snippet', ''), email.get('body', '')])
+            matched = set(order_pattern.findall(content))
+            if email.get('order_number') in wanted:
+                matched.add(email['order_number'])
+            email.drop_body()
+            
+            for order_number in matched:
+                bucket = emails_by_order.setdefault(order_number, [])
+                if len(bucket) < self.max_emails:
+                    bucket.append(email)
+        
+        if fetched >= limit:
+            emails_by_order = {
+                order_number: bucket for order_number, bucket in emails_by_order.items()
+                if len(bucket) >= self.max_emails
+                or any(email.get('status') in (ORDER_SUCCESS, ORDER_FAILED) for email in bucket)
+            }
+        
+        return emails_by_order
+    
+    def _chunk_orders(self, order_numbers: List[str]) -> List[List[str]]:
+        """Chia danh sách order (bỏ trùng) thành các nhóm có query không quá ORDER_QUERY_MAX_LENGTH"""
+        chunks = []
+        current = []
+        length = 2  # Dấu { }
+        
+        for order_number in dict.fromkeys(order_numbers):
+            extra = len(order_number) + (1 if current else 0)
+            if current and length + extra > ORDER_QUERY_MAX_LENGTH:
+                chunks.append(current)
+                current = []
+                length = 2
+                extra = len(order_number)
+            current.append(order_number)
+            length += extra
+        
+        if current:
+            chunks.append(current)
+        return chunks
+    
+    def _decide(self, order_number: str, analyzed_emails: Iterable[Dict]) -> Dict:
+        """
+        Lấy trạng thái từ email quyết định đầu tiên (PACKAGE_SUCCESS/PACKAGE_FAILED)
+        
+        Args:
+            order_number: Order number
+            analyzed_emails: Email đã phân tích, mới nhất trước
+        
+        Returns:
+            Dict {'order', 'status', 'quantity'}
+        """
+        status = ORDER_NOT_FOUND
+        
+        for email in analyzed_emails:
+            status = ORDER_UNKNOWN
+            if email.get('status') in (ORDER_SUCCESS, ORDER_FAILED):
+                return {'order': order_number, 'status': email['status'], 'quantity': email.get('quantity', '')}
+        
+        return {'order': order_number, 'status': status, 'quantity': ''}
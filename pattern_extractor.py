@@ -0,0 +1,36 @@
+"""
+Module trích xuất giá trị (order number, quantity) bằng danh sách regex có thứ tự ưu tiên
+"""
+import re
+from typing import List
+
+
+class PatternExtractor:
+    def __init__(self, patterns: List[str], flags: int = re.IGNORECASE):
+        """
+        Biên dịch danh sách pattern một lần
+        
+        Args:
+            patterns: Các regex theo thứ tự ưu tiên; group 1 (nếu có) là giá trị cần lấy
+            flags: Cờ regex dùng cho mọi pattern
+        """
+        self.patterns = [re.compile(pattern, flags) for pattern in patterns]
+    
+    def extract(self, text: str) -> str:
+        """
+        Lấy giá trị của pattern có độ ưu tiên cao nhất khớp với text
+        
+        Mỗi pattern chỉ tìm đến match đầu tiên (search), không tạo danh sách mọi
+        match; kết quả giống re.findall(pattern, text)[0] của pattern đầu tiên có match.
+        
+        Args:
+            text: Text cần tìm
+            
+        Returns:
+            Giá trị tìm được, empty string nếu không pattern nào khớp
+        """
+        for pattern in self.patterns:
+            match = pattern.search(text)
+            if match:
+                return match.group(1) if pattern.groups else match.group(0)
+        return ""
@@ -0,0 +1,95 @@
+"""
+Module chuyển quy tắc merchant thành Gmail search query (lọc ở phía server trước khi tải email)
+"""
+import re
+from typing import List, Optional
+from config import ORDER_QUERY_MAX_LENGTH
+from rule_engine import MerchantRule
+
+# Cụm từ có thể đẩy lên: bắt đầu và kết thúc bằng ký tự chữ/số (biên từ của Gmail trùng với biên từ cục bộ)
+PUSHABLE_PHRASE_PATTERN = re.compile(r'^\w(.*\w)?$')
+
+
+def subject_phrase(keyword: str) -> str:
+    """
+    Chuyển từ khóa tiêu đề thành cụm từ dùng trong subject:"..."
+    
+    Gmail tìm theo từ (bỏ qua dấu câu) nên dấu nháy kép bị bỏ và khoảng trắng
+    được gộp lại. Ký tự HTML escape (&amp;) được giữ nguyên: từ khóa cục bộ chỉ
+    khớp tiêu đề chứa đúng "&amp;", Gmail khớp tiêu đề đó qua từ "amp".
+    """
+    phrase = keyword.replace('"', ' ')
+    return re.sub(r'\s+', ' ', phrase).strip()
+
+
+def package_terms(rules: List[MerchantRule]) -> Optional[List[str]]:
+    """
+    Các điều kiện Gmail search tương ứng với quy tắc PACKAGE_SUCCESS/PACKAGE_FAILED
+    
+    Mọi quy tắc đều cần tiêu đề chứa một từ khóa, nên subject:"..." là điều kiện
+    cần cho mọi email đơn hàng. Sender không được đẩy lên thành from: vì email
+    forward có người gửi là người forward (sender gốc chỉ nằm trong nội dung).
+    
+    Gmail tìm theo từ nguyên vẹn còn từ khóa mặc định được so khớp cục bộ theo
+    chuỗi con: 'deliver' khớp tiêu đề "delivered", 'our package' khớp "your
+    package", nhưng subject:"..." thì không. Vì vậy chỉ quy tắc subject_whole_words
+    (so khớp cục bộ trọn từ) có từ khóa bắt đầu và kết thúc bằng chữ/số mới được
+    đẩy lên; chỉ cần một quy tắc không đẩy được là phải lấy mọi email (trả về None).
+    
+    Args:
+        rules: Quy tắc merchant đang dùng
+    
+    Returns:
+        Danh sách điều kiện subject:"..." (không trùng, theo thứ tự quy tắc);
+        None nếu có từ khóa không đẩy lên an toàn được
+    """
+    terms = {}
+    for rule in rules:
+        keywords = rule.failed_subjects + rule.success_subjects
+        if keywords and not rule.subject_whole_words:
+            return None
+        for keyword in keywords:
+            phrase = subject_phrase(keyword)
+            if not PUSHABLE_PHRASE_PATTERN.match(phrase):
+                return None
+            terms.setdefault(phrase.lower(), f'subject:"{phrase}"')
+    return list(terms.values())
+
+
+def plan_package_queries(base_query: str, rules: List[MerchantRule],
+                         max_length: int = ORDER_QUERY_MAX_LENGTH) -> Optional[List[str]]:
+    """
+    Ghép query gốc (ví dụ khoảng thời gian) với điều kiện OR của các quy tắc đơn hàng
+    
+    Gmail chỉ trả về email có thể là email đơn hàng; phân tích cục bộ vẫn xác
+    nhận lại từng email. Nếu quá nhiều điều kiện, chúng được chia thành nhiều
+    query có độ dài không quá max_length.
+    
+    Args:
+        base_query: Query gốc, ví dụ 'after:2025-01-01 before:2025-02-01'
+        rules: Quy tắc merchant đang dùng
+        max_length: Độ dài tối đa (ký tự) của mỗi query
+    
+    Returns:
+        Danh sách query (kết quả là hợp của các query); None nếu không có quy tắc
+        nào để đẩy lên hoặc có từ khóa không đẩy lên an toàn được (cần lấy mọi
+        email theo query gốc)
+    """
+    terms = package_terms(rules)
+    if not terms:
+        return None
+    
+    queries = []
+    current = []
+    prefix = f'{base_query} ' if base_query else ''
+    length = len(prefix) + 2  # Dấu { }
+    for term in terms:
+        if current and length + len(term) + 1 > max_length:
+            queries.append(prefix + '{' + ' '.join(current) + '}')
+            current = []
+            length = len(prefix) + 2
+        current.append(term)
+        length += len(term) + 1
+    queries.append(prefix + '{' + ' '.join(current) + '}')
+    
+    return queries
@@ -0,0 +1,197 @@
+"""
+Module giới hạn tốc độ gọi Gmail API theo quota và retry khi bị rate limit
+"""
+import json
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+from googleapiclient.errors import HttpError
+from config import QUOTA_UNITS_PER_SECOND, MAX_RETRIES, RETRY_BASE_DELAY, RETRY_MAX_DELAY
+
+# Số quota unit Gmail tính cho mỗi method (theo tài liệu Gmail API)
+QUOTA_UNITS = {
+    'messages.list': 5,
+    'messages.get': 5,
+    'history.list': 2,
+    'getProfile': 1,
+}
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+RATE_LIMIT_REASONS = {'rateLimitExceeded', 'userRateLimitExceeded'}
+
+
+class RateLimiter:
+    def __init__(self, units_per_second: float = QUOTA_UNITS_PER_SECOND, max_retries: int = MAX_RETRIES,
+                 base_delay: float = RETRY_BASE_DELAY, max_delay: float = RETRY_MAX_DELAY):
+        """
+        Khởi tạo token bucket dùng chung cho mọi request
+        
+        Args:
+            units_per_second: Số quota unit được dùng mỗi giây (Gmail: 250/user/giây)
+            max_retries: Số lần retry tối đa cho một request
+            base_delay: Thời gian chờ (giây) cho lần retry đầu tiên
+            max_delay: Thời gian chờ tối đa (giây) giữa hai lần retry
+        """
+        self.units_per_second = units_per_second
+        self.capacity = units_per_second
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        
+        self._tokens = self.capacity
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+        
+        # Bộ đếm thống kê
+        self.requests = 0
+        self.retries = 0
+        self.throttled_seconds = 0.0
+    
+    def acquire(self, units: float):
+        """
+        Chờ đến khi đủ quota rồi trừ units khỏi bucket
+        
+        Args:
+            units: Số quota unit cần dùng
+        """
+        units = min(units, self.capacity)
+        
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self.units_per_second)
+                self._last_refill = now
+                
+                if self._tokens >= units:
+                    self._tokens -= units
+                    self.requests += 1
+                    return
+                
+                wait = (units - self._tokens) / self.units_per_second
+                self.throttled_seconds += wait
+            
+            time.sleep(wait)
+    
+    def execute(self, request, method: str, units: Optional[float] = None):
+        """
+        Thực thi request sau khi lấy quota, retry khi gặp lỗi rate limit/tạm thời
+        
+        Args:
+            request: HttpRequest (hoặc BatchHttpRequest) của googleapiclient
+            method: Tên method trong QUOTA_UNITS (ví dụ 'messages.get')
+            units: Số quota unit (mặc định theo QUOTA_UNITS[method])
+            
+        Returns:
+            Kết quả của request.execute()
+        """
+        if units is None:
+            units = QUOTA_UNITS.get(method, 1)
+        
+        attempt = 0
+        while True:
+            self.acquire(units)
+            try:
+                return request.execute()
+            except HttpError as e:
+                if not self.is_retryable(e) or attempt >= self.max_retries:
+                    raise
+                self.backoff(e, attempt)
+                attempt += 1
+    
+    def backoff(self, error: Optional[Exception], attempt: int):
+        """
+        Chờ trước lần retry tiếp theo (ưu tiên header Retry-After, nếu không dùng
+        exponential backoff có jitter)
+        
+        Args:
+            error: Lỗi vừa gặp
+            attempt: Số lần đã retry (bắt đầu từ 0)
+        """
+        delay = self._retry_after(error)
+        if delay is None:
+            delay = min(self.max_delay, self.base_delay * (2 ** attempt))
+            delay = delay / 2 + random.uniform(0, delay / 2)
+        
+        with self._lock:
+            self.retries += 1
+            self.throttled_seconds += delay
+        
+        time.sleep(delay)
+    
+    @staticmethod
+    def is_retryable(error: Exception) -> bool:
+        """
+        Kiểm tra lỗi có nên retry không (429, 5xx, 403 rateLimitExceeded)
+        
+        Args:
+            error: Lỗi từ googleapiclient
+            
+        Returns:
+            True nếu nên retry
+        """
+        if not isinstance(error, HttpError):
+            return False
+        
+        status = error.resp.status
+        if status in RETRYABLE_STATUSES:
+            return True
+        
+        if status == 403:
+            try:
+                details = json.loads(error.content.decode('utf-8'))
+                reasons = {item.get('reason') for item in details['error'].get('errors', [])}
+            except Exception:
+                return False
+            return bool(reasons & RATE_LIMIT_REASONS)
+        
+        return False
+    
+    @staticmethod
+    def _retry_after(error: Optional[Exception]) -> Optional[float]:
+        """Đọc header Retry-After (số giây hoặc HTTP date) nếu có"""
+        resp = getattr(error, 'resp', None)
+        if resp is None:
+            return None
+        
+        value = resp.get('retry-after')
+        if not value:
+            return None
+        
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except Exception:
+            return None
+    
+    def stats(self) -> Dict[str, float]:
+        """
+        Thống kê hoạt động của rate limiter
+        
+        Returns:
+            Dict gồm 'requests', 'retries', 'throttled_seconds'
+        """
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'retries': self.retries,
+                'throttled_seconds': round(self.throttled_seconds, 2),
+            }
+
+
+_shared_limiter = None
+_shared_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Trả về RateLimiter dùng chung cho cả tiến trình"""
+    global _shared_limiter
+    with _shared_lock:
+        if _shared_limiter is None:
+            _shared_limiter = RateLimiter()
+        return _shared_limiter
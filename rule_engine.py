@@ -0,0 +1,432 @@
+"""
+Module quy tắc phân loại email theo merchant, đọc từ file quy tắc JSON (merchant_rules.json)
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import List, Dict, Iterable, Optional, Set, Tuple
+from config import (
+    PACKAGE_SUCCESS_KEYWORDS, PACKAGE_FAILED_KEYWORDS, PACKAGE_SUCCESS_SENDER,
+    ORDER_NUMBER_PATTERNS, QUANTITY_PATTERNS, MERCHANT_ORDER_NUMBER_PATTERNS, MERCHANT_QUANTITY_PATTERNS,
+    MERCHANT_RULES_FILE, MERCHANT_RULES_RELOAD_INTERVAL
+)
+from keyword_matcher import KeywordMatcher
+from pattern_extractor import PatternExtractor
+
+logger = logging.getLogger(__name__)
+
+# Domain của địa chỉ email (trong From và trong nội dung, ví dụ dòng "From:" của email forward)
+SENDER_DOMAIN_PATTERN = re.compile(r'@([a-z0-9-]+(?:\.[a-z0-9-]+)+)')
+
+
+class MerchantRule:
+    """
+    Quy tắc của một merchant: sender, từ khóa tiêu đề, điều kiện nội dung và pattern trích xuất
+    
+    - failed_subjects: tiêu đề chứa một trong các từ khóa -> PACKAGE_FAILED
+    - success_subjects: tiêu đề chứa một trong các từ khóa và email đến từ một
+      trong senders (hoặc nội dung chứa địa chỉ sender, với email forward) -> PACKAGE_SUCCESS
+    - failed_requires_sender: nếu True, PACKAGE_FAILED cũng cần sender khớp như PACKAGE_SUCCESS
+      (mặc định False: chỉ cần tiêu đề)
+    - body_keywords: nếu có, nội dung phải chứa ít nhất một từ khóa thì quy tắc mới khớp
+    - order_patterns / quantity_patterns: pattern riêng, được thử trước pattern mặc định
+    - subject_whole_words: nếu True, từ khóa tiêu đề chỉ khớp trọn từ ('arrive' không khớp
+      "arrived"); chỉ quy tắc như vậy mới được đẩy lên Gmail query (Gmail tìm theo từ)
+    """
+    
+    def __init__(self, name: str, senders: List[str] = None, success_subjects: List[str] = None,
+                 failed_subjects: List[str] = None, body_keywords: List[str] = None,
+                 order_patterns: List[str] = None, quantity_patterns: Dict[str, List[str]] = None,
+                 failed_requires_sender: bool = False, subject_whole_words: bool = False):
+        self.name = name
+        self.senders = list(senders or [])
+        self.success_subjects = list(success_subjects or [])
+        self.failed_subjects = list(failed_subjects or [])
+        self.body_keywords = list(body_keywords or [])
+        self.order_patterns = list(order_patterns or [])
+        self.quantity_patterns = {status: list(patterns) for status, patterns in (quantity_patterns or {}).items()}
+        self.failed_requires_sender = bool(failed_requires_sender)
+        self.subject_whole_words = bool(subject_whole_words)
+        
+        self._senders_lower = [sender.lower() for sender in self.senders]
+        self._body_keywords_lower = [keyword.lower() for keyword in self.body_keywords]
+    
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'MerchantRule':
+        """Tạo quy tắc từ một mục 'merchants' trong file quy tắc"""
+        if not data.get('name'):
+            raise ValueError("Quy tắc merchant thiếu 'name'")
+        return cls(
+            name=data['name'],
+            senders=data.get('senders'),
+            success_subjects=data.get('success_subjects'),
+            failed_subjects=data.get('failed_subjects'),
+            body_keywords=data.get('body_keywords'),
+            order_patterns=data.get('order_patterns'),
+            quantity_patterns=data.get('quantity_patterns'),
+            failed_requires_sender=data.get('failed_requires_sender', False),
+            subject_whole_words=data.get('subject_whole_words', False),
+        )
+    
+    def to_dict(self) -> Dict:
+        """Chuyển về dict (cùng định dạng file quy tắc)"""
+        return {
+            'name': self.name,
+            'senders': self.senders,
+            'success_subjects': self.success_subjects,
+            'failed_subjects': self.failed_subjects,
+            'body_keywords': self.body_keywords,
+            'order_patterns': self.order_patterns,
+            'quantity_patterns': self.quantity_patterns,
+            'failed_requires_sender': self.failed_requires_sender,
+            'subject_whole_words': self.subject_whole_words,
+        }
+    
+    def sender_domains(self) -> Optional[Set[str]]:
+        """
+        Domain của các sender, dùng để chọn quy tắc theo domain người gửi
+        
+        Returns:
+            Tập domain ('a@shop.com' -> 'shop.com', 'shop.com' -> 'shop.com'); None nếu
+            quy tắc không khai báo sender hoặc có sender không phải địa chỉ/domain
+            (quy tắc khi đó luôn được xét, với mọi người gửi)
+        """
+        domains = set()
+        for sender in self._senders_lower:
+            domain = sender.rpartition('@')[2].strip()
+            if not domain or '.' not in domain or ' ' in domain:
+                return None
+            domains.add(domain)
+        return domains or None
+    
+    def accepts_content(self, content_lower: str) -> bool:
+        """Kiểm tra điều kiện nội dung (body_keywords)"""
+        if not self._body_keywords_lower:
+            return True
+        return any(keyword in content_lower for keyword in self._body_keywords_lower)
+    
+    def matches_sender(self, sender_lower: str, content_lower: str) -> Optional[str]:
+        """
+        Tìm sender của quy tắc trong địa chỉ gửi hoặc trong nội dung (email forward)
+        
+        Returns:
+            'sender' nếu khớp địa chỉ gửi, 'forwarded' nếu chỉ khớp trong nội dung,
+            None nếu không khớp (quy tắc không khai báo senders thì luôn là 'sender')
+        """
+        if not self._senders_lower:
+            return 'sender'
+        if any(sender in sender_lower for sender in self._senders_lower):
+            return 'sender'
+        if any(sender in content_lower for sender in self._senders_lower):
+            return 'forwarded'
+        return None
+
+
+def default_rules() -> List[MerchantRule]:
+    """Quy tắc mặc định lấy từ config.py (dùng khi không có file quy tắc)"""
+    return [MerchantRule(
+        name='default',
+        senders=[PACKAGE_SUCCESS_SENDER] if PACKAGE_SUCCESS_SENDER else [],
+        success_subjects=PACKAGE_SUCCESS_KEYWORDS,
+        failed_subjects=PACKAGE_FAILED_KEYWORDS,
+        subject_whole_words=True,
+    )]
+
+
+def parse_sender_domains(sender: str, content_lower: str) -> Set[str]:
+    """
+    Lấy domain người gửi của email: từ địa chỉ From và từ các địa chỉ trong nội dung
+    (email forward chứa địa chỉ người gửi gốc trong dòng "From:" của phần forward)
+    
+    Args:
+        sender: Địa chỉ gửi (chữ thường)
+        content_lower: Nội dung đã ghép (chữ thường)
+    
+    Returns:
+        Tập domain
+    """
+    return set(SENDER_DOMAIN_PATTERN.findall(sender)) | set(SENDER_DOMAIN_PATTERN.findall(content_lower))
+
+
+def load_rules(path: str) -> List[MerchantRule]:
+    """
+    Đọc file quy tắc JSON
+    
+    Args:
+        path: Đường dẫn file, dạng {"merchants": [{...}, ...]}
+    
+    Returns:
+        Danh sách quy tắc theo thứ tự trong file (thứ tự ưu tiên)
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return [MerchantRule.from_dict(entry) for entry in data.get('merchants', [])]
+
+
+class CompiledRules:
+    """Bộ quy tắc đã biên dịch (không đổi sau khi tạo, được thay nguyên khối khi reload)"""
+    
+    def __init__(self, rules: List[MerchantRule]):
+        self.rules = rules
+        
+        # Mọi từ khóa tiêu đề trong một matcher (cho subject_matches, khi chưa có nội dung email)
+        self.subject_matcher = KeywordMatcher({
+            'failed': [keyword for rule in rules for keyword in rule.failed_subjects],
+            'success': [keyword for rule in rules for keyword in rule.success_subjects],
+        })
+        
+        # Chọn quy tắc theo domain người gửi: mỗi domain có nhóm quy tắc riêng, nên chi phí
+        # phân loại một email không tăng theo số merchant. Nhóm fallback gồm quy tắc không
+        # gắn với domain nào và từ khóa PACKAGE_FAILED không cần sender
+        fallback = {'failed': [], 'success': []}
+        by_domain: Dict[str, Dict[str, List[int]]] = {}
+        for position, rule in enumerate(rules):
+            domains = rule.sender_domains()
+            if domains is None:
+                fallback['failed'].append(position)
+                fallback['success'].append(position)
+                continue
+            if not rule.failed_requires_sender:
+                fallback['failed'].append(position)
+            for domain in domains:
+                group = by_domain.setdefault(domain, {'failed': [], 'success': []})
+                group['success'].append(position)
+                if rule.failed_requires_sender:
+                    group['failed'].append(position)
+        self.fallback_group = RuleGroup(rules, fallback)
+        self.domain_groups = {domain: RuleGroup(rules, positions) for domain, positions in by_domain.items()}
+        
+        self.order_extractor = PatternExtractor(MERCHANT_ORDER_NUMBER_PATTERNS + ORDER_NUMBER_PATTERNS)
+        self.quantity_extractors = {
+            status: PatternExtractor(MERCHANT_QUANTITY_PATTERNS + patterns)
+            for status, patterns in QUANTITY_PATTERNS.items()
+        }
+        self.rule_order_extractors = [
+            PatternExtractor(rule.order_patterns + MERCHANT_ORDER_NUMBER_PATTERNS + ORDER_NUMBER_PATTERNS)
+            if rule.order_patterns else self.order_extractor
+            for rule in rules
+        ]
+        self.rule_quantity_extractors = [
+            {
+                status: PatternExtractor(rule.quantity_patterns.get(status, []) + MERCHANT_QUANTITY_PATTERNS + patterns)
+                if rule.quantity_patterns.get(status) else self.quantity_extractors[status]
+                for status, patterns in QUANTITY_PATTERNS.items()
+            }
+            for rule in rules
+        ]
+        
+        self.positions = {id(rule): position for position, rule in enumerate(rules)}
+        
+        encoded = json.dumps({
+            'merchants': [rule.to_dict() for rule in rules],
+            'order_patterns': MERCHANT_ORDER_NUMBER_PATTERNS + ORDER_NUMBER_PATTERNS,
+            'quantity_patterns': {
+                status: MERCHANT_QUANTITY_PATTERNS + patterns for status, patterns in QUANTITY_PATTERNS.items()
+            },
+        }, sort_keys=True, ensure_ascii=False).encode('utf-8')
+        self.fingerprint = hashlib.sha1(encoded).hexdigest()
+    
+    def groups_for(self, domains: Iterable[str]) -> List['RuleGroup']:
+        """
+        Các nhóm quy tắc áp dụng cho email có các domain người gửi
+        
+        Domain con cũng khớp quy tắc của domain cha ('mail.shop.com' -> 'shop.com').
+        Nhóm fallback luôn đứng đầu.
+        """
+        groups = [self.fallback_group]
+        seen = set()
+        for domain in domains:
+            labels = domain.split('.')
+            for start in range(len(labels) - 1):
+                suffix = '.'.join(labels[start:])
+                group = self.domain_groups.get(suffix)
+                if group is not None and suffix not in seen:
+                    seen.add(suffix)
+                    groups.append(group)
+        return groups
+
+
+class RuleGroup:
+    """Một nhóm quy tắc (theo domain hoặc fallback) với matcher từ khóa tiêu đề riêng"""
+    
+    def __init__(self, rules: List[MerchantRule], positions: Dict[str, List[int]]):
+        """
+        Args:
+            rules: Toàn bộ quy tắc
+            positions: 'failed'/'success' -> vị trí các quy tắc của nhóm xét loại đó
+        """
+        self.keyword_rules: Dict[str, Dict[str, List[int]]] = {'failed': {}, 'success': {}}
+        # Quy tắc subject_whole_words: vị trí quy tắc theo từ khóa, chỉ tính khi từ khóa khớp trọn từ
+        self.whole_word_rules: Dict[str, Dict[str, List[int]]] = {'failed': {}, 'success': {}}
+        for category, attribute in (('failed', 'failed_subjects'), ('success', 'success_subjects')):
+            for position in positions[category]:
+                rule = rules[position]
+                target = self.whole_word_rules if rule.subject_whole_words else self.keyword_rules
+                for keyword in getattr(rule, attribute):
+                    rule_positions = target[category].setdefault(keyword.lower(), [])
+                    if position not in rule_positions:
+                        rule_positions.append(position)
+        self.word_patterns = {
+            keyword: re.compile(r'(?<!\w)' + re.escape(keyword) + r'(?!\w)')
+            for keyword_rules in self.whole_word_rules.values() for keyword in keyword_rules
+        }
+        self.matcher = KeywordMatcher({
+            category: list(dict.fromkeys(list(self.keyword_rules[category]) + list(self.whole_word_rules[category])))
+            for category in ('failed', 'success')
+        })
+    
+    def candidates(self, subject: str) -> Dict[str, Set[int]]:
+        """Vị trí các quy tắc của nhóm có từ khóa tiêu đề khớp, theo loại 'failed'/'success'"""
+        hits = self.matcher.scan(subject)
+        candidates = {}
+        for category in ('failed', 'success'):
+            positions = set()
+            for keyword, _ in hits[category]:
+                positions.update(self.keyword_rules[category].get(keyword, ()))
+                whole_word = self.whole_word_rules[category].get(keyword)
+                if whole_word and self.word_patterns[keyword].search(subject):
+                    positions.update(whole_word)
+            candidates[category] = positions
+        return candidates
+
+
+class RuleEngine:
+    def __init__(self, path: Optional[str] = MERCHANT_RULES_FILE,
+                 reload_interval: float = MERCHANT_RULES_RELOAD_INTERVAL,
+                 rules: Optional[List[MerchantRule]] = None):
+        """
+        Nạp và biên dịch quy tắc merchant một lần
+        
+        Nếu file quy tắc không tồn tại, dùng quy tắc mặc định từ config.py. File
+        được kiểm tra thay đổi (mtime) tối đa mỗi reload_interval giây và được
+        biên dịch lại khi đổi; file lỗi thì giữ bộ quy tắc đang dùng.
+        
+        Args:
+            path: Đường dẫn file quy tắc JSON (None = chỉ dùng rules/quy tắc mặc định)
+            reload_interval: Số giây giữa hai lần kiểm tra file thay đổi
+            rules: Danh sách quy tắc dùng trực tiếp (bỏ qua file)
+        """
+        self.path = None if rules is not None else path
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._checked_at = time.monotonic()
+        
+        if rules is not None:
+            self._compiled = CompiledRules(list(rules))
+        else:
+            self._compiled = CompiledRules(default_rules())
+            if self.path:
+                self._reload()
+    
+    @property
+    def rules(self) -> List[MerchantRule]:
+        """Danh sách quy tắc đang dùng"""
+        return self._compiled.rules
+    
+    @property
+    def fingerprint(self) -> str:
+        """Hash bộ quy tắc đang dùng, kể cả pattern mặc định (đổi khi quy tắc đổi)"""
+        return self.compiled().fingerprint
+    
+    def compiled(self) -> CompiledRules:
+        """Bộ quy tắc đã biên dịch hiện tại (nạp lại nếu file đã thay đổi)"""
+        if self.path and time.monotonic() - self._checked_at >= self.reload_interval:
+            with self._lock:
+                if time.monotonic() - self._checked_at >= self.reload_interval:
+                    self._reload()
+        return self._compiled
+    
+    def classify(self, subject: str, sender: str, content_lower: str,
+                 sender_domains: Optional[Set[str]] = None) -> Tuple[Optional[str], Optional[MerchantRule]]:
+        """
+        Xác định trạng thái đơn hàng theo quy tắc merchant
+        
+        Chỉ quy tắc của domain người gửi (và nhóm fallback) được xét. Quy tắc
+        PACKAGE_FAILED được xét trước PACKAGE_SUCCESS; trong mỗi loại, quy tắc
+        đứng trước trong file được ưu tiên.
+        
+        Args:
+            subject: Tiêu đề (chữ thường)
+            sender: Địa chỉ gửi (chữ thường)
+            content_lower: Nội dung đã ghép (chữ thường)
+            sender_domains: Domain người gửi đã parse (parse_sender_domains); None = tự parse
+        
+        Returns:
+            Tuple (status, rule); (None, None) nếu không quy tắc nào khớp
+        """
+        compiled = self.compiled()
+        if sender_domains is None:
+            sender_domains = parse_sender_domains(sender, content_lower)
+        
+        failed, success = set(), set()
+        for group in compiled.groups_for(sender_domains):
+            candidates = group.candidates(subject)
+            failed |= candidates['failed']
+            success |= candidates['success']
+        
+        for position in sorted(failed):
+            rule = compiled.rules[position]
+            if rule.failed_requires_sender and not rule.matches_sender(sender, content_lower):
+                continue
+            if rule.accepts_content(content_lower):
+                logger.debug("Matched FAILED rule '%s' in '%s'", rule.name, subject)
+                return 'PACKAGE_FAILED', rule
+        
+        for position in sorted(success):
+            rule = compiled.rules[position]
+            matched_by = rule.matches_sender(sender, content_lower)
+            if matched_by and rule.accepts_content(content_lower):
+                logger.debug("Matched SUCCESS rule '%s' in '%s' (%s: '%s')", rule.name, subject, matched_by, sender)
+                return 'PACKAGE_SUCCESS', rule
+        
+        return None, None
+    
+    def subject_matches(self, subject: str) -> bool:
+        """Kiểm tra tiêu đề (chữ thường) có chứa từ khóa của quy tắc nào không"""
+        hits = self.compiled().subject_matcher.scan(subject)
+        return bool(hits['failed'] or hits['success'])
+    
+    def order_extractor(self, rule: Optional[MerchantRule] = None) -> PatternExtractor:
+        """Extractor order number (pattern của rule trước, rồi pattern mặc định)"""
+        compiled = self.compiled()
+        position = self._position(compiled, rule)
+        return compiled.order_extractor if position is None else compiled.rule_order_extractors[position]
+    
+    def quantity_extractor(self, status: str, rule: Optional[MerchantRule] = None) -> Optional[PatternExtractor]:
+        """Extractor quantity cho trạng thái (None nếu trạng thái không có quantity)"""
+        compiled = self.compiled()
+        position = self._position(compiled, rule)
+        extractors = compiled.quantity_extractors if position is None else compiled.rule_quantity_extractors[position]
+        return extractors.get(status)
+    
+    @staticmethod
+    def _position(compiled: CompiledRules, rule: Optional[MerchantRule]) -> Optional[int]:
+        """Vị trí của rule trong bộ quy tắc (None nếu không có rule hoặc rule thuộc bộ quy tắc cũ)"""
+        return None if rule is None else compiled.positions.get(id(rule))
+    
+    def _reload(self):
+        """Nạp lại file quy tắc nếu mtime đã đổi (gọi khi đã giữ lock hoặc lúc khởi tạo)"""
+        self._checked_at = time.monotonic()
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime == self._mtime:
+            return
+        
+        try:
+            rules = load_rules(self.path) if mtime is not None else default_rules()
+            compiled = CompiledRules(rules)
+        except (OSError, ValueError, TypeError, AttributeError, KeyError, re.error) as e:
+            logger.error("Không nạp được file quy tắc %s: %s (giữ quy tắc đang dùng)", self.path, e)
+            self._mtime = mtime
+            return
+        
+        self._compiled = compiled
+        self._mtime = mtime
+        logger.info("Đã nạp %d quy tắc merchant từ %s", len(rules), self.path if mtime is not None else 'config.py')
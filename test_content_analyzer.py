@@ -0,0 +1,111 @@
+"""
+Test phân tích nội dung email
+"""
+from content_analyzer import ContentAnalyzer
+from message_cache import MessageCache
+
+SENDER = 'bathandbodyworks@bathandbodyworks.narvar.com'
+
+
+def test_analyze_email_extracts_status_order_and_quantity():
+    """Trạng thái, order number và quantity được lấy từ cùng một email"""
+    email = {
+        'id': '1', 'subject': 'Kim, your package has arrived', 'from': SENDER,
+        'snippet': '', 'body': 'Order Number 00474270370383 Qty: 2',
+    }
+    
+    analyzed = ContentAnalyzer().analyze_email(email)
+    
+    assert analyzed['status'] == 'PACKAGE_SUCCESS'
+    assert analyzed['confidence'] == 1.0
+    assert analyzed['order_number'] == '00474270370383'
+    assert analyzed['quantity'] == '2'
+
+
+def test_analyze_email_builds_content_once(monkeypatch):
+    """Nội dung email chỉ được ghép một lần cho mọi bước phân tích"""
+    analyzer = ContentAnalyzer()
+    calls = []
+    original = analyzer._get_analyze_content
+    monkeypatch.setattr(analyzer, '_get_analyze_content', lambda email: calls.append(1) or original(email))
+    
+    analyzer.analyze_email({'id': '1', 'subject': 'Order 123', 'from': 'x@y.com', 'snippet': '', 'body': 'qty 1'})
+    
+    assert len(calls) == 1
+
+
+def test_extractors_follow_pattern_priority():
+    """Pattern ưu tiên cao hơn thắng dù match xuất hiện muộn hơn trong nội dung"""
+    analyzer = ContentAnalyzer()
+    email = {'subject': '', 'snippet': '', 'body': 'Ref #55 ... Quantity: 4 ... Order Number 00474270370383 Qty: 2'}
+    
+    assert analyzer.extract_order_number(email) == '00474270370383'
+    assert analyzer.extract_quantity(email, 'PACKAGE_SUCCESS') == '2'
+    assert analyzer.extract_quantity(email, 'PACKAGE_FAILED') == '4'
+    assert analyzer.extract_quantity(email, 'COMPLETE') == ''
+
+
+def test_parallel_matches_serial(monkeypatch):
+    """Phân tích nhiều process cho kết quả và thứ tự giống phân tích tuần tự"""
+    import content_analyzer
+    monkeypatch.setattr(content_analyzer, 'ANALYZE_PARALLEL_MIN_EMAILS', 0)
+    emails = [
+        {'id': str(i), 'subject': 'Kim, your package has arrived' if i % 2 else 'Hello abc', 'from': SENDER,
+         'snippet': '', 'body': f'Order Number {1000000000 + i} Qty: {i}', 'labels': ['INBOX']}
+        for i in range(20)
+    ]
+    analyzer = ContentAnalyzer()
+    
+    parallel = analyzer.analyze_emails_parallel(emails, keep_body=False, workers=2, chunk_size=3)
+    
+    assert parallel == analyzer.analyze_emails(emails, keep_body=False)
+    assert [email['id'] for email in parallel] == [str(i) for i in range(20)]
+
+
+def test_result_cache_skips_unchanged_emails_until_rules_change(tmp_path, monkeypatch):
+    """Email đã phân tích không bị phân tích lại, trừ khi bộ từ khóa thay đổi"""
+    cache = MessageCache(str(tmp_path / 'cache.db'))
+    emails = [
+        {'id': 'a', 'subject': 'Kim, your package has arrived', 'from': SENDER,
+         'snippet': '', 'body': 'Order Number 1234567890123 Qty: 2'},
+        {'id': 'b', 'subject': 'Hello', 'from': 'x@example.com', 'snippet': '', 'body': 'done abc'},
+    ]
+    first = list(ContentAnalyzer(result_cache=cache).iter_analyze_emails(emails))
+    
+    analyzer = ContentAnalyzer(result_cache=cache)
+    calls = []
+    original = analyzer._analyze_fields
+    monkeypatch.setattr(analyzer, '_analyze_fields', lambda email: calls.append(email['id']) or original(email))
+    
+    assert list(analyzer.iter_analyze_emails(emails)) == first
+    assert calls == []
+    
+    analyzer.update_keywords(complete_keywords=['done'])
+    second = list(analyzer.iter_analyze_emails(emails))
+    
+    assert calls == ['a', 'b']
+    assert second[1]['matched_keywords'] == {'complete': ['done'], 'error': []}
+
+
+def test_result_cache_batched_lookup_and_evicted_with_emails(tmp_path, monkeypatch):
+    """Kết quả được tra theo nhóm (một query) và bị xóa cùng email khi cache bị evict"""
+    cache = MessageCache(str(tmp_path / 'cache.db'), max_size_mb=0.004)
+    emails = [{'id': str(i), 'subject': 'Hello', 'from': 'x@example.com', 'snippet': '', 'body': 'x' * 300}
+              for i in range(5)]
+    lookups = []
+    original = cache.get_analyses
+    monkeypatch.setattr(cache, 'get_analyses', lambda ruleset, keys: lookups.append(keys) or original(ruleset, keys))
+    
+    analyzer = ContentAnalyzer(result_cache=cache)
+    for email in emails:
+        cache.put(email)
+    list(analyzer.iter_analyze_emails(emails))
+    
+    assert len(lookups) == 1
+    cache.put(dict(emails[0], id='big', body='y' * 2000))
+    
+    cached_ids = set(cache.message_ids())
+    stored = original(analyzer.ruleset_hash(), [(email['id'], True) for email in emails])
+    assert stored and {key[0] for key in stored} <= cached_ids
+    assert len(stored) < len(emails)
+    assert cache.total_size() == cache._total_size() <= cache.max_size_bytes
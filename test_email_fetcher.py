@@ -0,0 +1,113 @@
+"""
+Test lấy email qua Gmail service giả (batch, phân trang, two-tier, song song)
+"""
+import threading
+import time
+
+import pytest
+
+import email_fetcher
+from email_fetcher import ConcurrentEmailFetcher, EmailFetcher, FetchError
+from rate_limiter import RateLimiter
+
+
+def _fetcher(service, **kwargs):
+    kwargs.setdefault('rate_limiter', RateLimiter(units_per_second=1e6, max_retries=0))
+    return EmailFetcher(service, **kwargs)
+
+
+def test_failed_batch_is_reported_not_dropped(gmail_service, gmail_message):
+    """Batch lỗi cả lượt hoặc từng email lỗi không retry được: strict raise FetchError với đúng các ID đó"""
+    service = gmail_service([gmail_message(f'm{i}', timestamp=i) for i in range(3)])
+    service.batch_error = RuntimeError('connection reset')
+    
+    with pytest.raises(FetchError) as excinfo:
+        list(_fetcher(service, use_batch=True).iter_emails(strict=True))
+    assert excinfo.value.message_ids == ['m0', 'm1', 'm2']
+    
+    service.batch_error = None
+    service.failing['m1'] = ValueError('not found')
+    fetcher = _fetcher(service, use_batch=True)
+    with pytest.raises(FetchError) as excinfo:
+        list(fetcher.iter_emails(strict=True))
+    assert excinfo.value.message_ids == ['m1']
+    assert [email['id'] for email in fetcher.iter_emails()] == ['m0', 'm2']
+
+
+def test_batch_keeps_list_order_and_skips_failed_items(gmail_service, gmail_message):
+    """Callback của batch về không theo thứ tự: kết quả vẫn theo thứ tự list, email lỗi không làm hỏng batch"""
+    service = gmail_service([gmail_message(f'm{i}', subject=f'Subject {i}', timestamp=10 - i) for i in range(5)])
+    service.failing['m2'] = ValueError('not found')
+    
+    emails = list(_fetcher(service, use_batch=True, batch_size=2).iter_emails())
+    
+    assert service.batches == [['m0', 'm1'], ['m2', 'm3'], ['m4']]
+    assert [email['id'] for email in emails] == ['m0', 'm1', 'm3', 'm4']
+    assert [email['subject'] for email in emails] == ['Subject 0', 'Subject 1', 'Subject 3', 'Subject 4']
+
+
+def test_follows_next_page_token_until_limit(gmail_service, gmail_message, monkeypatch):
+    """Duyệt hết các trang theo nextPageToken; limit cắt đúng số email và không lấy thêm trang/email thừa"""
+    monkeypatch.setattr(email_fetcher, 'LIST_PAGE_SIZE', 2)
+    service = gmail_service([gmail_message(f'm{i}', timestamp=10 - i) for i in range(5)])
+    
+    emails = list(_fetcher(service, use_batch=False).iter_emails('in:inbox'))
+    assert [email['id'] for email in emails] == ['m0', 'm1', 'm2', 'm3', 'm4']
+    assert [call for call in service.calls if call[0] == 'list'] == [
+        ('list', 'in:inbox', None), ('list', 'in:inbox', '2'), ('list', 'in:inbox', '4')]
+    
+    service.calls.clear()
+    emails = list(_fetcher(service, use_batch=False).iter_emails('in:inbox', limit=3))
+    assert [email['id'] for email in emails] == ['m0', 'm1', 'm2']
+    assert [call for call in service.calls if call[0] == 'list'] == [
+        ('list', 'in:inbox', None), ('list', 'in:inbox', '2')]
+    assert service.get_ids() == ['m0', 'm1', 'm2']
+
+
+@pytest.mark.parametrize('use_batch', [False, True])
+def test_body_filter_fetches_full_only_where_needed(gmail_service, gmail_message, use_batch):
+    """body_filter: headers (format=metadata) cho mọi email, body đầy đủ chỉ cho email được chọn"""
+    service = gmail_service([
+        gmail_message('m0', subject='Your package has shipped', body='order #1'),
+        gmail_message('m1', subject='Newsletter', body='sale'),
+        gmail_message('m2', subject='Your package was delivered', body='order #2'),
+    ])
+    
+    emails = list(_fetcher(service, use_batch=use_batch).iter_emails(
+        body_filter=lambda email: 'package' in email['subject']))
+    
+    assert sorted(service.get_ids('metadata')) == ['m0', 'm1', 'm2']
+    assert sorted(service.get_ids('full')) == ['m0', 'm2']
+    assert [(email['id'], email['body']) for email in emails] == [('m0', 'order #1'), ('m1', ''), ('m2', 'order #2')]
+
+
+def test_concurrent_fetcher_keeps_order_with_per_thread_services(gmail_service, gmail_message):
+    """Email về theo thứ tự list dù lấy song song; mỗi worker thread dùng Gmail service riêng của nó"""
+    messages = [gmail_message(f'm{i}', timestamp=20 - i) for i in range(12)]
+    services = []
+    
+    class WorkerService(gmail_service):
+        def get(self, userId, id, format='full', metadataHeaders=None):
+            assert threading.get_ident() == self.thread_id
+            time.sleep(0.001 * (int(id[1:]) % 3))  # Email xong không theo thứ tự
+            return super().get(userId, id, format, metadataHeaders)
+    
+    def service_factory():
+        service = WorkerService(messages)
+        service.thread_id = threading.get_ident()
+        services.append(service)
+        return service
+    
+    service = gmail_service(messages)
+    fetcher = ConcurrentEmailFetcher(service, service_factory, max_workers=4,
+                                     rate_limiter=RateLimiter(units_per_second=1e6))
+    try:
+        emails = list(fetcher.iter_emails())
+    finally:
+        fetcher.close()
+    
+    assert [email['id'] for email in emails] == [f'm{i}' for i in range(12)]
+    assert service.get_ids() == []
+    assert 1 <= len(services) <= 4
+    assert len({worker.thread_id for worker in services}) == len(services)
+    assert sorted(sum((worker.get_ids() for worker in services), [])) == sorted(f'm{i}' for i in range(12))
@@ -0,0 +1,60 @@
+"""
+Test lọc email và lập kế hoạch đẩy tiêu chí lên Gmail query
+"""
+from email_filter import EmailFilter
+
+EMAILS = [
+    {'id': '1', 'subject': 'Your package', 'from': 'Shop <ship@shop.com>',
+     'date': 'Tue, 31 Dec 2024 23:59:00 +1400', 'body': 'pack it'},
+    {'id': '2', 'subject': 'Hello', 'from': 'a@b.com', 'date': 'Wed, 15 Jan 2025 12:00:00 +0000', 'body': ''},
+    {'id': '3', 'subject': 'RE: Package ARRIVED', 'from': 'Shop <ship@shop.com>',
+     'date': 'Wed, 15 Jan 2025 12:00:00 +0000', 'body': 'nothing'},
+    {'id': '4', 'subject': 'Order', 'from': 'Shop <ship@shop.com>', 'date': 'garbage', 'body': 'pack'},
+]
+
+
+def test_filter_emails_applies_all_criteria():
+    """Mọi tiêu chí được áp dụng cùng lúc (so khớp chuỗi con, không phân biệt hoa thường)"""
+    email_filter = EmailFilter()
+    
+    assert [e['id'] for e in email_filter.filter_emails(EMAILS, subject_contains='pack')] == ['1', '3']
+    assert [e['id'] for e in email_filter.filter_emails(EMAILS, year=2025, from_contains='SHOP')] == ['3']
+    assert [e['id'] for e in email_filter.filter_emails(EMAILS, date_from='2024-12-31', body_contains='pack')] == ['1']
+    assert [e['id'] for e in email_filter.filter_emails(EMAILS, date_from='not a date')] == ['1', '2', '3', '4']
+
+
+def test_plan_pushes_dates_and_full_address_only():
+    """Ngày (nới một ngày mỗi phía) và địa chỉ đầy đủ được đẩy lên query; mọi tiêu chí vẫn lọc cục bộ"""
+    plan = EmailFilter().plan('in:inbox', date_from='2025-01-10', year=2025, month=1,
+                              from_contains='ship@shop.com', subject_contains='pack')
+    
+    assert plan.query == 'in:inbox after:2025-01-09 before:2025-02-02 from:ship@shop.com'
+    assert plan.pushed == ['date', 'from_contains']
+    assert 'from_contains' in plan.local and 'subject_contains' in plan.local
+    assert [e['id'] for e in EMAILS if plan.predicate(e)] == ['3']
+    assert EmailFilter().plan(from_contains='shop', month=1).query == ''
+    assert EmailFilter().build_gmail_query(from_contains='shop', subject_contains='pack') == ''
+    assert EmailFilter().build_gmail_query(date_to='2025-01-10') == 'before:2025-01-12'
+
+
+def test_header_predicate_ignores_body():
+    """Hàm lọc trên headers bỏ qua tiêu chí body (dùng khi chưa tải body)"""
+    plan = EmailFilter().plan(subject_contains='pack', body_contains='pack')
+    
+    assert plan.needs_body
+    assert [e['id'] for e in EMAILS if plan.header_predicate(e)] == ['1', '3']
+    assert [e['id'] for e in EMAILS if plan.predicate(e)] == ['1']
+
+
+def test_pushed_sender_still_matched_locally():
+    """from: chỉ thu hẹp số email cần tải; from_contains vẫn được kiểm tra cục bộ theo chuỗi con"""
+    plan = EmailFilter().plan(from_contains='a@b.com')
+    fetched = EMAILS[1:2] + [
+        {'id': '5', 'subject': 'Hi', 'from': 'xa@b.com', 'date': 'Wed, 15 Jan 2025 12:00:00 +0000', 'body': ''},
+        {'id': '6', 'subject': 'Hi', 'from': 'A <a@b.com.vn>', 'date': 'Wed, 15 Jan 2025 12:00:00 +0000', 'body': ''},
+        {'id': '7', 'subject': 'Hi', 'from': 'Other <other@b.com>', 'date': 'Wed, 15 Jan 2025 12:00:00 +0000', 'body': ''},
+    ]
+    
+    assert plan.query == 'from:a@b.com'
+    assert [e['id'] for e in fetched if plan.predicate(e)] == ['2', '5', '6']
+    assert [e['id'] for e in EmailFilter().filter_emails(fetched, from_contains='a@b.com')] == ['2', '5', '6']
@@ -0,0 +1,74 @@
+"""
+Test parse nội dung email (payload format=full lồng nhau và format=raw)
+"""
+import base64
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email_fetcher import EmailFetcher
+
+
+def _b64(text):
+    return base64.urlsafe_b64encode(text.encode('utf-8')).decode('ascii')
+
+
+def test_full_payload_nested_parts():
+    """Part text/plain nằm trong multipart/alternative lồng trong multipart/mixed"""
+    fetcher = EmailFetcher(service=None)
+    payload = {
+        'mimeType': 'multipart/mixed',
+        'parts': [
+            {
+                'mimeType': 'multipart/alternative',
+                'parts': [
+                    {'mimeType': 'text/plain', 'body': {'data': _b64('Order Number 00474270370383')}},
+                    {'mimeType': 'text/html', 'body': {'data': _b64('<p>Order Number 00474270370383</p>')}},
+                ],
+            },
+            {'mimeType': 'application/pdf', 'body': {'attachmentId': 'abc'}},
+        ],
+    }
+    
+    assert fetcher._extract_body(payload) == 'Order Number 00474270370383'
+
+
+def test_raw_message_prefers_plain_text():
+    """format=raw: lấy text/plain đầu tiên trong cây MIME"""
+    fetcher = EmailFetcher(service=None, fetch_format='raw')
+    
+    inner = MIMEMultipart('alternative')
+    inner.attach(MIMEText('Your package has arrived. Qty: 2', 'plain', 'utf-8'))
+    inner.attach(MIMEText('<b>Your package has arrived</b>', 'html', 'utf-8'))
+    outer = MIMEMultipart('mixed')
+    outer['Subject'] = 'Fwd: Kim, your package has arrived'
+    outer['From'] = 'Nam Huy <namnh11promax@gmail.com>'
+    outer.attach(inner)
+    
+    msg = {
+        'id': '1',
+        'threadId': '1',
+        'internalDate': '1700000000000',
+        'snippet': 'Your package has arrived',
+        'labelIds': ['INBOX'],
+        'raw': base64.urlsafe_b64encode(outer.as_bytes()).decode('ascii'),
+    }
+    email_data = fetcher._parse_email(msg)
+    
+    assert email_data['subject'] == 'Fwd: Kim, your package has arrived'
+    assert email_data['from'] == 'Nam Huy <namnh11promax@gmail.com>'
+    assert email_data['body'] == 'Your package has arrived. Qty: 2'
+
+
+def test_raw_message_html_fallback():
+    """format=raw: không có text/plain thì dùng text/html"""
+    fetcher = EmailFetcher(service=None, fetch_format='raw')
+    
+    message = MIMEText('<p>Order <b>123</b></p>', 'html', 'utf-8')
+    message['Subject'] = 'Order'
+    msg = {
+        'id': '2',
+        'threadId': '2',
+        'internalDate': '1700000000000',
+        'raw': base64.urlsafe_b64encode(message.as_bytes()).decode('ascii'),
+    }
+    
+    assert fetcher._parse_email(msg)['body'] == 'Order 123'
@@ -0,0 +1,34 @@
+"""
+Test EmailRecord - truy cập kiểu dict và bỏ body sau khi phân tích
+"""
+from content_analyzer import ContentAnalyzer
+from email_record import EmailRecord
+
+
+def test_dict_style_access():
+    """EmailRecord dùng được như dict"""
+    record = EmailRecord.from_dict({'id': '1', 'subject': 'Hello', 'from': 'a@b.com', 'custom': 1})
+    
+    assert record['from'] == 'a@b.com'
+    assert record.get('status', 'UNKNOWN') == 'UNKNOWN'
+    assert 'custom' in record and 'body' not in record
+    assert record.to_dict() == {'id': '1', 'subject': 'Hello', 'from': 'a@b.com', 'custom': 1}
+    assert dict(record) == record.to_dict()
+
+
+def test_analyze_without_body():
+    """keep_body=False bỏ body nhưng vẫn giữ kết quả trích xuất"""
+    email = {
+        'subject': 'Fwd: Kim, your package has arrived',
+        'from': 'bathandbodyworks@bathandbodyworks.narvar.com',
+        'snippet': '',
+        'body': 'Order Number 00474270370383 Qty: 3',
+    }
+    
+    analyzed = ContentAnalyzer().analyze_email(email, keep_body=False)
+    
+    assert analyzed['status'] == 'PACKAGE_SUCCESS'
+    assert analyzed['order_number'] == '00474270370383'
+    assert analyzed['quantity'] == '3'
+    assert analyzed['body'] == ''
+    assert email['body'] == 'Order Number 00474270370383 Qty: 3'
@@ -0,0 +1,32 @@
+"""
+Test chuyển HTML thành text
+"""
+from html_text import html_to_text
+
+
+def test_skips_style_and_script():
+    """Nội dung style/script không xuất hiện trong text"""
+    html = (
+        '<html><head><style>.qty { color: red; }</style>'
+        '<script>var order = 999;</script></head>'
+        '<body><p>Order Number</p><p>00474270370383</p></body></html>'
+    )
+    
+    assert html_to_text(html) == 'Order Number 00474270370383'
+
+
+def test_decodes_entities_and_collapses_whitespace():
+    """Entity được decode, khoảng trắng được gộp"""
+    html = '<td>Bath &amp; Body&nbsp;Works</td>\n\n   <td>Qty:&#32;2</td>'
+    
+    assert html_to_text(html) == 'Bath & Body Works Qty: 2'
+
+
+def test_stops_at_character_budget():
+    """Dừng khi đã đủ số ký tự cho phép"""
+    html = '<p>' + 'a' * 100000 + '</p><p>tail</p>'
+    
+    text = html_to_text(html, max_chars=1000)
+    
+    assert len(text) == 1000
+    assert 'tail' not in text
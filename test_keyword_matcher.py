@@ -0,0 +1,32 @@
+"""
+Test KeywordMatcher (Aho-Corasick)
+"""
+import re
+from keyword_matcher import KeywordMatcher
+
+
+def _expected(categories, text):
+    return {
+        category: [(keyword, len(re.findall(re.escape(keyword.lower()), text)))
+                   for keyword in keywords if re.search(re.escape(keyword.lower()), text)]
+        for category, keywords in categories.items()
+    }
+
+
+def test_automaton_matches_findall_counts():
+    """Automaton đếm giống re.findall (không chồng nhau, theo từng từ khóa)"""
+    categories = {'complete': ['aa', 'Delivered', 'aaa'], 'error': ['a', 'not delivered', 'zzz']}
+    text = 'aaaaa delivered, not delivered'
+    
+    automaton = KeywordMatcher(categories, min_automaton_keywords=1)
+    counter = KeywordMatcher(categories, min_automaton_keywords=1000)
+    
+    assert automaton.scan(text) == _expected(categories, text)
+    assert counter.scan(text) == _expected(categories, text)
+
+
+def test_keyword_in_several_categories():
+    """Một từ khóa thuộc nhiều nhóm được báo ở mọi nhóm, giữ thứ tự danh sách"""
+    matcher = KeywordMatcher({'x': ['b', 'ab'], 'y': ['ab']}, min_automaton_keywords=1)
+    
+    assert matcher.scan('abab') == {'x': [('b', 2), ('ab', 2)], 'y': [('ab', 2)]}
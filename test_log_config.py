@@ -0,0 +1,34 @@
+"""
+Test cấu hình logging
+"""
+import json
+import logging
+from log_config import setup_logging, log_duration
+
+
+def test_json_sink_and_module_levels(tmp_path):
+    """Log debug của module được bật riêng được ghi ra file JSON kèm dữ liệu thêm"""
+    path = tmp_path / 'log.jsonl'
+    setup_logging('WARNING', str(path), {'test_module': 'DEBUG'})
+    try:
+        logging.getLogger('test_module').debug("Order %s", '123', extra={'order': '123'})
+        logging.getLogger('other_module').debug("Không được ghi")
+        with log_duration(logging.getLogger('test_module'), "Xong %d email", 5):
+            pass
+    finally:
+        setup_logging()
+    
+    entries = [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+    
+    assert [entry['logger'] for entry in entries] == ['test_module', 'test_module']
+    assert entries[0]['message'] == 'Order 123'
+    assert entries[0]['order'] == '123'
+    assert entries[1]['message'].startswith('Xong 5 email')
+    assert 'duration' in entries[1]
+
+
+def test_quiet_by_default():
+    """Mặc định log debug của ContentAnalyzer không được bật"""
+    setup_logging()
+    
+    assert not logging.getLogger('content_analyzer').isEnabledFor(logging.DEBUG)
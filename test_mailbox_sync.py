@@ -0,0 +1,65 @@
+"""
+Test đồng bộ đầy đủ hộp thư vào cache
+"""
+from mailbox_sync import MailboxSync, HISTORY_ID_KEY
+from message_cache import MessageCache
+
+
+class FakeService:
+    """Gmail service giả: mỗi request trả về luôn response"""
+    
+    def __init__(self, message_ids):
+        self.message_ids = message_ids
+    
+    def users(self):
+        return self
+    
+    def messages(self):
+        return self
+    
+    def getProfile(self, userId):
+        return {'historyId': '42'}
+    
+    def list(self, **params):
+        return {'messages': [{'id': message_id} for message_id in self.message_ids]}
+
+
+class FakeFetcher:
+    def __init__(self, cache, failing=()):
+        self.cache = cache
+        self.failing = set(failing)
+        self.rate_limiter = self
+    
+    def execute(self, request, method):
+        return request
+    
+    def get_emails_by_ids(self, message_ids):
+        emails = [{'id': message_id, 'subject': '', 'from': '', 'snippet': '', 'body': '', 'timestamp': '0'}
+                  for message_id in message_ids if message_id not in self.failing]
+        for email in emails:
+            self.cache.put(email)
+        return emails
+
+
+def test_history_id_not_saved_when_fetch_fails(tmp_path):
+    """Email tải lỗi (kể cả khi thử lại) thì không lưu historyId, lần sau đồng bộ đầy đủ lại"""
+    cache = MessageCache(str(tmp_path / 'cache.db'))
+    
+    stats = MailboxSync(FakeService(['a', 'b']), FakeFetcher(cache, failing=['b']), cache).full_sync()
+    
+    assert stats['added'] == 1 and stats['failed'] == 1
+    assert cache.get_state(HISTORY_ID_KEY) is None
+    
+    MailboxSync(FakeService(['a', 'b']), FakeFetcher(cache), cache).full_sync()
+    assert cache.get_state(HISTORY_ID_KEY) == '42'
+
+
+def test_resync_purges_messages_deleted_on_server(tmp_path):
+    """Đồng bộ lại sau khi historyId hết hạn xóa khỏi cache email không còn trên server"""
+    cache = MessageCache(str(tmp_path / 'cache.db'))
+    cache.put({'id': 'gone', 'subject': ''})
+    
+    stats = MailboxSync(FakeService(['a']), FakeFetcher(cache), cache).full_sync(purge=True)
+    
+    assert stats['removed'] == 1
+    assert sorted(cache.message_ids()) == ['a']
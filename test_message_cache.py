@@ -0,0 +1,53 @@
+"""
+Test cache email SQLite: evict theo LRU và tùy chọn --no-cache
+"""
+import itertools
+
+import gmail_tool
+import message_cache
+from message_cache import MessageCache
+
+
+def _email(message_id, body_size=250):
+    return {'id': message_id, 'subject': 'Hello', 'from': 'x@example.com', 'snippet': '', 'body': 'x' * body_size}
+
+
+def test_evicts_least_recently_accessed_down_to_90_percent(tmp_path, monkeypatch):
+    """Vượt dung lượng thì xóa email truy cập lâu nhất trước, đến khi còn không quá 90% giới hạn"""
+    clock = itertools.count(1)
+    monkeypatch.setattr(message_cache.time, 'time', lambda: next(clock))
+    cache = MessageCache(str(tmp_path / 'cache.db'), max_size_mb=0.004)  # ~4 KB
+    
+    for i in range(10):
+        cache.put(_email(f'm{i}'))
+    assert len(cache.message_ids()) == 10
+    size = cache.total_size() // 10
+    
+    cache.get_many(['m0', 'm1'])  # m0, m1 trở thành mới truy cập nhất
+    cache.put(_email('new', body_size=1000))
+    
+    kept = set(cache.message_ids())
+    target = int(cache.max_size_bytes * 0.9)
+    assert {'m0', 'm1', 'new'} <= kept
+    evicted = [f'm{i}' for i in range(2, 10) if f'm{i}' not in kept]
+    assert evicted and evicted == [f'm{i}' for i in range(2, 2 + len(evicted))]
+    assert cache.total_size() == cache._total_size() <= target
+    assert cache.total_size() + size > target  # Không xóa nhiều hơn cần thiết
+
+
+def test_no_cache_option_disables_cache(tmp_path, monkeypatch):
+    """--no-cache: không mở MessageCache, fetcher lấy thẳng từ Gmail"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(gmail_tool, 'FETCH_CONCURRENCY', 0)
+    opened = []
+    monkeypatch.setattr(gmail_tool, 'MessageCache', lambda *args, **kwargs: opened.append(args))
+    
+    args = gmail_tool.parse_args(['--no-cache'])
+    tool = gmail_tool.GmailTool(use_cache=not args.no_cache)
+    monkeypatch.setattr(tool.authenticator, 'authenticate', lambda: True)
+    monkeypatch.setattr(tool.authenticator, 'get_service', lambda: object())
+    
+    assert tool.initialize()
+    assert opened == []
+    assert tool.cache is None and tool.fetcher.cache is None
+    assert not tool.sync_mailbox()
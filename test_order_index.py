@@ -0,0 +1,51 @@
+"""
+Test chỉ mục order number -> email
+"""
+from message_cache import MessageCache
+from order_index import OrderIndex
+from order_resolver import OrderResolver
+
+def test_lookup_newest_first_and_persisted(tmp_path, parsed_email):
+    """Token order được lưu trong cache và tra được sau khi mở lại"""
+    cache = MessageCache(str(tmp_path / 'cache.db'))
+    index = OrderIndex(cache)
+    index.add_email(parsed_email('a', 'Kim, your package has arrived', 'Order Number 1234567890123 Qty: 2', 1000))
+    index.add_email(parsed_email('b', 'Hello', 'Ref 1234567890123', 2000))
+    
+    entries = OrderIndex(cache).lookup('1234567890123')
+    
+    assert [entry['id'] for entry in entries] == ['b', 'a']
+    assert entries[1]['status'] == 'PACKAGE_SUCCESS'
+    assert entries[1]['quantity'] == '2'
+
+
+def test_resolver_uses_index_without_api(tmp_path, parsed_email):
+    """Order có email quyết định trong chỉ mục không cần gọi Gmail API"""
+    cache = MessageCache(str(tmp_path / 'cache.db'))
+    index = OrderIndex(cache)
+    index.add_email(parsed_email('a', 'Kim, your package has arrived', 'Order Number 1234567890123 Qty: 3', 1000))
+    index.mark_built()
+    
+    resolver = OrderResolver(fetcher=None, index=index)
+    
+    assert resolver.resolve('1234567890123') == {'order': '1234567890123', 'status': 'PACKAGE_SUCCESS', 'quantity': '3'}
+
+
+def test_index_rebuilt_when_rules_change(tmp_path, parsed_email):
+    """Chỉ mục lập với bộ quy tắc cũ không được dùng và được lập lại khi quy tắc đổi"""
+    cache = MessageCache(str(tmp_path / 'cache.db'))
+    email = parsed_email('a', 'Kim, your package has arrived', 'Order Number 1234567890123 Qty: 3', 1000)
+    cache.put(email)
+    index = OrderIndex(cache)
+    index.build()
+    assert OrderIndex(cache).is_built()
+    
+    index.analyzer.update_keywords(complete_keywords=['shipped'])
+    resolver = OrderResolver(fetcher=None, index=index)
+    
+    assert not index.is_built()
+    assert resolver._resolve_from_index('1234567890123') is None
+    
+    index.build()
+    assert index.is_built()
+    assert resolver._resolve_from_index('1234567890123')['status'] == 'PACKAGE_SUCCESS'
@@ -0,0 +1,43 @@
+"""
+Test journal kết quả tìm kiếm order
+"""
+from order_journal import OrderJournal
+
+
+def test_records_and_loads_results(tmp_path):
+    """Kết quả đã ghi được đọc lại theo order number"""
+    journal = OrderJournal(str(tmp_path / 'journal.jsonl'))
+    journal.record({'order': '111', 'status': 'PACKAGE_SUCCESS', 'quantity': '2'})
+    journal.record({'order': '222', 'status': 'NOT_FOUND', 'quantity': ''})
+    
+    results = OrderJournal(journal.path).load()
+    
+    assert list(results) == ['111', '222']
+    assert results['111']['quantity'] == '2'
+
+
+def test_ignores_partial_last_line(tmp_path):
+    """Dòng ghi dở khi tiến trình bị dừng được bỏ qua, lần ghi sau vẫn hợp lệ"""
+    path = tmp_path / 'journal.jsonl'
+    path.write_text('{"order": "111", "status": "PACKAGE_FAILED", "quantity": ""}\n{"order": "22', encoding='utf-8')
+    
+    journal = OrderJournal(str(path))
+    assert list(journal.load()) == ['111']
+    
+    journal.record({'order': '333', 'status': 'UNKNOWN', 'quantity': ''})
+    assert list(journal.load()) == ['111', '333']
+
+
+def test_failed_search_stays_pending_on_resume(tmp_path):
+    """Order bị lỗi khi tìm (quota, mạng, ...) không được ghi, nên được tìm lại khi --resume"""
+    from order_resolver import OrderResolver, ORDER_ERROR
+    
+    class FailingFetcher:
+        def iter_emails(self, *args, **kwargs):
+            raise RuntimeError('quota exceeded')
+    
+    journal = OrderJournal(str(tmp_path / 'journal.jsonl'))
+    results = OrderResolver(FailingFetcher()).resolve_batch(['1234567890'], on_result=journal.record)
+    
+    assert results[0]['status'] == ORDER_ERROR
+    assert '1234567890' not in OrderJournal(journal.path).load()
@@ -0,0 +1,102 @@
+"""
+Test tìm trạng thái nhiều order bằng query gộp
+"""
+import time
+
+from email_fetcher import EmailFetcher
+from order_resolver import OrderResolver
+from rate_limiter import RateLimiter
+
+class FakeFetcher:
+    def __init__(self, results):
+        self.results = results
+        self.calls = []
+    
+    def iter_emails(self, query='', limit=None, body_filter=None, chunk_size=None, strict=False):
+        self.calls.append((query, limit))
+        yield from [dict(email) for email in self.results.get(query, [])][:limit]
+
+
+def test_batch_routes_body_only_order_numbers(parsed_email):
+    """Order number chỉ nằm trong body vẫn được gán đúng order, không cần query riêng"""
+    fetcher = FakeFetcher({'{1111111111 2222222222}': [
+        parsed_email('a', 'Kim, your package has arrived', 'Order Number 1111111111 Qty: 2', 2000),
+        parsed_email('b', 'Hello', 'Ref 2222222222', 1000),
+    ]})
+    
+    results = OrderResolver(fetcher, max_emails=2).resolve_batch(['1111111111', '2222222222'])
+    
+    assert [(r['status'], r['quantity']) for r in results] == [('PACKAGE_SUCCESS', '2'), ('UNKNOWN', '')]
+    assert fetcher.calls == [('{1111111111 2222222222}', 4)]
+
+
+def test_batch_falls_back_when_union_query_hits_limit(parsed_email):
+    """Chạm giới hạn query gộp thì order chưa đủ email được tìm lại bằng query riêng"""
+    fetcher = FakeFetcher({
+        '{1111111111 2222222222}': [parsed_email(str(i), 'Hello', 'Ref 1111111111', 5000 - i) for i in range(4)],
+        '2222222222': [parsed_email('x', 'Kim, your package has arrived', 'Order Number 2222222222 Qty: 3', 100)],
+    })
+    
+    results = OrderResolver(fetcher, max_emails=2).resolve_batch(['1111111111', '2222222222'])
+    
+    assert [r['status'] for r in results] == ['UNKNOWN', 'PACKAGE_SUCCESS']
+    assert fetcher.calls == [('{1111111111 2222222222}', 4), ('2222222222', 2)]
+
+
+def test_failed_message_get_gives_error(gmail_service, gmail_message):
+    """messages.get lỗi thì order là ERROR (không phải NOT_FOUND/UNKNOWN), cả khi tìm gộp lẫn từng order"""
+    service = gmail_service([
+        gmail_message('new', 'Kim, your package has arrived', 'Order Number 1234567890 Qty: 1', 2000),
+        gmail_message('old', 'Hello', 'Ref 1234567890', 1000),
+    ])
+    service.failing['new'] = RuntimeError('connection reset')
+    for use_batch in (False, True):
+        fetcher = EmailFetcher(service, use_batch=use_batch, rate_limiter=RateLimiter(1e6))
+        resolver = OrderResolver(fetcher)
+        
+        assert resolver.resolve('1234567890')['status'] == 'ERROR'
+        assert resolver.resolve_batch(['1234567890'])[0]['status'] == 'ERROR'
+
+
+def test_resolve_many_keeps_input_order_with_workers(parsed_email):
+    """Chạy song song (order xong không theo thứ tự) nhưng kết quả vẫn theo thứ tự đầu vào"""
+    order_numbers = [f'{i}000000000' for i in range(1, 7)]
+    results = {order_number: [parsed_email(order_number, 'Kim, your package has arrived',
+                                           f'Order Number {order_number} Qty: {i}', 1000)]
+               for i, order_number in enumerate(order_numbers, 1)}
+    
+    class SlowFetcher(FakeFetcher):
+        def iter_emails(self, query='', **kwargs):
+            time.sleep(0.002 * (6 - int(query[0])))  # Order đầu chậm nhất
+            yield from super().iter_emails(query, **kwargs)
+    
+    seen = []
+    resolver = OrderResolver(FakeFetcher({}), fetcher_factory=lambda: SlowFetcher(results), workers=3)
+    resolved = resolver.resolve_many(order_numbers, show_progress=False, on_result=seen.append)
+    
+    assert [(r['order'], r['quantity']) for r in resolved] == [(o, str(i)) for i, o in enumerate(order_numbers, 1)]
+    assert sorted(r['order'] for r in seen) == order_numbers
+
+
+def test_resolve_stops_after_first_deciding_email(gmail_service, gmail_message):
+    """Email mới nhất đã quyết định trạng thái: không tải email nào khác và đóng luồng email ngay"""
+    service = gmail_service([
+        gmail_message('new', 'Kim, your package has arrived', 'Order Number 1234567890 Qty: 2', 3000),
+        gmail_message('mid', 'Hello', 'Ref 1234567890', 2000),
+        gmail_message('old', 'Hello', 'Ref 1234567890', 1000),
+    ])
+    fetcher = EmailFetcher(service, use_batch=True, rate_limiter=RateLimiter(1e6))
+    streams = []
+    iter_emails = fetcher.iter_emails
+    
+    def tracked_iter_emails(*args, **kwargs):
+        stream = iter_emails(*args, **kwargs)
+        streams.append(stream)
+        return stream
+    
+    fetcher.iter_emails = tracked_iter_emails
+    result = OrderResolver(fetcher).resolve('1234567890')
+    
+    assert (result['status'], result['quantity']) == ('PACKAGE_SUCCESS', '2')
+    assert service.get_ids() == ['new']
+    assert len(streams) == 1 and streams[0].gi_frame is None  # Generator đã được close()
@@ -0,0 +1,73 @@
+"""
+Test chuyển quy tắc merchant thành Gmail query
+"""
+from email_fetcher import EmailFetcher
+from query_planner import plan_package_queries
+from rule_engine import RuleEngine, MerchantRule, default_rules
+
+
+def test_package_rules_pushed_into_date_query():
+    """Từ khóa tiêu đề được ghép OR vào query ngày (giữ nguyên &amp; như khi so khớp cục bộ)"""
+    queries = plan_package_queries('after:2025-01-01 before:2025-02-01', default_rules())
+    
+    assert queries == [
+        'after:2025-01-01 before:2025-02-01 '
+        '{subject:"your Bath &amp; Body Works could not be delivered" subject:"your package has arrived"}'
+    ]
+
+
+def test_long_rule_sets_split_into_several_queries():
+    """Quá nhiều từ khóa thì chia thành nhiều query, không trùng từ khóa"""
+    rules = [MerchantRule(f'm{i}', success_subjects=[f'merchant {i} shipped', 'Has Shipped'], subject_whole_words=True)
+             for i in range(30)]
+    
+    queries = plan_package_queries('after:2025-01-01', rules, max_length=200)
+    
+    assert len(queries) > 1
+    assert all(len(query) <= 200 and query.startswith('after:2025-01-01 {') for query in queries)
+    assert sum(query.count('subject:') for query in queries) == 31
+    assert plan_package_queries('after:2025-01-01', [MerchantRule('empty')]) is None
+
+
+def test_partial_word_keywords_disable_pushdown():
+    """Quy tắc so khớp chuỗi con (có thể khớp một phần từ) thì không đẩy lên, lấy mọi email"""
+    for keyword in ('your package has arrive', 'our package has arrived'):
+        assert plan_package_queries('after:2025-01-01', [MerchantRule('shop', success_subjects=[keyword])]) is None
+    
+    whole = [MerchantRule('shop', success_subjects=['order shipped!'], subject_whole_words=True)]
+    assert plan_package_queries('after:2025-01-01', whole) is None
+    whole = [MerchantRule('shop', success_subjects=['order shipped'], subject_whole_words=True)]
+    assert plan_package_queries('after:2025-01-01', whole) == ['after:2025-01-01 {subject:"order shipped"}']
+
+
+def test_whole_word_rules_match_locally_like_gmail():
+    """Quy tắc subject_whole_words không khớp một phần từ, nên kết quả cục bộ là tập con của subject:"..." """
+    subject = 'kim, your package has arrived'
+    for keyword, expected in (('your package has arrive', False), ('our package has arrived', False),
+                              ('your package has arrived', True)):
+        engine = RuleEngine(rules=[MerchantRule('shop', success_subjects=[keyword], subject_whole_words=True)])
+        assert (engine.classify(subject, 'x@shop.com', subject)[0] == 'PACKAGE_SUCCESS') is expected
+        substring = RuleEngine(rules=[MerchantRule('shop', success_subjects=[keyword])])
+        assert substring.classify(subject, 'x@shop.com', subject)[0] == 'PACKAGE_SUCCESS'
+
+
+def test_iter_emails_any_deduplicates_and_limits():
+    """Email khớp nhiều query chỉ được trả về một lần, tổng không quá limit"""
+    fetcher = EmailFetcher(service=None)
+    results = {'q1': ['a', 'b'], 'q2': ['b', 'c', 'd']}
+    fetcher.iter_emails = lambda query, limit, body_filter: iter({'id': i} for i in results[query][:limit])
+    
+    assert [email['id'] for email in fetcher.iter_emails_any(['q1', 'q2'])] == ['a', 'b', 'c', 'd']
+    assert [email['id'] for email in fetcher.iter_emails_any(['q1', 'q2'], limit=3)] == ['a', 'b', 'c']
+
+
+def test_iter_emails_any_newest_first_across_queries():
+    """Kết quả các query được trộn theo thời gian, limit lấy các email mới nhất của cả hợp"""
+    fetcher = EmailFetcher(service=None)
+    results = {'q1': [('a', 300), ('b', 100)], 'q2': [('a', 300), ('c', 200)]}
+    fetcher.iter_emails = lambda query, limit, body_filter: iter(
+        {'id': i, 'timestamp': str(t)} for i, t in results[query][:limit]
+    )
+    
+    assert [email['id'] for email in fetcher.iter_emails_any(['q1', 'q2'], limit=2)] == ['a', 'c']
+    assert [email['id'] for email in fetcher.iter_emails_any(['q1', 'q2'])] == ['a', 'c', 'b']
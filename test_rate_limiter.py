@@ -0,0 +1,132 @@
+"""
+Test token bucket, retry và backoff của rate limiter (đồng hồ giả, không chờ thật)
+"""
+import json
+
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+import rate_limiter
+from rate_limiter import RateLimiter
+
+
+class FakeClock:
+    """Thay time.monotonic/time.sleep/time.time: sleep chỉ tăng đồng hồ và ghi lại thời gian chờ"""
+    
+    def __init__(self, now=1000.0):
+        self.now = now
+        self.sleeps = []
+    
+    def monotonic(self):
+        return self.now
+    
+    def time(self):
+        return self.now
+    
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class FlakyRequest:
+    """Request raise lần lượt các lỗi cho trước rồi trả về 'ok'"""
+    
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.calls = 0
+    
+    def execute(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return 'ok'
+
+
+def _http_error(status, retry_after=None, reason=None):
+    headers = {'status': str(status)}
+    if retry_after is not None:
+        headers['retry-after'] = retry_after
+    content = b''
+    if reason is not None:
+        content = json.dumps({'error': {'code': status, 'errors': [{'reason': reason}]}}).encode('utf-8')
+    return HttpError(httplib2.Response(headers), content)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(rate_limiter, 'time', fake)
+    return fake
+
+
+def test_token_bucket_waits_for_refill(clock):
+    """Hết token thì chờ đúng thời gian nạp đủ units, còn token thì không chờ"""
+    limiter = RateLimiter(units_per_second=10)
+    
+    limiter.acquire(10)
+    assert clock.sleeps == []
+    
+    limiter.acquire(5)
+    assert clock.sleeps == [pytest.approx(0.5)]
+    
+    clock.now += 1.0
+    limiter.acquire(10)
+    assert clock.sleeps == [pytest.approx(0.5)]
+    assert limiter.stats() == {'requests': 3, 'retries': 0, 'throttled_seconds': 0.5}
+
+
+def test_retry_after_seconds_and_http_date(clock):
+    """Header Retry-After (số giây hoặc HTTP date) được dùng thay cho backoff"""
+    limiter = RateLimiter(units_per_second=1e6)
+    request = FlakyRequest([
+        _http_error(429, retry_after='3'),
+        _http_error(503, retry_after='Thu, 01 Jan 1970 00:16:50 GMT'),  # 1003 + 7 giây
+    ])
+    
+    assert limiter.execute(request, 'messages.get') == 'ok'
+    assert request.calls == 3
+    assert clock.sleeps == [pytest.approx(3.0), pytest.approx(7.0)]
+    assert limiter.stats()['retries'] == 2
+
+
+def test_backoff_is_exponential_with_bounded_jitter(clock, monkeypatch):
+    """Không có Retry-After: chờ trong [delay/2, delay], delay tăng gấp đôi và bị chặn bởi max_delay"""
+    limiter = RateLimiter(units_per_second=1e6, max_retries=4, base_delay=1.0, max_delay=5.0)
+    
+    monkeypatch.setattr(rate_limiter.random, 'uniform', lambda low, high: high)
+    for attempt in range(4):
+        limiter.backoff(_http_error(500), attempt)
+    assert clock.sleeps == [1.0, 2.0, 4.0, 5.0]
+    
+    clock.sleeps.clear()
+    monkeypatch.setattr(rate_limiter.random, 'uniform', lambda low, high: low)
+    for attempt in range(4):
+        limiter.backoff(_http_error(500), attempt)
+    assert clock.sleeps == [0.5, 1.0, 2.0, 2.5]
+
+
+def test_is_retryable():
+    """Retry 429/5xx và 403 do rate limit; không retry lỗi khác"""
+    assert RateLimiter.is_retryable(_http_error(429))
+    assert RateLimiter.is_retryable(_http_error(502))
+    assert RateLimiter.is_retryable(_http_error(403, reason='userRateLimitExceeded'))
+    assert not RateLimiter.is_retryable(_http_error(403, reason='insufficientPermissions'))
+    assert not RateLimiter.is_retryable(_http_error(403))
+    assert not RateLimiter.is_retryable(_http_error(404))
+    assert not RateLimiter.is_retryable(ValueError('boom'))
+
+
+def test_execute_gives_up_after_max_retries(clock):
+    """Lỗi tạm thời kéo dài quá max_retries và lỗi không retry được đều được raise"""
+    limiter = RateLimiter(units_per_second=1e6, max_retries=2)
+    request = FlakyRequest([_http_error(503)] * 3)
+    with pytest.raises(HttpError):
+        limiter.execute(request, 'messages.get')
+    assert request.calls == 3
+    assert len(clock.sleeps) == 2
+    
+    request = FlakyRequest([_http_error(404)])
+    with pytest.raises(HttpError):
+        limiter.execute(request, 'messages.get')
+    assert request.calls == 1
@@ -0,0 +1,93 @@
+"""
+Test quy tắc merchant đọc từ file quy tắc
+"""
+import json
+import os
+
+from content_analyzer import ContentAnalyzer
+from rule_engine import RuleEngine, MerchantRule, default_rules
+
+RULES = {
+    'merchants': [
+        {'name': 'Shop A', 'senders': ['ship@shop-a.com'], 'success_subjects': ['has shipped'],
+         'failed_subjects': ['delivery failed'], 'order_patterns': [r'A-([0-9]+)']},
+        {'name': 'Shop B', 'senders': ['news@shop-b.com'], 'success_subjects': ['has shipped'],
+         'body_keywords': ['shop b order'], 'quantity_patterns': {'PACKAGE_SUCCESS': [r'([0-9]+)\s*items?']}},
+    ]
+}
+
+
+def _write(path, rules, mtime):
+    path.write_text(json.dumps(rules), encoding='utf-8')
+    os.utime(path, ns=(mtime, mtime))
+
+
+def test_rules_file_selects_merchant_and_patterns(tmp_path):
+    """Mỗi email được gán quy tắc của merchant khớp, kèm pattern riêng của merchant đó"""
+    path = tmp_path / 'rules.json'
+    _write(path, RULES, 10**9)
+    analyzer = ContentAnalyzer(rule_engine=RuleEngine(str(path)))
+    
+    shop_a = analyzer.analyze_email({'id': '1', 'subject': 'Your order has shipped', 'from': 'ship@shop-a.com',
+                                     'snippet': '', 'body': 'Ref A-42 qty: 1'})
+    shop_b = analyzer.analyze_email({'id': '2', 'subject': 'Your order has shipped', 'from': 'news@shop-b.com',
+                                     'snippet': '', 'body': 'Shop B order: 3 items'})
+    no_body_match = analyzer.analyze_email({'id': '3', 'subject': 'Your order has shipped', 'from': 'news@shop-b.com',
+                                            'snippet': '', 'body': 'hello'})
+    
+    assert (shop_a['status'], shop_a['order_number'], shop_a['quantity']) == ('PACKAGE_SUCCESS', '42', '1')
+    assert (shop_b['status'], shop_b['quantity']) == ('PACKAGE_SUCCESS', '3')
+    assert no_body_match['status'] == 'UNKNOWN'
+
+
+def test_rules_file_hot_reload_keeps_rules_on_error(tmp_path):
+    """File quy tắc được nạp lại khi thay đổi; file lỗi thì giữ quy tắc đang dùng"""
+    path = tmp_path / 'rules.json'
+    _write(path, RULES, 10**9)
+    engine = RuleEngine(str(path), reload_interval=0)
+    fingerprint = engine.fingerprint
+    
+    _write(path, {'merchants': [{'name': 'Shop C', 'failed_subjects': ['lost parcel']}]}, 2 * 10**9)
+    assert engine.classify('lost parcel', '', '')[0] == 'PACKAGE_FAILED'
+    assert engine.fingerprint != fingerprint
+    
+    path.write_text('{not json', encoding='utf-8')
+    os.utime(path, ns=(3 * 10**9, 3 * 10**9))
+    assert [rule.name for rule in engine.rules] == ['Shop C']
+
+
+def test_missing_rules_file_uses_config_rules(tmp_path):
+    """Không có file quy tắc: dùng từ khóa và sender trong config.py"""
+    engine = RuleEngine(str(tmp_path / 'missing.json'))
+    
+    assert [rule.name for rule in engine.rules] == ['default']
+    assert engine.subject_matches('kim, your package has arrived')
+    assert RuleEngine(rules=[MerchantRule('x', failed_subjects=['oops'])]).classify('oops', '', '')[0] == 'PACKAGE_FAILED'
+
+
+def test_rules_dispatched_by_sender_domain():
+    """Chỉ quy tắc của domain người gửi (kể cả domain con, người gửi gốc khi forward) và fallback được xét"""
+    engine = RuleEngine(rules=[
+        MerchantRule('A', senders=['ship@shop-a.com'], success_subjects=['has shipped'],
+                     failed_subjects=['not delivered'], failed_requires_sender=True),
+        MerchantRule('B', senders=['shop-b.com'], success_subjects=['has shipped']),
+        MerchantRule('Any', failed_subjects=['lost parcel']),
+    ])
+    forwarded = 'fwd: has shipped ---------- forwarded message --------- from: shop a <ship@shop-a.com>'
+    
+    assert engine.classify('has shipped', 'news@mail.shop-b.com', '')[1].name == 'B'
+    assert engine.classify('fwd: has shipped', 'me@gmail.com', forwarded)[1].name == 'A'
+    assert engine.classify('not delivered', 'x@other.com', '') == (None, None)
+    assert engine.classify('not delivered', 'ship@shop-a.com', '')[0] == 'PACKAGE_FAILED'
+    assert engine.classify('lost parcel', 'x@other.com', '')[1].name == 'Any'
+    assert [group for group in engine.compiled().groups_for({'gmail.com'})] == [engine.compiled().fallback_group]
+
+
+def test_no_rules_file_uses_default_rules():
+    """path=None: không đọc file, dùng quy tắc mặc định từ config.py"""
+    engine = RuleEngine(path=None)
+    
+    assert [rule.to_dict() for rule in engine.rules] == [rule.to_dict() for rule in default_rules()]
+    assert ContentAnalyzer(rule_engine=engine).analyze_email({
+        'id': '1', 'subject': 'Kim, your package has arrived', 'from': 'bathandbodyworks@bathandbodyworks.narvar.com',
+        'snippet': '', 'body': 'Order Number 1234567890 Qty: 2'})['status'] == 'PACKAGE_SUCCESS'